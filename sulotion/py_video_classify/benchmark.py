@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the classification pipeline against simulated AWS services.
+
+Each configuration runs one of three workloads with simulated bedrock-runtime,
+transcribe and s3 clients, so concurrency, caching and batching settings can be
+compared without AWS credentials or quota:
+
+- process: process_videos over a generated manifest, with any of the process
+  command's arguments (one-step or two-step, pipelining, prompt cache, dedup...)
+- calibrate: calibrate_classification of noisy classifications against the
+  taxonomy index, with or without prefetching the label embeddings
+- transcribe: Transcribe jobs tracked by a TranscriptionScheduler
+
+The report gives throughput, latency percentiles and token usage per configuration.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Dict, Any, List, Optional
+import numpy as np
+import pandas as pd
+
+# Add the parent directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from src.main import build_parser, configure_cache, configure_governors, process_videos
+from src.common import calibrate_classification, prefetch_label_embeddings
+from src.taxonomy_index import TaxonomyIndex
+from src.transcribe_scheduler import TranscriptionScheduler
+from src.simulated_aws import SimulatedAWS
+from src.rate_governor import configure_governor, get_governor_stats
+from src.aws_clients import get_client
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('benchmark')
+
+PROJECT_DIR = os.path.abspath(os.path.dirname(__file__))
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
+BUCKET = "benchmark-videos"
+
+# Built-in suite used when no configuration file is given. Latencies are kept
+# short so the whole suite runs in a few minutes.
+DEFAULT_CONFIGURATIONS = [
+    {'name': 'one_step-c1', 'kind': 'process', 'videos': 20, 'args': ['--method', 'one_step', '--concurrency', '1']},
+    {'name': 'one_step-c8', 'kind': 'process', 'videos': 40, 'args': ['--method', 'one_step', '--concurrency', '8']},
+    {
+        'name': 'one_step-c8-structured-prompt-cache',
+        'kind': 'process',
+        'videos': 40,
+        'args': ['--method', 'one_step', '--concurrency', '8', '--structured-output', '--prompt-cache']
+    },
+    {
+        'name': 'one_step-c8-throttled',
+        'kind': 'process',
+        'videos': 40,
+        'args': ['--method', 'one_step', '--concurrency', '8'],
+        'bedrock': {'throttle_rate': 0.05, 'max_concurrency': 6}
+    },
+    {
+        'name': 'one_step-c8-dedup',
+        'kind': 'process',
+        'videos': 40,
+        'args': ['--method', 'one_step', '--concurrency', '8', '--dedup'],
+        's3': {'duplicate_rate': 0.3}
+    },
+    {'name': 'two_step-c8', 'kind': 'process', 'videos': 40, 'args': ['--method', 'two_step', '--concurrency', '8']},
+    {
+        'name': 'two_step-pipelined-text-only',
+        'kind': 'process',
+        'videos': 40,
+        'args': [
+            '--method', 'two_step', '--concurrency', '8', '--pipelined', '--second-concurrency', '4',
+            '--text-only-second-step', '--prompt-cache'
+        ]
+    },
+    {'name': 'calibrate-prefetch', 'kind': 'calibrate', 'videos': 100, 'concurrency': 8, 'bedrock': {'label_noise': 0.5}},
+    {
+        'name': 'calibrate-no-prefetch',
+        'kind': 'calibrate',
+        'videos': 100,
+        'concurrency': 8,
+        'prefetch': False,
+        'bedrock': {'label_noise': 0.5}
+    },
+    {
+        'name': 'transcribe-40',
+        'kind': 'transcribe',
+        'jobs': 40,
+        'min_interval': 0.5,
+        'max_interval': 5.0,
+        'transcribe': {'job_latency': {'median': 3.0, 'sigma': 0.3}}
+    }
+]
+
+def governor_totals() -> Dict[str, float]:
+    """
+    Sum the counters of every rate governor.
+    
+    Returns:
+        Total throttles and wait time in seconds
+    """
+    stats = get_governor_stats().values()
+    return {
+        'throttles': sum(governor['throttles'] for governor in stats),
+        'wait_time_s': sum(governor['wait_time_s'] for governor in stats)
+    }
+
+def summarize(
+    config: Dict[str, Any],
+    items: int,
+    latencies: List[float],
+    wall_time: float,
+    simulation: SimulatedAWS,
+    governors_before: Dict[str, float],
+    **extra
+) -> Dict[str, Any]:
+    """
+    Build the report of one configuration.
+    
+    Args:
+        config: Benchmark configuration
+        items: Number of videos or jobs submitted
+        latencies: Latency in seconds of each completed item
+        wall_time: Wall-clock time of the run in seconds
+        simulation: Simulated services used by the run
+        governors_before: Governor totals before the run
+        **extra: Additional summary values
+    
+    Returns:
+        Dictionary with the summary row and the per-operation service statistics
+    """
+    services = simulation.summary()
+    converse = services.get('bedrock-runtime.Converse', {})
+    embedding = services.get('bedrock-runtime.InvokeModel', {})
+    governors = governor_totals()
+    
+    latencies = np.asarray(latencies, dtype=float)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies.size else (0.0, 0.0, 0.0)
+    
+    input_tokens = converse.get('input_tokens', 0)
+    output_tokens = converse.get('output_tokens', 0)
+    cache_read_tokens = simulation.bedrock.cache_read_tokens
+    cache_write_tokens = simulation.bedrock.cache_write_tokens
+    prompt_tokens = input_tokens + cache_read_tokens + cache_write_tokens
+    completed = int(latencies.size)
+    
+    summary = {
+        'name': config['name'],
+        'kind': config.get('kind', 'process'),
+        'items': items,
+        'completed': completed,
+        'failed': items - completed,
+        'wall_time_s': round(wall_time, 3),
+        'items_per_second': round(completed / wall_time, 3) if wall_time > 0 else 0.0,
+        'latency_mean_s': round(float(latencies.mean()), 3) if latencies.size else 0.0,
+        'latency_p50_s': round(float(p50), 3),
+        'latency_p95_s': round(float(p95), 3),
+        'latency_p99_s': round(float(p99), 3),
+        'requests': sum(stats['requests'] + stats['failures'] for stats in services.values()),
+        'throttled': sum(stats['failures'] for stats in services.values()),
+        'governor_retries': governors['throttles'] - governors_before['throttles'],
+        'governor_wait_s': round(governors['wait_time_s'] - governors_before['wait_time_s'], 3),
+        'converse_requests': converse.get('requests', 0),
+        'embedding_requests': embedding.get('requests', 0),
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'cache_read_tokens': cache_read_tokens,
+        'cache_write_tokens': cache_write_tokens,
+        'embedding_tokens': embedding.get('input_tokens', 0),
+        'tokens_per_item': round((prompt_tokens + output_tokens) / completed, 1) if completed else 0.0,
+        'output_tokens_per_item': round(output_tokens / completed, 1) if completed else 0.0,
+        'cached_input_share': round(cache_read_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+        **extra
+    }
+    return {'summary': summary, 'services': services, 'config': config}
+
+def build_taxonomy_index(categories_path: str) -> None:
+    """
+    Build the taxonomy index in the working directory before the runs.
+    
+    Every classifier loads the index from the same cache directory, so no
+    configuration pays for embedding the whole taxonomy.
+    
+    Args:
+        categories_path: Path to the categories JSON file
+    """
+    with SimulatedAWS.from_config({}, categories_path):
+        index = TaxonomyIndex(categories_path)
+        index.find_most_similar(next(iter(index.categories_json)))
+
+def run_process(config: Dict[str, Any], categories_path: str, seed: int) -> Dict[str, Any]:
+    """
+    Run process_videos over a generated manifest.
+    
+    Args:
+        config: Configuration with 'videos' (manifest size) and 'args' (process
+            command arguments), plus the simulated service sections
+        categories_path: Path to the categories JSON file
+        seed: Seed of the simulated services
+    
+    Returns:
+        Report of the run; the latency of a video is the model latency of its requests
+    """
+    directory = os.path.abspath(config['name'])
+    os.makedirs(directory, exist_ok=True)
+    videos = config.get('videos', 40)
+    manifest = os.path.join(directory, 'manifest.csv')
+    pd.DataFrame({'S3 URI': [f"s3://{BUCKET}/videos/{i:05d}.mp4" for i in range(videos)]}).to_csv(manifest, index=False)
+    output_csv = os.path.join(directory, 'results.csv')
+    
+    # The configured arguments come last so they override these defaults
+    argv = [
+        'process',
+        '--input-csv', manifest,
+        '--output-csv', output_csv,
+        '--categories-path', categories_path,
+        '--prompt', os.path.join(PROJECT_DIR, 'prompt', 'one_step_prompt.md'),
+        '--first-prompt', os.path.join(PROJECT_DIR, 'prompt', 'two_step1_prompt.md'),
+        '--second-prompt', os.path.join(PROJECT_DIR, 'prompt', 'two_stop2_prompt.md'),
+        '--llm-cache-path', os.path.join(directory, 'llm_responses.sqlite3'),
+        '--dedup-index-path', os.path.join(directory, 'video_dedup.sqlite3')
+    ]
+    if not config.get('llm_cache'):
+        argv.append('--no-llm-cache')
+    args = build_parser().parse_args(argv + [str(arg) for arg in config.get('args', [])])
+    
+    configure_cache(args)
+    configure_governors(args)
+    configure_governor(EMBEDDING_MODEL_ID)
+    governors_before = governor_totals()
+    
+    simulation = SimulatedAWS.from_config(config, categories_path, seed)
+    with simulation:
+        start = time.monotonic()
+        try:
+            process_videos(args)
+        except SystemExit:
+            logger.error(f"process_videos failed for {config['name']}")
+        wall_time = time.monotonic() - start
+    
+    latencies = []
+    if os.path.exists(output_csv):
+        results = pd.read_csv(output_csv, quotechar='"', escapechar='\\')
+        latencies = (pd.to_numeric(results['Latency (ms)'], errors='coerce').fillna(0) / 1000).tolist()
+    return summarize(config, videos, latencies, wall_time, simulation, governors_before)
+
+def run_calibration(config: Dict[str, Any], categories_path: str, seed: int) -> Dict[str, Any]:
+    """
+    Calibrate simulated classifications concurrently.
+    
+    Args:
+        config: Configuration with 'videos', 'concurrency', 'prefetch' (embed the
+            unknown labels of a video at once first), 'use_taxonomy_index',
+            'embedding_concurrency' and optional 'rpm'/'tpm' quotas of the
+            embedding model, plus the simulated service sections
+        categories_path: Path to the categories JSON file
+        seed: Seed of the simulated services
+    
+    Returns:
+        Report of the run; the latency of a video is the time to calibrate all its categories
+    """
+    videos = config.get('videos', 100)
+    prefetch = config.get('prefetch', True)
+    configure_governor(EMBEDDING_MODEL_ID, requests_per_minute=config.get('rpm'), tokens_per_minute=config.get('tpm'))
+    governors_before = governor_totals()
+    
+    simulation = SimulatedAWS.from_config(config, categories_path, seed)
+    with simulation:
+        taxonomy_index = None
+        if config.get('use_taxonomy_index', True):
+            taxonomy_index = TaxonomyIndex(categories_path, embedding_concurrency=config.get('embedding_concurrency', 8))
+        categories_json = simulation.bedrock.categories_json
+        classifications = [
+            simulation.bedrock.classification(f"s3://{BUCKET}/videos/{i:05d}.mp4") for i in range(videos)
+        ]
+        
+        def calibrate(classification: Dict[str, Any]) -> Optional[float]:
+            start = time.monotonic()
+            try:
+                if prefetch:
+                    prefetch_label_embeddings(classification['catetorys'], categories_json, taxonomy_index)
+                for category in classification['catetorys']:
+                    calibrate_classification(
+                        category['catetory1'],
+                        category['catetory2'],
+                        category['catetory3'],
+                        categories_json,
+                        taxonomy_index=taxonomy_index
+                    )
+            except Exception as e:
+                logger.error(f"Error calibrating classification: {e}")
+                return None
+            return time.monotonic() - start
+        
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, config.get('concurrency', 8))) as executor:
+            latencies = list(executor.map(calibrate, classifications))
+        wall_time = time.monotonic() - start
+    
+    latencies = [latency for latency in latencies if latency is not None]
+    return summarize(config, videos, latencies, wall_time, simulation, governors_before)
+
+def run_transcription(config: Dict[str, Any], categories_path: str, seed: int) -> Dict[str, Any]:
+    """
+    Submit Transcribe jobs through a TranscriptionScheduler and wait for them.
+    
+    Args:
+        config: Configuration with 'jobs', the scheduler's 'min_interval' and
+            'max_interval', and an optional 'rpm' quota, plus the simulated
+            service sections
+        categories_path: Path to the categories JSON file
+        seed: Seed of the simulated services
+    
+    Returns:
+        Report of the run; the latency of a job is the time from submission
+        until its transcript is read
+    """
+    jobs = config.get('jobs', 40)
+    configure_governor('transcribe', requests_per_minute=config.get('rpm'))
+    governors_before = governor_totals()
+    latencies = []
+    
+    simulation = SimulatedAWS.from_config(config, categories_path, seed)
+    with simulation:
+        scheduler = TranscriptionScheduler(
+            min_interval=config.get('min_interval', 2.0),
+            max_interval=config.get('max_interval', 30.0)
+        )
+        s3_client = get_client('s3')
+        
+        def read_transcript(job: Dict[str, Any]) -> str:
+            transcript_key = job['Transcript']['TranscriptFileUri'].split(f"{BUCKET}/")[1]
+            transcript = json.loads(s3_client.get_object(Bucket=BUCKET, Key=transcript_key)['Body'].read())
+            s3_client.delete_object(Bucket=BUCKET, Key=transcript_key)
+            return transcript['results']['transcripts'][0]['transcript']
+        
+        def record(future: Future, submitted: float) -> None:
+            if future.exception() is None:
+                latencies.append(time.monotonic() - submitted)
+        
+        start = time.monotonic()
+        futures = []
+        for i in range(jobs):
+            audio_key = f"temp-audio/{i:05d}.wav"
+            s3_client.put_object(Bucket=BUCKET, Key=audio_key, Body=b'RIFF')
+            submitted = time.monotonic()
+            future = scheduler.submit(
+                job_id=f"{i:05d}",
+                media_uri=f"s3://{BUCKET}/{audio_key}",
+                output_bucket=BUCKET,
+                on_complete=read_transcript
+            )
+            future.add_done_callback(lambda done, submitted=submitted: record(done, submitted))
+            futures.append(future)
+        wait(futures)
+        wall_time = time.monotonic() - start
+    
+    return summarize(config, jobs, latencies, wall_time, simulation, governors_before, polls=scheduler.polls)
+
+RUNNERS = {
+    'process': run_process,
+    'calibrate': run_calibration,
+    'transcribe': run_transcription
+}
+
+def load_configurations(path: Optional[str], only: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Load the benchmark configurations.
+    
+    Args:
+        path: JSON file with a list of configurations (the built-in suite if None)
+        only: Comma-separated names of the configurations to keep
+    
+    Returns:
+        Configurations to run
+    """
+    configurations = DEFAULT_CONFIGURATIONS
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            configurations = json.load(f)
+    
+    for config in configurations:
+        if config.get('kind', 'process') not in RUNNERS:
+            raise ValueError(f"Unknown benchmark kind {config.get('kind')} in {config['name']}, expected one of {list(RUNNERS)}")
+    
+    if only:
+        names = set(only.split(','))
+        configurations = [config for config in configurations if config['name'] in names]
+    return configurations
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description='Benchmark the classification pipeline against simulated AWS services')
+    parser.add_argument('--config', help='JSON file with a list of benchmark configurations (runs a built-in suite if not set)')
+    parser.add_argument('--only', help='Comma-separated names of the configurations to run')
+    parser.add_argument('--output', help='Write the report to this file: full details if it ends in .json, one CSV row per configuration otherwise')
+    parser.add_argument('--categories-path', default='category.json', help='Path to categories JSON file')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the simulated services')
+    parser.add_argument('--verbose', action='store_true', help='Show the logs of the pipeline')
+    args = parser.parse_args()
+    
+    if not args.verbose:
+        # Keep the per-video logs of the pipeline out of the report
+        logging.getLogger().setLevel(logging.WARNING)
+        logger.setLevel(logging.INFO)
+    
+    configurations = load_configurations(args.config, args.only)
+    categories_path = os.path.abspath(args.categories_path)
+    output = os.path.abspath(args.output) if args.output else None
+    
+    # Caches, indexes and outputs of the runs live in a scratch directory
+    reports = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='video-classify-benchmark-') as workdir:
+        os.chdir(workdir)
+        try:
+            build_taxonomy_index(categories_path)
+            for config in configurations:
+                kind = config.get('kind', 'process')
+                logger.info(f"Running {config['name']} ({kind})")
+                try:
+                    report = RUNNERS[kind](config, categories_path, args.seed)
+                except Exception as e:
+                    logger.error(f"Error running {config['name']}: {e}")
+                    continue
+                reports.append(report)
+                summary = report['summary']
+                logger.info(
+                    f"{config['name']}: {summary['completed']}/{summary['items']} in {summary['wall_time_s']}s "
+                    f"({summary['items_per_second']}/s), p95 {summary['latency_p95_s']}s"
+                )
+        finally:
+            os.chdir(cwd)
+    
+    if not reports:
+        logger.error("No configuration completed")
+        sys.exit(1)
+    
+    table = pd.DataFrame([report['summary'] for report in reports]).set_index('name')
+    print(table.T.to_string())
+    
+    if output:
+        if output.endswith('.json'):
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump(reports, f, indent=2)
+        else:
+            table.to_csv(output)
+        logger.info(f"Report written to {output}")
+
+if __name__ == '__main__':
+    main()
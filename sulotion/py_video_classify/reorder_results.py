@@ -8,6 +8,10 @@ import os
 import glob
 import sys
 
+import pandas as pd
+
+from src.result_store import load_results, reorder_frame
+
 def load_s3_uri_order(input_file):
     """Load the S3 URI order from the input file"""
     s3_uris = []
@@ -20,30 +24,23 @@ def load_s3_uri_order(input_file):
     return s3_uris
 
 def reorder_results_file(results_file, s3_uri_order):
-    """Reorder a results file based on the S3 URI order"""
-    # Read the results file
-    with open(results_file, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        header = next(reader)
-        rows_dict = {}
-        for row in reader:
-            if row and len(row) > 0:
-                rows_dict[row[0]] = row  # Use S3 URI as key
-
-    # Create a new ordered list of rows
-    ordered_rows = []
-    for uri in s3_uri_order:
-        if uri in rows_dict:
-            ordered_rows.append(rows_dict[uri])
-        else:
-            print(f"Warning: S3 URI {uri} not found in {results_file}")
+    """Reorder a results file (CSV or Parquet result store) based on the S3 URI order"""
+    # Read the results as strings so the values are written back unchanged
+    results_df = load_results(
+        results_file,
+        csv_kwargs={'dtype': str, 'keep_default_na': False, 'quotechar': '"', 'escapechar': '\\'}
+    )
+    
+    # Reorder with one join on the S3 URI column
+    ordered_df = reorder_frame(results_df, s3_uri_order)
+    
+    missing = pd.Index(s3_uri_order).difference(ordered_df['S3 URI'])
+    for uri in missing:
+        print(f"Warning: S3 URI {uri} not found in {results_file}")
 
-    # Write the reordered data back to the file
-    output_file = results_file.replace('.csv', '_reordered.csv')
-    with open(output_file, 'w', encoding='utf-8', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(header)
-        writer.writerows(ordered_rows)
+    # Write the reordered data to a new CSV file
+    output_file = f"{os.path.splitext(results_file.rstrip('/'))[0]}_reordered.csv"
+    ordered_df.to_csv(output_file, index=False)
     
     print(f"Reordered file saved as {output_file}")
     return output_file
@@ -0,0 +1,114 @@
+"""
+Shared boto3 client registry.
+"""
+import logging
+import threading
+from typing import Dict, Any, Tuple, Optional, Callable
+import boto3
+from botocore.config import Config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Calls to these services go through a rate governor, which retries throttled and
+# transient failures itself. botocore must not retry them as well, or each governed
+# attempt would hide up to max_attempts requests from the governor's limits.
+GOVERNED_SERVICES = {'bedrock-runtime', 'transcribe'}
+
+_lock = threading.Lock()
+_session: Optional[boto3.session.Session] = None
+_clients: Dict[Tuple[str, str], Any] = {}
+_client_factory: Optional[Callable[[str, str], Any]] = None
+_client_settings: Dict[str, Any] = {
+    'max_pool_connections': DEFAULT_MAX_POOL_CONNECTIONS,
+    'max_attempts': DEFAULT_MAX_ATTEMPTS,
+    'tcp_keepalive': True
+}
+
+def configure_clients(
+    max_pool_connections: Optional[int] = None,
+    max_attempts: Optional[int] = None,
+    tcp_keepalive: Optional[bool] = None
+) -> None:
+    """
+    Change the connection settings of the shared clients.
+    
+    Clients created before the call are discarded, so this should be called once
+    at startup before worker threads start using the registry.
+    
+    Args:
+        max_pool_connections: Maximum number of pooled HTTP connections per client
+        max_attempts: Maximum number of attempts for the adaptive retry mode;
+            clients of GOVERNED_SERVICES always make a single attempt
+        tcp_keepalive: Whether to enable TCP keepalive on pooled connections
+    """
+    with _lock:
+        if max_pool_connections is not None:
+            _client_settings['max_pool_connections'] = max_pool_connections
+        if max_attempts is not None:
+            _client_settings['max_attempts'] = max_attempts
+        if tcp_keepalive is not None:
+            _client_settings['tcp_keepalive'] = tcp_keepalive
+        _clients.clear()
+        logger.info(f"Configured AWS clients: {_client_settings}")
+
+def set_client_factory(factory: Optional[Callable[[str, str], Any]]) -> None:
+    """
+    Create the shared clients with a custom factory instead of boto3.
+    
+    This lets the whole pipeline run against simulated services, e.g. in the
+    offline benchmark. Clients created before the call are discarded.
+    
+    Args:
+        factory: Function taking the service name and region and returning the
+            client, or None to go back to boto3
+    """
+    global _client_factory
+    with _lock:
+        _client_factory = factory
+        _clients.clear()
+
+def get_client(service: str, region: str = "us-east-1") -> Any:
+    """
+    Get the process-wide client for a service and region.
+    
+    boto3 clients are thread-safe once created, but creating them is not, so
+    creation is serialized and every thread shares the same client afterwards.
+    
+    Args:
+        service: AWS service name, e.g. 'bedrock-runtime'
+        region: AWS region
+    
+    Returns:
+        boto3 client
+    """
+    key = (service, region)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    
+    global _session
+    with _lock:
+        client = _clients.get(key)
+        if client is None and _client_factory is not None:
+            client = _client_factory(service, region)
+            _clients[key] = client
+        elif client is None:
+            if _session is None:
+                _session = boto3.session.Session()
+            if service in GOVERNED_SERVICES:
+                retries = {'mode': 'standard', 'total_max_attempts': 1}
+            else:
+                retries = {'mode': 'adaptive', 'max_attempts': _client_settings['max_attempts']}
+            config = Config(
+                max_pool_connections=_client_settings['max_pool_connections'],
+                tcp_keepalive=_client_settings['tcp_keepalive'],
+                retries=retries
+            )
+            client = _session.client(service, region_name=region, config=config)
+            _clients[key] = client
+        return client
@@ -0,0 +1,129 @@
+"""
+Append-only checkpoint journal for resumable batch runs.
+"""
+import os
+import json
+import logging
+import threading
+from typing import Dict, Any, Optional, Set
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class CheckpointJournal:
+    """
+    Set of processed keys backed by an append-only journal file.
+    
+    The journal is read once when the object is created, so membership checks are
+    in-memory set lookups. Each processed key is appended as one JSON line and
+    flushed to disk immediately, so a crashed run resumes exactly where it stopped.
+    The journal is reconciled with the output CSV whenever the CSV is newer than
+    the journal: on first use, after a crash between the CSV write and the journal
+    append, or after rows were written outside of a batch run.
+    """
+    
+    def __init__(
+        self,
+        journal_path: str,
+        seed_csv: Optional[str] = None,
+        key_column: str = 'S3 URI',
+        csv_kwargs: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Initialize the journal.
+        
+        Args:
+            journal_path: Path to the journal file
+            seed_csv: Output CSV to seed the journal from if the journal does not exist
+            key_column: Column of the seed CSV holding the keys
+            csv_kwargs: Extra keyword arguments for reading the seed CSV
+        """
+        self.journal_path = journal_path
+        self._lock = threading.Lock()
+        self._keys: Set[str] = set()
+        
+        if os.path.exists(journal_path):
+            self._load()
+        
+        if seed_csv and os.path.exists(seed_csv) and (
+            not os.path.exists(journal_path) or os.path.getmtime(seed_csv) > os.path.getmtime(journal_path)
+        ):
+            self._seed(seed_csv, key_column, csv_kwargs or {})
+        
+        logger.info(f"Loaded {len(self._keys)} processed keys from {journal_path}")
+    
+    def _load(self) -> None:
+        """Read all keys from the journal file."""
+        committed = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                # A run killed mid-write can leave a torn last line; it was not committed
+                if not line.endswith(b'\n'):
+                    break
+                committed += len(line)
+                try:
+                    self._keys.add(json.loads(line.decode('utf-8')))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    logger.warning(f"Ignoring corrupt line in {self.journal_path}: {line.strip()}")
+        
+        # Drop the torn line so the next append starts on a fresh line
+        if committed < os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(committed)
+    
+    def _seed(self, seed_csv: str, key_column: str, csv_kwargs: Dict[str, Any]) -> None:
+        """
+        Add the keys of an existing output CSV that are missing from the journal.
+        
+        Args:
+            seed_csv: Output CSV path
+            key_column: Column holding the keys
+            csv_kwargs: Extra keyword arguments for pandas.read_csv
+        """
+        try:
+            seed_df = pd.read_csv(seed_csv, **csv_kwargs)
+            keys = seed_df[key_column].dropna().astype(str).tolist()
+        except Exception as e:
+            logger.warning(f"Error seeding checkpoint journal from {seed_csv}: {e}")
+            keys = []
+        
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        added = 0
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for key in keys:
+                if key not in self._keys:
+                    self._keys.add(key)
+                    f.write(json.dumps(key) + '\n')
+                    added += 1
+            f.flush()
+            os.fsync(f.fileno())
+        
+        logger.info(f"Added {added} keys from {seed_csv} to checkpoint journal {self.journal_path}")
+    
+    def __contains__(self, key: Any) -> bool:
+        return str(key) in self._keys
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def record(self, key: Any) -> None:
+        """
+        Mark a key as processed.
+        
+        Args:
+            key: Processed key
+        """
+        key = str(key)
+        with self._lock:
+            if key in self._keys:
+                return
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(key) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._keys.add(key)
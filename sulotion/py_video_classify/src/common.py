@@ -3,18 +3,132 @@ Common utility functions for video classification.
 """
 import os
 import json
-import boto3
+import hashlib
+import functools
 import logging
 import time
-from typing import Dict, Any, List, Tuple, Optional
+import uuid
+import struct
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple, Optional, Iterable, TYPE_CHECKING
 import tempfile
 import subprocess
 import numpy as np
 
+from .llm_cache import LLMResponseCache, get_default_cache
+from .aws_clients import get_client
+from .s3_transfer import upload_file
+from .mp4 import read_mp4_duration
+from .rate_governor import get_governor
+from .json_repair import repair_json, record_parse_outcome
+from .transcribe_scheduler import TranscriptionScheduler, get_transcription_scheduler
+
+if TYPE_CHECKING:
+    from .taxonomy_index import TaxonomyIndex
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+_inflight_lock = threading.Lock()
+_inflight_requests: Dict[str, Future] = {}
+
+# ETags read from S3 are reused for a while, keyed by (S3 URI, region)
+ETAG_TTL = 300.0
+_etag_lock = threading.Lock()
+_etags: Dict[Tuple[str, str], Tuple[float, str]] = {}
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the token count of a text before sending it.
+    
+    Args:
+        text: Text to estimate
+        
+    Returns:
+        Estimated token count (about four characters per token)
+    """
+    return len(text) // 4 + 1
+
+def count_converse_tokens(response: Dict[str, Any]) -> int:
+    """
+    Get the total token count of a converse response.
+    
+    Args:
+        response: Converse response
+        
+    Returns:
+        Input plus output tokens
+    """
+    usage = response.get('usage', {})
+    return usage.get('inputTokens', 0) + usage.get('outputTokens', 0)
+
+def read_prompt_file(path: str) -> str:
+    """
+    Read a prompt file, reusing the content while the file is unchanged.
+    
+    Args:
+        path: Path to the prompt file
+        
+    Returns:
+        File content
+    """
+    stat = os.stat(path)
+    return _read_prompt_file(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+@functools.lru_cache(maxsize=64)
+def _read_prompt_file(path: str, mtime_ns: int, size: int) -> str:
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def get_s3_etag(s3_uri: str, region: str = "us-east-1") -> Optional[str]:
+    """
+    Get the ETag of an S3 object.
+    
+    The ETag is memoized per URI for ETAG_TTL seconds, so the several calls
+    made for one video share a single head_object request.
+    
+    Args:
+        s3_uri: S3 URI of the object
+        region: AWS region
+        
+    Returns:
+        ETag without quotes, or None if it could not be read
+    """
+    now = time.monotonic()
+    with _etag_lock:
+        cached = _etags.get((s3_uri, region))
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    
+    try:
+        s3_client = get_client('s3', region)
+        bucket_name = s3_uri.split('/')[2]
+        object_key = '/'.join(s3_uri.split('/')[3:])
+        response = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+        etag = response['ETag'].strip('"')
+        with _etag_lock:
+            if len(_etags) >= 4096:
+                for key in [key for key, (expires, _) in _etags.items() if expires <= now]:
+                    del _etags[key]
+            _etags[(s3_uri, region)] = (now + ETAG_TTL, etag)
+        return etag
+    except Exception as e:
+        logger.warning(f"Could not get ETag for {s3_uri}: {e}")
+        return None
+
+def _cache_hit_usage() -> Dict[str, int]:
+    """Token usage of a response that did not call Bedrock."""
+    return {
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cache_read_tokens": 0,
+        "cache_write_tokens": 0,
+        "latency_ms": 0,
+        "cache_hit": True
+    }
+
 def call_bedrock_llm(
     s3_uri: str, 
     prompt: str, 
@@ -24,13 +138,19 @@ def call_bedrock_llm(
     temperature: float = 0.5,
     top_p: float = 0.9,
     region: str = "us-east-1",
-    sleep_time: float = 1.0  # Add sleep time parameter with default of 1 second
+    sleep_time: float = 1.0,  # Unused; rate limiting is handled by the rate governor
+    cache: Optional[LLMResponseCache] = None,
+    bypass_cache: bool = False,
+    tool_config: Optional[Dict[str, Any]] = None,
+    prompt_cache: bool = False,
+    cached_prefix: Optional[str] = None,
+    images: Optional[List[bytes]] = None
 ) -> Tuple[str, Dict[str, int]]:
     """
     Call Bedrock LLM with video input.
     
     Args:
-        s3_uri: S3 URI of the video
+        s3_uri: S3 URI of the video, or None for a text-only request
         prompt: Prompt text
         system: System prompt
         model_id: Model ID
@@ -38,72 +158,182 @@ def call_bedrock_llm(
         temperature: Temperature for sampling
         top_p: Top-p for sampling
         region: AWS region
-        sleep_time: Time to sleep after API call to avoid rate limits (in seconds)
+        sleep_time: Deprecated and ignored; calls are paced by the model's rate governor
+        cache: Response cache to use; defaults to the cache set by configure_default_cache
+        bypass_cache: Skip the cache lookup and always call Bedrock (the fresh response is still stored)
+        tool_config: Converse toolConfig forcing a tool call; the tool input is then
+            returned as a JSON string instead of the free-text response
+        prompt_cache: Add a Bedrock prompt cache checkpoint after the static part of
+            the request (the system prompt and cached_prefix)
+        cached_prefix: Static text sent before the video, e.g. the instructions and
+            taxonomy; with prompt_cache it is covered by the cache checkpoint
+        images: JPEG keyframes sent instead of the video; s3_uri then only
+            identifies the video in the response cache
         
     Returns:
-        Tuple of (response text, token usage)
+        Tuple of (response text, token usage). The usage also reports the prompt
+        cache read/write tokens and the model latency in milliseconds. Responses
+        served from the response cache or shared with an identical in-flight
+        request report zero tokens and cache_hit True
     """
     try:
-        # Create Bedrock Runtime client
-        bedrock_client = boto3.client('bedrock-runtime', region_name=region)
-        
-        # Create video content block
-        video_content = {
-            "video": {
-                "format": "mp4",
-                "source": {
-                    "s3Location": {
-                        "uri": s3_uri
-                    }
-                }
-            }
+        inference_config = {
+            "maxTokens": max_tokens,
+            "temperature": temperature,
+            "topP": top_p
         }
         
-        # Create text content block
-        text_content = {
-            "text": prompt
-        }
+        # Look up the response cache; the video is identified by its ETag so that
+        # re-uploaded content under the same key is not served a stale answer
+        if cache is None:
+            cache = get_default_cache()
         
-        # Create message with both video and text content
-        message = {
-            "role": "user",
-            "content": [video_content, text_content]
-        }
+        cache_key = None
+        if cache is not None and cache.enabled:
+            etag = get_s3_etag(s3_uri, region) if s3_uri else ""
+            if etag is not None:
+                extra = {}
+                if tool_config:
+                    extra['tool_config'] = tool_config
+                if cached_prefix:
+                    extra['cached_prefix'] = hashlib.sha256(cached_prefix.encode('utf-8')).hexdigest()
+                if images:
+                    extra['images'] = hashlib.sha256(b''.join(images)).hexdigest()
+                cache_key = LLMResponseCache.make_key(
+                    model_id, prompt, system, inference_config, etag, extra=extra or None
+                )
+                if not bypass_cache:
+                    cached = cache.get(cache_key)
+                    if cached is not None:
+                        logger.info(f"LLM response cache hit for {s3_uri or 'text request'} ({model_id})")
+                        return cached[0], _cache_hit_usage()
         
-        # Create system message
-        system_message = {
-            "text": system
-        }
+        # An identical request already in flight (e.g. a video listed twice in the same
+        # run) is awaited instead of being sent to Bedrock a second time
+        flight = None
+        if cache_key is not None and not bypass_cache:
+            with _inflight_lock:
+                pending = _inflight_requests.get(cache_key)
+                if pending is None:
+                    flight = _inflight_requests[cache_key] = Future()
+            if pending is not None:
+                logger.info(f"Waiting for identical in-flight request for {s3_uri or 'text request'} ({model_id})")
+                return pending.result()[0], _cache_hit_usage()
         
-        # Create request
-        request = {
-            "modelId": model_id,
-            "system": [system_message],
-            "messages": [message],
-            "inferenceConfig": {
-                "maxTokens": max_tokens,
-                "temperature": temperature,
-                "topP": top_p
+        try:
+            # Get the shared Bedrock Runtime client
+            bedrock_client = get_client('bedrock-runtime', region)
+            
+            # Create text content block
+            text_content = {
+                "text": prompt
             }
-        }
-        
-        # Call Bedrock
-        response = bedrock_client.converse(**request)
-        
-        # Extract response text
-        response_text = response['output']['message']['content'][0]['text']
-        
-        # Extract token usage
-        token_usage = {
-            "input_tokens": response.get('usage', {}).get('inputTokens', 0),
-            "output_tokens": response.get('usage', {}).get('outputTokens', 0)
-        }
-        
-        # Sleep to avoid hitting API rate limits
-        logger.info(f"Sleeping for 1 seconds to avoid API rate limits")
-        time.sleep(1)
-        
-        return response_text, token_usage
+            
+            content = [text_content] if prompt else []
+            if images:
+                # Create image content blocks, one per keyframe
+                image_content = [
+                    {
+                        "image": {
+                            "format": "jpeg",
+                            "source": {
+                                "bytes": image
+                            }
+                        }
+                    }
+                    for image in images
+                ]
+                content = [{"text": f"The video is given as {len(images)} keyframes in chronological order."}] + image_content + content
+            elif s3_uri:
+                # Create video content block
+                video_content = {
+                    "video": {
+                        "format": "mp4",
+                        "source": {
+                            "s3Location": {
+                                "uri": s3_uri
+                            }
+                        }
+                    }
+                }
+                content = [video_content] + content
+            
+            # The static prefix goes first so that it is identical across videos
+            # and can be served from the prompt cache
+            if cached_prefix:
+                prefix = [{"text": cached_prefix}]
+                if prompt_cache:
+                    prefix.append({"cachePoint": {"type": "default"}})
+                content = prefix + content
+            
+            # Create message with both video and text content
+            message = {
+                "role": "user",
+                "content": content
+            }
+            
+            # Create system message
+            system_message = {
+                "text": system
+            }
+            
+            system_blocks = [system_message]
+            if prompt_cache and not cached_prefix:
+                system_blocks.append({"cachePoint": {"type": "default"}})
+            
+            # Create request
+            request = {
+                "modelId": model_id,
+                "system": system_blocks,
+                "messages": [message],
+                "inferenceConfig": inference_config
+            }
+            if tool_config:
+                request["toolConfig"] = tool_config
+            
+            # Call Bedrock under the model's rate governor
+            response = get_governor(model_id).call(
+                lambda: bedrock_client.converse(**request),
+                estimated_tokens=estimate_tokens((cached_prefix or "") + prompt + system) + max_tokens,
+                count_tokens=count_converse_tokens
+            )
+            
+            # Extract response text, or the tool input when a tool call was forced
+            response_content = response['output']['message']['content']
+            tool_inputs = [block['toolUse']['input'] for block in response_content if 'toolUse' in block]
+            if tool_config and tool_inputs:
+                response_text = json.dumps(tool_inputs[0], ensure_ascii=False)
+            else:
+                response_text = next((block['text'] for block in response_content if 'text' in block), None)
+                if response_text is None:
+                    block_types = [key for block in response_content for key in block]
+                    raise ValueError(f"{model_id} returned no text or tool use; content blocks: {block_types}")
+            
+            # Extract token usage
+            usage = response.get('usage', {})
+            token_usage = {
+                "input_tokens": usage.get('inputTokens', 0),
+                "output_tokens": usage.get('outputTokens', 0),
+                "cache_read_tokens": usage.get('cacheReadInputTokens', 0),
+                "cache_write_tokens": usage.get('cacheWriteInputTokens', 0),
+                "latency_ms": response.get('metrics', {}).get('latencyMs', 0),
+                "cache_hit": False
+            }
+            
+            if cache_key is not None:
+                cache.put(cache_key, response_text, token_usage)
+            if flight is not None:
+                flight.set_result((response_text, token_usage))
+            
+            return response_text, token_usage
+        except Exception as e:
+            if flight is not None:
+                flight.set_exception(e)
+            raise
+        finally:
+            if flight is not None:
+                with _inflight_lock:
+                    _inflight_requests.pop(cache_key, None)
         
     except Exception as e:
         logger.error(f"Error calling Bedrock LLM: {e}")
@@ -111,7 +341,10 @@ def call_bedrock_llm(
 
 def get_video_duration(input_path: str) -> Optional[float]:
     """
-    Get video duration using ffprobe.
+    Get video duration.
+    
+    MP4/MOV files are read in-process from their mvhd box; ffprobe is only
+    spawned for other containers.
     
     Args:
         input_path: Path to input video
@@ -119,6 +352,10 @@ def get_video_duration(input_path: str) -> Optional[float]:
     Returns:
         Duration in seconds or None if failed
     """
+    duration = read_mp4_duration(input_path)
+    if duration is not None:
+        return duration
+    
     try:
         cmd = [
             'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
@@ -131,129 +368,378 @@ def get_video_duration(input_path: str) -> Optional[float]:
         logger.error(f"Error getting video duration: {e}")
         return None
 
-def video_to_text(s3_uri: str, max_duration: int = 30, region: str = "us-east-1") -> str:
+def _patch_wav_header(header: bytearray, total_size: int) -> None:
     """
-    Convert video to text using Amazon Transcribe.
+    Fill in the RIFF and data chunk sizes of a WAV file written to a pipe.
+    
+    ffmpeg cannot seek back on a pipe, so it leaves both sizes at 0xFFFFFFFF.
+    
+    Args:
+        header: Buffer holding the start of the WAV file, patched in place
+        total_size: Total size of the WAV file in bytes
+    """
+    struct.pack_into('<I', header, 4, total_size - 8)
+    
+    # Walk the chunks after "RIFF....WAVE" to find the data chunk
+    offset = 12
+    while offset + 8 <= len(header):
+        chunk_id = bytes(header[offset:offset + 4])
+        if chunk_id == b'data':
+            struct.pack_into('<I', header, offset + 4, total_size - offset - 8)
+            return
+        chunk_size = struct.unpack_from('<I', header, offset + 4)[0]
+        offset += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV data chunk not found in header")
+
+def stream_audio_to_s3(
+    source_url: str,
+    bucket_name: str,
+    object_key: str,
+    max_duration: int = 30,
+    region: str = "us-east-1",
+    part_size: int = 8 * 1024 * 1024
+) -> str:
+    """
+    Extract the audio of the first seconds of a video straight into S3.
+    
+    A single ffmpeg process reads the video from a URL, trims it and converts the
+    audio to 16 kHz mono PCM WAV on stdout, which is uploaded with multipart upload
+    as it is produced. Nothing is written to local disk. The first part is kept in
+    memory until the end so its WAV header can be completed.
+    
+    Args:
+        source_url: URL ffmpeg reads the video from (e.g. a presigned S3 URL)
+        bucket_name: Destination S3 bucket
+        object_key: Destination S3 object key
+        max_duration: Maximum duration in seconds
+        region: AWS region
+        part_size: Multipart upload part size in bytes (at least 5 MB)
+        
+    Returns:
+        S3 URI of the uploaded audio
+    """
+    s3_client = get_client('s3', region)
+    cmd = [
+        'ffmpeg', '-v', 'error', '-nostdin',
+        '-t', str(max_duration), '-i', source_url,
+        '-vn', '-acodec', 'pcm_s16le', '-ar', '16000', '-ac', '1',
+        '-f', 'wav', 'pipe:1'
+    ]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    # Drain stderr in the background so ffmpeg never blocks on a full pipe
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_thread.start()
+    
+    first_part = bytearray()
+    buffer = bytearray()
+    parts = []
+    upload_id = None
+    total_size = 0
+    
+    try:
+        while True:
+            chunk = process.stdout.read(1024 * 1024)
+            if not chunk:
+                break
+            total_size += len(chunk)
+            
+            if len(first_part) < part_size:
+                take = part_size - len(first_part)
+                first_part.extend(chunk[:take])
+                buffer.extend(chunk[take:])
+            else:
+                buffer.extend(chunk)
+            
+            while len(buffer) >= part_size:
+                if upload_id is None:
+                    upload_id = s3_client.create_multipart_upload(
+                        Bucket=bucket_name, Key=object_key, ContentType='audio/wav'
+                    )['UploadId']
+                part_number = len(parts) + 2  # part 1 is uploaded last
+                response = s3_client.upload_part(
+                    Bucket=bucket_name, Key=object_key, UploadId=upload_id,
+                    PartNumber=part_number, Body=bytes(buffer[:part_size])
+                )
+                parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+                del buffer[:part_size]
+        
+        return_code = process.wait()
+        stderr_thread.join()
+        if return_code != 0:
+            error = b''.join(stderr_chunks).decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"ffmpeg exited with code {return_code}: {error}")
+        
+        _patch_wav_header(first_part, total_size)
+        
+        if upload_id is None:
+            s3_client.put_object(
+                Bucket=bucket_name, Key=object_key, Body=bytes(first_part + buffer), ContentType='audio/wav'
+            )
+        else:
+            if buffer:
+                part_number = len(parts) + 2
+                response = s3_client.upload_part(
+                    Bucket=bucket_name, Key=object_key, UploadId=upload_id,
+                    PartNumber=part_number, Body=bytes(buffer)
+                )
+                parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+            response = s3_client.upload_part(
+                Bucket=bucket_name, Key=object_key, UploadId=upload_id,
+                PartNumber=1, Body=bytes(first_part)
+            )
+            parts.insert(0, {'PartNumber': 1, 'ETag': response['ETag']})
+            s3_client.complete_multipart_upload(
+                Bucket=bucket_name, Key=object_key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        
+        logger.info(f"Streamed {total_size} bytes of audio to s3://{bucket_name}/{object_key}")
+        return f"s3://{bucket_name}/{object_key}"
+        
+    except Exception:
+        if process.poll() is None:
+            process.kill()
+        if upload_id is not None:
+            s3_client.abort_multipart_upload(Bucket=bucket_name, Key=object_key, UploadId=upload_id)
+        raise
+    finally:
+        process.stdout.close()
+
+def submit_video_transcription(
+    s3_uri: str,
+    max_duration: int = 30,
+    region: str = "us-east-1",
+    streaming: bool = False,
+    scheduler: Optional[TranscriptionScheduler] = None
+) -> Future:
+    """
+    Extract the audio of a video and start its transcription job.
+    
+    The job is tracked by the transcription scheduler, so the caller does not
+    block while Amazon Transcribe works on it.
     
     Args:
         s3_uri: S3 URI of the video
         max_duration: Maximum duration in seconds
         region: AWS region
+        streaming: Extract the audio with a single ffmpeg pass streamed from and to
+            S3 instead of downloading, trimming and converting through temp files
+        scheduler: Transcription scheduler (the shared one of the region if not provided)
         
     Returns:
-        Transcribed text
+        Future resolving to the transcribed text
     """
     try:
-        # Download video from S3
-        s3_client = boto3.client('s3', region_name=region)
+        s3_client = get_client('s3', region)
         bucket_name = s3_uri.split('/')[2]
         object_key = '/'.join(s3_uri.split('/')[3:])
+        local_paths = []
         
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_video:
-            temp_video_path = temp_video.name
-            s3_client.download_file(bucket_name, object_key, temp_video_path)
+        if streaming:
+            # ffmpeg reads the video over HTTPS, seeking with range requests as needed
+            audio_id = uuid.uuid4().hex
+            audio_s3_key = f"temp-audio/{audio_id}.wav"
+            source_url = s3_client.generate_presigned_url(
+                'get_object', Params={'Bucket': bucket_name, 'Key': object_key}, ExpiresIn=3600
+            )
+            audio_s3_uri = stream_audio_to_s3(source_url, bucket_name, audio_s3_key, max_duration, region)
+        else:
+            try:
+                # Download video from S3
+                with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_video:
+                    temp_video_path = temp_video.name
+                    local_paths.append(temp_video_path)
+                    s3_client.download_file(bucket_name, object_key, temp_video_path)
+                
+                # Trim video if needed
+                with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as trimmed_video:
+                    trimmed_video_path = trimmed_video.name
+                    local_paths.append(trimmed_video_path)
+                    
+                    # Get video duration
+                    duration = get_video_duration(temp_video_path)
+                    if duration is None:
+                        raise ValueError("Could not determine video duration")
+                    
+                    if duration > max_duration:
+                        # Trim video
+                        cmd = [
+                            'ffmpeg', '-y', '-i', temp_video_path, 
+                            '-t', str(max_duration), 
+                            '-c:v', 'copy', '-c:a', 'copy', 
+                            trimmed_video_path
+                        ]
+                        subprocess.run(cmd, check=True)
+                    else:
+                        trimmed_video_path = temp_video_path
+                
+                # Extract audio
+                with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as audio_file:
+                    audio_path = audio_file.name
+                    local_paths.append(audio_path)
+                    cmd = [
+                        'ffmpeg', '-y', '-i', trimmed_video_path, 
+                        '-vn', '-acodec', 'pcm_s16le', '-ar', '16000', '-ac', '1', 
+                        audio_path
+                    ]
+                    subprocess.run(cmd, check=True)
+                
+                # Upload audio to S3
+                audio_id = os.path.basename(audio_path).split('.')[0]
+                audio_s3_key = f"temp-audio/{os.path.basename(audio_path)}"
+                upload_file(audio_path, bucket_name, audio_s3_key, region, skip_if_identical=False)
+                audio_s3_uri = f"s3://{bucket_name}/{audio_s3_key}"
+            finally:
+                # Local files are no longer needed once the audio is in S3, or after a failure
+                for path in local_paths:
+                    if os.path.exists(path):
+                        os.unlink(path)
         
-        # Trim video if needed
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as trimmed_video:
-            trimmed_video_path = trimmed_video.name
+        def read_transcript(job: Dict[str, Any]) -> str:
+            # Parse S3 key from the HTTPS URI and read the transcript
+            transcript_uri = job['Transcript']['TranscriptFileUri']
+            transcript_s3_key = transcript_uri.split(f"{bucket_name}/")[1]
+            transcript_object = s3_client.get_object(Bucket=bucket_name, Key=transcript_s3_key)
+            transcript_data = json.loads(transcript_object['Body'].read())
             
-            # Get video duration
-            duration = get_video_duration(temp_video_path)
-            if duration is None:
-                raise ValueError("Could not determine video duration")
+            # Delete temporary S3 objects
+            s3_client.delete_object(Bucket=bucket_name, Key=audio_s3_key)
+            s3_client.delete_object(Bucket=bucket_name, Key=transcript_s3_key)
             
-            if duration > max_duration:
-                # Trim video
-                cmd = [
-                    'ffmpeg', '-i', temp_video_path, 
-                    '-t', str(max_duration), 
-                    '-c:v', 'copy', '-c:a', 'copy', 
-                    trimmed_video_path
-                ]
-                subprocess.run(cmd, check=True)
-            else:
-                trimmed_video_path = temp_video_path
-        
-        # Extract audio
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as audio_file:
-            audio_path = audio_file.name
-            cmd = [
-                'ffmpeg', '-i', trimmed_video_path, 
-                '-vn', '-acodec', 'pcm_s16le', '-ar', '16000', '-ac', '1', 
-                audio_path
-            ]
-            subprocess.run(cmd, check=True)
-        
-        # Upload audio to S3
-        audio_s3_key = f"temp-audio/{os.path.basename(audio_path)}"
-        s3_client.upload_file(audio_path, bucket_name, audio_s3_key)
-        audio_s3_uri = f"s3://{bucket_name}/{audio_s3_key}"
-        
-        # Start transcription job
-        transcribe_client = boto3.client('transcribe', region_name=region)
-        job_name = f"video-classify-{os.path.basename(audio_path).split('.')[0]}"
-        
-        transcribe_client.start_transcription_job(
-            TranscriptionJobName=job_name,
-            Media={'MediaFileUri': audio_s3_uri},
-            MediaFormat='wav',
-            LanguageOptions=['en-US', 'zh-CN', 'ja-JP', 'ko-KR'],
-            IdentifyLanguage=True,
-            OutputBucketName=bucket_name
+            return transcript_data['results']['transcripts'][0]['transcript']
+        
+        # Start transcription job; the scheduler's poller resolves the Future
+        if scheduler is None:
+            scheduler = get_transcription_scheduler(region)
+        
+        return scheduler.submit(
+            job_id=audio_id,
+            media_uri=audio_s3_uri,
+            output_bucket=bucket_name,
+            media_format='wav',
+            on_complete=read_transcript
         )
         
-        # Wait for transcription job to complete
-        import time
-        while True:
-            status = transcribe_client.get_transcription_job(TranscriptionJobName=job_name)
-            if status['TranscriptionJob']['TranscriptionJobStatus'] in ['COMPLETED', 'FAILED']:
-                break
-            time.sleep(5)
+    except Exception as e:
+        logger.error(f"Error in submit_video_transcription: {e}")
+        raise
+
+def video_to_text(
+    s3_uri: str,
+    max_duration: int = 30,
+    region: str = "us-east-1",
+    streaming: bool = False
+) -> str:
+    """
+    Convert video to text using Amazon Transcribe.
+    
+    Args:
+        s3_uri: S3 URI of the video
+        max_duration: Maximum duration in seconds
+        region: AWS region
+        streaming: Extract the audio with a single ffmpeg pass streamed from and to
+            S3 instead of downloading, trimming and converting through temp files
         
-        if status['TranscriptionJob']['TranscriptionJobStatus'] == 'COMPLETED':
-            # Get transcription results
-            transcript_uri = status['TranscriptionJob']['Transcript']['TranscriptFileUri']
-            
-            # Download transcript
-            with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as transcript_file:
-                transcript_path = transcript_file.name
-                
-                # Parse S3 URI from the HTTPS URI
-                transcript_s3_key = transcript_uri.split(f"{bucket_name}/")[1]
-                s3_client.download_file(bucket_name, transcript_s3_key, transcript_path)
-                
-                with open(transcript_path, 'r') as f:
-                    transcript_data = json.load(f)
-                    
-                transcript_text = transcript_data['results']['transcripts'][0]['transcript']
-                
-                # Clean up
-                os.unlink(temp_video_path)
-                if trimmed_video_path != temp_video_path:
-                    os.unlink(trimmed_video_path)
-                os.unlink(audio_path)
-                os.unlink(transcript_path)
-                
-                # Delete temporary S3 objects
-                s3_client.delete_object(Bucket=bucket_name, Key=audio_s3_key)
-                s3_client.delete_object(Bucket=bucket_name, Key=transcript_s3_key)
-                
-                return transcript_text
-        else:
-            error_reason = status['TranscriptionJob'].get('FailureReason', 'Unknown error')
-            raise Exception(f"Transcription job failed: {error_reason}")
-            
+    Returns:
+        Transcribed text
+    """
+    try:
+        return submit_video_transcription(s3_uri, max_duration, region, streaming).result()
     except Exception as e:
         logger.error(f"Error in video_to_text: {e}")
         raise
 
+def transcribe_videos(
+    s3_uris: List[str],
+    max_duration: int = 30,
+    region: str = "us-east-1",
+    streaming: bool = False,
+    concurrency: int = 4
+) -> Dict[str, Optional[str]]:
+    """
+    Transcribe many videos at once.
+    
+    Audio extraction runs in a small thread pool; the transcription jobs are all
+    tracked by the region's single scheduler poller, so the number of jobs in
+    flight is bounded by the Transcribe quota rather than by the thread count.
+    
+    Args:
+        s3_uris: S3 URIs of the videos
+        max_duration: Maximum duration in seconds
+        region: AWS region
+        streaming: Use streaming audio extraction
+        concurrency: Number of audio extractions running at once
+        
+    Returns:
+        Mapping of S3 URI to transcribed text, or None if the video failed
+    """
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='extract-audio') as executor:
+        submissions = {
+            s3_uri: executor.submit(submit_video_transcription, s3_uri, max_duration, region, streaming)
+            for s3_uri in s3_uris
+        }
+    
+    transcripts = {}
+    for s3_uri, submission in submissions.items():
+        try:
+            transcripts[s3_uri] = submission.result().result()
+        except Exception as e:
+            logger.error(f"Error transcribing video {s3_uri}: {e}")
+            transcripts[s3_uri] = None
+    
+    return transcripts
+
+def get_embedding(
+    text: str,
+    model_id: str = "amazon.titan-embed-text-v2:0",
+    region: str = "us-east-1",
+    bedrock_client: Optional[Any] = None
+) -> List[float]:
+    """
+    Get the embedding of a text with an Amazon Titan embedding model.
+    
+    Args:
+        text: Text to embed
+        model_id: Embedding model ID
+        region: AWS region
+        bedrock_client: Bedrock Runtime client to use (the shared client if not provided)
+        
+    Returns:
+        Embedding vector
+    """
+    if bedrock_client is None:
+        bedrock_client = get_client('bedrock-runtime', region)
+    
+    def invoke():
+        response = bedrock_client.invoke_model(
+            modelId=model_id,
+            contentType="application/json",
+            accept="application/json",
+            body=json.dumps({
+                "inputText": text
+            })
+        )
+        return json.loads(response['body'].read())
+    
+    # Call the embedding model under its rate governor
+    response_body = get_governor(model_id).call(
+        invoke,
+        estimated_tokens=estimate_tokens(text),
+        count_tokens=lambda body: body.get('inputTextTokenCount', 0)
+    )
+    
+    return response_body['embedding']
+
 def calibrate_classification(
     category1: str, 
     category2: str, 
     category3: List[str], 
     categories_json: Dict[str, Any],
     model_id: str = "amazon.titan-embed-text-v2:0",
-    region: str = "us-east-1"
+    region: str = "us-east-1",
+    taxonomy_index: Optional["TaxonomyIndex"] = None
 ) -> Dict[str, Any]:
     """
     Calibrate classification results using embedding model.
@@ -265,31 +751,15 @@ def calibrate_classification(
         categories_json: Categories JSON object
         model_id: Embedding model ID
         region: AWS region
+        taxonomy_index: Precomputed label embeddings; when provided only the
+            unknown labels themselves are embedded
         
     Returns:
         Calibrated classification results
     """
     try:
-        # Create Bedrock Runtime client
-        bedrock_client = boto3.client('bedrock-runtime', region_name=region)
-        
-        # Function to get embedding
-        def get_embedding(text: str) -> List[float]:
-            response = bedrock_client.invoke_model(
-                modelId=model_id,
-                contentType="application/json",
-                accept="application/json",
-                body=json.dumps({
-                    "inputText": text
-                })
-            )
-            response_body = json.loads(response['body'].read())
-            
-            # Sleep to avoid hitting API rate limits
-            logger.info("Sleeping for 1 second to avoid embedding API rate limits")
-            time.sleep(1.0)
-            
-            return response_body['embedding']
+        # The shared Bedrock Runtime client is only needed without a precomputed index
+        bedrock_client = get_client('bedrock-runtime', region) if taxonomy_index is None else None
         
         # Function to calculate cosine similarity
         def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
@@ -298,12 +768,15 @@ def calibrate_classification(
             return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
         
         # Function to find most similar category
-        def find_most_similar(text: str, candidates: List[str]) -> Tuple[str, float]:
-            text_embedding = get_embedding(text)
+        def find_most_similar(text: str, candidates: List[str], parent_path: Tuple[str, ...]) -> Tuple[str, float]:
+            if taxonomy_index is not None:
+                return taxonomy_index.find_most_similar(text, parent_path)
+            
+            text_embedding = get_embedding(text, model_id, region, bedrock_client)
             similarities = []
             
             for candidate in candidates:
-                candidate_embedding = get_embedding(candidate)
+                candidate_embedding = get_embedding(candidate, model_id, region, bedrock_client)
                 similarity = cosine_similarity(text_embedding, candidate_embedding)
                 similarities.append((candidate, similarity))
             
@@ -312,7 +785,7 @@ def calibrate_classification(
         # Validate and calibrate category1
         level1_categories = list(categories_json.keys())
         if category1 not in level1_categories:
-            calibrated_category1, similarity = find_most_similar(category1, level1_categories)
+            calibrated_category1, similarity = find_most_similar(category1, level1_categories, ())
         else:
             calibrated_category1 = category1
             similarity = 1.0
@@ -321,7 +794,7 @@ def calibrate_classification(
         if calibrated_category1 in categories_json:
             level2_categories = list(categories_json[calibrated_category1].keys())
             if category2 not in level2_categories:
-                calibrated_category2, similarity = find_most_similar(category2, level2_categories)
+                calibrated_category2, similarity = find_most_similar(category2, level2_categories, (calibrated_category1,))
             else:
                 calibrated_category2 = category2
                 similarity = 1.0
@@ -335,7 +808,9 @@ def calibrate_classification(
             
             for cat3 in category3:
                 if cat3 not in level3_categories:
-                    calibrated_cat3, similarity = find_most_similar(cat3, level3_categories)
+                    calibrated_cat3, similarity = find_most_similar(
+                        cat3, level3_categories, (calibrated_category1, calibrated_category2)
+                    )
                     calibrated_category3.append(calibrated_cat3)
                 else:
                     calibrated_category3.append(cat3)
@@ -352,10 +827,86 @@ def calibrate_classification(
         logger.error(f"Error in calibrate_classification: {e}")
         raise
 
+def collect_unknown_labels(classifications: Iterable[Dict[str, Any]], categories_json: Dict[str, Any]) -> List[str]:
+    """
+    Collect the labels of parsed classifications that calibration will need to embed.
+    
+    A label is unknown when it is not in the taxonomy under the parent labels the
+    model gave. Under a parent that calibration has to replace, the calibrated
+    parent is not known yet, so a label counts as unknown only if it appears
+    nowhere at its level; calibration embeds the rare label that is still
+    missing itself.
+    
+    Args:
+        classifications: Items of the 'catetorys' list of one or more parsed results
+        categories_json: Categories JSON object
+        
+    Returns:
+        Unknown labels without duplicates, in order of appearance
+    """
+    all_level2 = {category2 for level2 in categories_json.values() for category2 in level2}
+    all_level3 = {
+        category3
+        for level2 in categories_json.values()
+        for level3 in level2.values()
+        for category3 in level3
+    }
+    
+    labels: Dict[str, None] = {}
+    for category in classifications:
+        category1 = category.get('catetory1', '')
+        category2 = category.get('catetory2', '')
+        level2 = categories_json.get(category1) if isinstance(category1, str) else None
+        level3 = level2.get(category2) if isinstance(level2, dict) and isinstance(category2, str) else None
+        
+        if level2 is None:
+            labels[category1] = None
+        if category2 not in (level2 if isinstance(level2, dict) else all_level2):
+            labels[category2] = None
+        for category3 in category.get('catetory3', []):
+            if category3 not in (level3 if isinstance(level3, dict) else all_level3):
+                labels[category3] = None
+    
+    return [label for label in labels if isinstance(label, str)]
+
+def prefetch_label_embeddings(
+    classifications: Iterable[Dict[str, Any]],
+    categories_json: Dict[str, Any],
+    taxonomy_index: Optional["TaxonomyIndex"]
+) -> None:
+    """
+    Embed all unknown labels of one or more classifications concurrently.
+    
+    calibrate_classification then finds every query embedding in the index's
+    memo, so calibrating a video costs one concurrent round of embedding
+    requests instead of one request per label in sequence.
+    
+    Args:
+        classifications: Items of the 'catetorys' list of one or more parsed results
+        categories_json: Categories JSON object
+        taxonomy_index: Taxonomy index whose query memo is filled; nothing is done without one
+    """
+    if taxonomy_index is None:
+        return
+    
+    labels = collect_unknown_labels(classifications, categories_json)
+    if not labels:
+        return
+    try:
+        taxonomy_index.embed_queries(labels)
+    except Exception as e:
+        # Calibration embeds whatever is missing itself and reports the error there
+        logger.warning(f"Error prefetching label embeddings: {e}")
+
 def parse_json_result(text: str, model_id: str = "amazon.nova-lite-v1:0", region: str = "us-east-1") -> Dict[str, Any]:
     """
     Parse JSON result from text.
     
+    Malformed JSON is first repaired locally (code fences, trailing commas, single
+    quotes, Python literals, truncated brackets); the model is only asked to fix
+    the JSON when the local repair fails. See get_json_repair_stats for how often
+    each path is taken.
+    
     Args:
         text: Text containing JSON
         model_id: Model ID for fixing JSON if needed
@@ -364,6 +915,7 @@ def parse_json_result(text: str, model_id: str = "amazon.nova-lite-v1:0", region
     Returns:
         Parsed JSON object
     """
+    fallback = False
     try:
         # Try to extract JSON from text
         json_start = text.find('{')
@@ -372,52 +924,78 @@ def parse_json_result(text: str, model_id: str = "amazon.nova-lite-v1:0", region
         if json_start >= 0 and json_end > json_start:
             json_text = text[json_start:json_end]
             try:
-                return json.loads(json_text)
+                result = json.loads(json_text)
+                record_parse_outcome('strict')
+                return result
             except json.JSONDecodeError:
-                # JSON is invalid, try to fix with Nova Lite
-                bedrock_client = boto3.client('bedrock-runtime', region_name=region)
-                
-                prompt = f"""
-                The following text contains a JSON object that is not properly formatted.
-                Please fix the JSON formatting issues and return only the corrected JSON object.
-                
-                ```
-                {json_text}
-                ```
-                """
-                
-                system = "You are a helpful assistant that specializes in fixing JSON formatting issues."
-                
-                request = {
-                    "modelId": model_id,
-                    "system": [{"text": system}],
-                    "messages": [{"role": "user", "content": [{"text": prompt}]}],
-                    "inferenceConfig": {
-                        "maxTokens": 512,
-                        "temperature": 0.0,
-                        "topP": 1.0
-                    }
-                }
-                
-                response = bedrock_client.converse(**request)
-                fixed_json_text = response['output']['message']['content'][0]['text']
-                
-                # Sleep to avoid hitting API rate limits
-                logger.info("Sleeping for 1 second to avoid API rate limits")
-                time.sleep(1.0)
-                
-                # Extract JSON from the fixed text
-                json_start = fixed_json_text.find('{')
-                json_end = fixed_json_text.rfind('}') + 1
-                
-                if json_start >= 0 and json_end > json_start:
-                    fixed_json_text = fixed_json_text[json_start:json_end]
-                    return json.loads(fixed_json_text)
-                else:
-                    raise ValueError("Could not extract JSON from fixed text")
-        else:
+                pass
+        elif json_start < 0:
+            record_parse_outcome('failed')
             raise ValueError("No JSON object found in text")
+        else:
+            # Opening brace without a closing one: the response was truncated
+            json_text = text[json_start:]
+        
+        try:
+            result, rules = repair_json(text)
+            if isinstance(result, dict):
+                record_parse_outcome('repaired')
+                for rule in rules:
+                    record_parse_outcome(rule)
+                logger.info(f"Repaired JSON locally with rules: {', '.join(rules)}")
+                return result
+            record_parse_outcome('repaired_not_object')
+            logger.info(f"Local repair produced a {type(result).__name__}, not an object; asking {model_id} to fix it")
+        except ValueError as e:
+            logger.info(f"{e}; asking {model_id} to fix it")
+        
+        # JSON is invalid, try to fix with Nova Lite
+        record_parse_outcome('llm_fallback')
+        fallback = True
+        bedrock_client = get_client('bedrock-runtime', region)
+        
+        prompt = f"""
+        The following text contains a JSON object that is not properly formatted.
+        Please fix the JSON formatting issues and return only the corrected JSON object.
+        
+        ```
+        {json_text}
+        ```
+        """
+        
+        system = "You are a helpful assistant that specializes in fixing JSON formatting issues."
+        
+        request = {
+            "modelId": model_id,
+            "system": [{"text": system}],
+            "messages": [{"role": "user", "content": [{"text": prompt}]}],
+            "inferenceConfig": {
+                "maxTokens": 512,
+                "temperature": 0.0,
+                "topP": 1.0
+            }
+        }
+        
+        response = get_governor(model_id).call(
+            lambda: bedrock_client.converse(**request),
+            estimated_tokens=estimate_tokens(prompt + system) + 512,
+            count_tokens=count_converse_tokens
+        )
+        fixed_json_text = response['output']['message']['content'][0]['text']
+        
+        # Extract JSON from the fixed text
+        json_start = fixed_json_text.find('{')
+        json_end = fixed_json_text.rfind('}') + 1
+        
+        if json_start >= 0 and json_end > json_start:
+            fixed_json_text = fixed_json_text[json_start:json_end]
+            return json.loads(fixed_json_text)
+        else:
+            raise ValueError("Could not extract JSON from fixed text")
             
     except Exception as e:
+        # A response the model could not fix either counts as failed, like one without JSON
+        if fallback:
+            record_parse_outcome('failed')
         logger.error(f"Error parsing JSON result: {e}")
         raise
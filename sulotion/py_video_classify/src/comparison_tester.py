@@ -6,16 +6,36 @@ import json
 import csv
 import logging
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 from typing import Dict, Any, List, Tuple, Optional
 
-from .video_classifier import VideoClassifier, TwoStepVideoClassifier
+from .video_classifier import VideoClassifier, TwoStepVideoClassifier, OUTPUT_CSV_COLUMNS
+from .result_store import ResultStore, store_path_for
 from .video_evaluator import VideoEvaluator
+from .metrics import LatencyRecorder
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+SUMMARY_COLUMNS = [
+    'Model ID', 
+    'Method',
+    'Overall Accuracy',
+    'Category Accuracy',
+    'Tag Accuracy',
+    'Average Processing Time (s)',
+    'Total Input Tokens',
+    'Total Output Tokens',
+    'P50 Latency (s)',
+    'P95 Latency (s)',
+    'P99 Latency (s)',
+    'Tokens per Second',
+    'Failed Videos'
+]
+
 class ComparisonTester:
     """Comparison tester class."""
     
@@ -24,7 +44,13 @@ class ComparisonTester:
         videos_csv: str,
         ground_truth_csv: str,
         output_dir: str = "comparison_results",
-        region: str = "us-east-1"
+        region: str = "us-east-1",
+        prompt_path: str = "prompt/one_step_prompt.md",
+        first_prompt_path: str = "prompt/two_step1_prompt.md",
+        second_prompt_path: str = "prompt/two_stop2_prompt.md",
+        categories_path: str = "category.json",
+        model_concurrency: int = 4,
+        output_format: str = "csv"
     ):
         """
         Initialize the comparison tester.
@@ -34,35 +60,91 @@ class ComparisonTester:
             ground_truth_csv: Path to ground truth CSV
             output_dir: Directory to store output files
             region: AWS region
+            prompt_path: Path to the prompt file of the one-step method
+            first_prompt_path: Path to the first prompt file of the two-step method
+            second_prompt_path: Path to the second prompt file of the two-step method
+            categories_path: Path to the categories JSON file
+            model_concurrency: Videos classified at once per model, shared by all
+                methods running on that model
+            output_format: 'csv' to append classification rows to CSV files, or
+                'parquet' to buffer them in result stores and export the CSVs once
         """
         self.videos_csv = videos_csv
         self.ground_truth_csv = ground_truth_csv
         self.output_dir = output_dir
         self.region = region
+        self.prompt_path = prompt_path
+        self.first_prompt_path = first_prompt_path
+        self.second_prompt_path = second_prompt_path
+        self.categories_path = categories_path
+        self.model_concurrency = model_concurrency
+        self.output_format = output_format
+        self._summary_lock = threading.Lock()
         
         # Create output directory if it doesn't exist
         os.makedirs(self.output_dir, exist_ok=True)
         
         # Create summary CSV
         self.summary_csv = os.path.join(self.output_dir, "comparison_summary.csv")
+        if os.path.exists(self.summary_csv):
+            with open(self.summary_csv, 'r', newline='', encoding='utf-8') as f:
+                header = next(csv.reader(f), [])
+            if header != SUMMARY_COLUMNS:
+                # Summaries written before the latency columns existed cannot be appended to
+                legacy_csv = f"{self.summary_csv}.old"
+                os.replace(self.summary_csv, legacy_csv)
+                logger.warning(f"Moved summary CSV with outdated columns to {legacy_csv}")
+        
         if not os.path.exists(self.summary_csv):
             try:
                 with open(self.summary_csv, 'w', newline='', encoding='utf-8') as f:
                     writer = csv.writer(f)
-                    writer.writerow([
-                        'Model ID', 
-                        'Method',
-                        'Overall Accuracy',
-                        'Category Accuracy',
-                        'Tag Accuracy',
-                        'Average Processing Time (s)',
-                        'Total Input Tokens',
-                        'Total Output Tokens'
-                    ])
+                    writer.writerow(SUMMARY_COLUMNS)
             except Exception as e:
                 logger.error(f"Error creating summary CSV {self.summary_csv}: {e}")
                 raise
     
+    def _create_classifier(
+        self,
+        model_id: str,
+        method: str,
+        output_csv: str,
+        result_store: Optional[ResultStore] = None
+    ) -> VideoClassifier:
+        """
+        Create the classifier of one (model, method) combination.
+        
+        Args:
+            model_id: Model ID
+            method: Classification method (one_step, two_step or keyframes)
+            output_csv: Path to the classification CSV
+            result_store: Store that receives the results instead of the CSV
+            
+        Returns:
+            Video classifier
+        """
+        if method in ("one_step", "keyframes"):
+            # keyframes is the one-step method with keyframe images instead of the video
+            return VideoClassifier(
+                prompt_path=self.prompt_path,
+                model_id=model_id,
+                region=self.region,
+                output_csv=output_csv,
+                categories_path=self.categories_path,
+                input_mode="keyframes" if method == "keyframes" else "video",
+                result_store=result_store
+            )
+        else:  # two_step
+            return TwoStepVideoClassifier(
+                first_prompt_path=self.first_prompt_path,
+                second_prompt_path=self.second_prompt_path,
+                model_id=model_id,
+                region=self.region,
+                output_csv=output_csv,
+                categories_path=self.categories_path,
+                result_store=result_store
+            )
+    
     def run_comparison(
         self,
         model_ids: List[str] = ["amazon.nova-lite-v1:0", "amazon.nova-v1:0"],
@@ -71,6 +153,13 @@ class ComparisonTester:
         """
         Run comparison tests.
         
+        All (model, method) combinations run at the same time. Each model has its
+        own worker pool of model_concurrency threads, so the combinations of one
+        model share that model's budget while different models proceed
+        independently. Each combination uses its own model or prompts, so the
+        combinations never send the same request; the LLM response cache only
+        spares requests repeated from an earlier run.
+        
         Args:
             model_ids: List of model IDs to test
             methods: List of methods to test
@@ -83,104 +172,138 @@ class ComparisonTester:
             videos_df = pd.read_csv(self.videos_csv)
             s3_uris = videos_df['S3 URI'].tolist()
             
-            results = {}
+            model_pools = {
+                model_id: ThreadPoolExecutor(max_workers=self.model_concurrency, thread_name_prefix=f"compare-{model_id}")
+                for model_id in model_ids
+            }
+            combinations = [(model_id, method) for model_id in model_ids for method in methods]
             
-            for model_id in model_ids:
-                for method in methods:
-                    logger.info(f"Testing model {model_id} with method {method}")
-                    
-                    # Create output files
-                    output_prefix = f"{model_id.replace('.', '_').replace(':', '_')}_{method}"
-                    classification_csv = os.path.join(self.output_dir, f"{output_prefix}_classification.csv")
-                    evaluation_csv = os.path.join(self.output_dir, f"{output_prefix}_evaluation.csv")
-                    
-                    # Create classifier
-                    if method == "one_step":
-                        classifier = VideoClassifier(
-                            prompt_path="prompt.md",
-                            model_id=model_id,
-                            region=self.region,
-                            output_csv=classification_csv
-                        )
-                    else:  # two_step
-                        classifier = TwoStepVideoClassifier(
-                            first_prompt_path="first_prompt.md",
-                            second_prompt_path="second_prompt.md",
-                            model_id=model_id,
-                            region=self.region,
-                            output_csv=classification_csv
-                        )
-                    
-                    # Classify videos
-                    classification_results = []
-                    processing_times = []
-                    total_input_tokens = 0
-                    total_output_tokens = 0
-                    
-                    for s3_uri in s3_uris:
-                        start_time = time.time()
-                        result = classifier.classify_video(s3_uri)
-                        end_time = time.time()
-                        
-                        processing_time = end_time - start_time
-                        processing_times.append(processing_time)
-                        
-                        total_input_tokens += result['token_usage'].get('input_tokens', 0)
-                        total_output_tokens += result['token_usage'].get('output_tokens', 0)
-                        
-                        classification_results.append(result)
-                        
-                        logger.info(f"Classified {s3_uri} in {processing_time:.2f} seconds")
-                    
-                    # Create evaluator
-                    evaluator = VideoEvaluator(
-                        classification_csv=classification_csv,
-                        ground_truth_csv=self.ground_truth_csv,
-                        model_id=model_id,
-                        region=self.region,
-                        output_csv=evaluation_csv
-                    )
-                    
-                    # Evaluate results
-                    evaluation_result = evaluator.evaluate_all()
-                    
-                    # Calculate average processing time
-                    avg_processing_time = sum(processing_times) / len(processing_times) if processing_times else 0
-                    
-                    # Store results
-                    results[f"{model_id}_{method}"] = {
-                        'model_id': model_id,
-                        'method': method,
-                        'overall_accuracy': evaluation_result['overall_accuracy'],
-                        'category_accuracy': evaluation_result['category_accuracy'],
-                        'tag_accuracy': evaluation_result['tag_accuracy'],
-                        'avg_processing_time': avg_processing_time,
-                        'total_input_tokens': total_input_tokens,
-                        'total_output_tokens': total_output_tokens,
-                        'classification_results': classification_results,
-                        'evaluation_result': evaluation_result
+            results = {}
+            try:
+                with ThreadPoolExecutor(max_workers=len(combinations) or 1) as runner:
+                    futures = {
+                        runner.submit(self._run_combination, model_id, method, s3_uris, model_pools[model_id]): (model_id, method)
+                        for model_id, method in combinations
                     }
-                    
-                    # Write to summary CSV
-                    with open(self.summary_csv, 'a', newline='', encoding='utf-8') as f:
-                        writer = csv.writer(f)
-                        writer.writerow([
-                            model_id,
-                            method,
-                            evaluation_result['overall_accuracy'],
-                            evaluation_result['category_accuracy'],
-                            evaluation_result['tag_accuracy'],
-                            avg_processing_time,
-                            total_input_tokens,
-                            total_output_tokens
-                        ])
+                    for future in as_completed(futures):
+                        model_id, method = futures[future]
+                        results[f"{model_id}_{method}"] = future.result()
+            finally:
+                for pool in model_pools.values():
+                    pool.shutdown(wait=False, cancel_futures=True)
             
-            return results
+            # Keep the matrix order in the returned results
+            return {f"{model_id}_{method}": results[f"{model_id}_{method}"] for model_id, method in combinations}
             
         except Exception as e:
             logger.error(f"Error running comparison tests: {e}")
             raise
     
+    def _run_combination(
+        self,
+        model_id: str,
+        method: str,
+        s3_uris: List[str],
+        pool: ThreadPoolExecutor
+    ) -> Dict[str, Any]:
+        """
+        Classify and evaluate all videos with one (model, method) combination.
+        
+        Args:
+            model_id: Model ID
+            method: Classification method
+            s3_uris: S3 URIs of the videos
+            pool: Worker pool of the model
+            
+        Returns:
+            Results of the combination
+        """
+        logger.info(f"Testing model {model_id} with method {method}")
+        
+        # Create output files
+        output_prefix = f"{model_id.replace('.', '_').replace(':', '_')}_{method}"
+        classification_csv = os.path.join(self.output_dir, f"{output_prefix}_classification.csv")
+        evaluation_csv = os.path.join(self.output_dir, f"{output_prefix}_evaluation.csv")
+        
+        # Create classifier
+        result_store = None
+        if self.output_format == 'parquet':
+            result_store = ResultStore(store_path_for(classification_csv), columns=OUTPUT_CSV_COLUMNS)
+        classifier = self._create_classifier(model_id, method, classification_csv, result_store)
+        latency = LatencyRecorder(f"{model_id}/{method}")
+        
+        def classify(s3_uri: str) -> Dict[str, Any]:
+            with latency.timer() as timer:
+                result = classifier.classify_video(s3_uri)
+                timer.tokens(result['token_usage'])
+            logger.info(f"Classified {s3_uri} with {model_id}/{method} in {time.monotonic() - timer.start:.2f} seconds")
+            return result
+        
+        # Classify videos; the classifier serializes its own CSV writes
+        classification_results = []
+        for s3_uri, future in [(s3_uri, pool.submit(classify, s3_uri)) for s3_uri in s3_uris]:
+            try:
+                classification_results.append(future.result())
+            except Exception as e:
+                logger.error(f"Error classifying {s3_uri} with {model_id}/{method}: {e}")
+        
+        # The evaluator reads the store directly; the CSV is kept for other tools
+        if result_store is not None:
+            result_store.close()
+            result_store.export_csv(classification_csv, order=s3_uris)
+        
+        # Create evaluator
+        evaluator = VideoEvaluator(
+            classification_csv=result_store.path if result_store is not None else classification_csv,
+            ground_truth_csv=self.ground_truth_csv,
+            model_id=model_id,
+            region=self.region,
+            output_csv=evaluation_csv
+        )
+        
+        # Evaluate results
+        evaluation_result = evaluator.evaluate_all()
+        stats = latency.summary()
+        
+        # Write to summary CSV
+        with self._summary_lock, open(self.summary_csv, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow([
+                model_id,
+                method,
+                evaluation_result['overall_accuracy'],
+                evaluation_result['category_accuracy'],
+                evaluation_result['tag_accuracy'],
+                stats['mean_latency_s'],
+                stats['input_tokens'],
+                stats['output_tokens'],
+                stats['p50_latency_s'],
+                stats['p95_latency_s'],
+                stats['p99_latency_s'],
+                stats['tokens_per_second'],
+                stats['failures']
+            ])
+        
+        logger.info(f"Finished {model_id}/{method}: {stats}")
+        
+        return {
+            'model_id': model_id,
+            'method': method,
+            'overall_accuracy': evaluation_result['overall_accuracy'],
+            'category_accuracy': evaluation_result['category_accuracy'],
+            'tag_accuracy': evaluation_result['tag_accuracy'],
+            'avg_processing_time': stats['mean_latency_s'],
+            'p50_latency': stats['p50_latency_s'],
+            'p95_latency': stats['p95_latency_s'],
+            'p99_latency': stats['p99_latency_s'],
+            'tokens_per_second': stats['tokens_per_second'],
+            'total_input_tokens': stats['input_tokens'],
+            'total_output_tokens': stats['output_tokens'],
+            'failed_videos': stats['failures'],
+            'classification_results': classification_results,
+            'evaluation_result': evaluation_result
+        }
+    
     def generate_report(self) -> str:
         """
         Generate a comparison report.
@@ -199,11 +322,11 @@ class ComparisonTester:
             report = "# Video Classification Comparison Report\n\n"
             
             report += "## Summary\n\n"
-            report += "| Model ID | Method | Overall Accuracy | Category Accuracy | Tag Accuracy | Avg Processing Time (s) | Total Input Tokens | Total Output Tokens |\n"
-            report += "|----------|--------|-----------------|-------------------|-------------|------------------------|-------------------|-------------------|\n"
+            report += "| Model ID | Method | Overall Accuracy | Category Accuracy | Tag Accuracy | Avg Processing Time (s) | P50 / P95 / P99 Latency (s) | Tokens per Second | Total Input Tokens | Total Output Tokens |\n"
+            report += "|----------|--------|-----------------|-------------------|-------------|------------------------|-----------------------------|-------------------|-------------------|-------------------|\n"
             
             for _, row in summary_df.iterrows():
-                report += f"| {row['Model ID']} | {row['Method']} | {row['Overall Accuracy']:.4f} | {row['Category Accuracy']:.4f} | {row['Tag Accuracy']:.4f} | {row['Average Processing Time (s)']:.2f} | {row['Total Input Tokens']} | {row['Total Output Tokens']} |\n"
+                report += f"| {row['Model ID']} | {row['Method']} | {row['Overall Accuracy']:.4f} | {row['Category Accuracy']:.4f} | {row['Tag Accuracy']:.4f} | {row['Average Processing Time (s)']:.2f} | {row['P50 Latency (s)']:.2f} / {row['P95 Latency (s)']:.2f} / {row['P99 Latency (s)']:.2f} | {row['Tokens per Second']:.1f} | {row['Total Input Tokens']} | {row['Total Output Tokens']} |\n"
             
             report += "\n## Analysis\n\n"
             
@@ -233,6 +356,18 @@ class ComparisonTester:
                 else:
                     report += "The one-step method achieves comparable or better accuracy with faster processing times.\n\n"
             
+            # Compare video input with keyframe input
+            keyframes_df = summary_df[summary_df['Method'] == 'keyframes']
+            
+            if not one_step_df.empty and not keyframes_df.empty:
+                report += "### Input Mode Comparison\n\n"
+                report += f"- Video input average accuracy: {one_step_df['Overall Accuracy'].mean():.4f}\n"
+                report += f"- Keyframe input average accuracy: {keyframes_df['Overall Accuracy'].mean():.4f}\n"
+                report += f"- Video input average input tokens: {one_step_df['Total Input Tokens'].mean():.0f}\n"
+                report += f"- Keyframe input average input tokens: {keyframes_df['Total Input Tokens'].mean():.0f}\n"
+                report += f"- Video input average processing time: {one_step_df['Average Processing Time (s)'].mean():.2f} seconds\n"
+                report += f"- Keyframe input average processing time: {keyframes_df['Average Processing Time (s)'].mean():.2f} seconds\n\n"
+            
             # Compare models
             report += "### Model Comparison\n\n"
             
@@ -0,0 +1,373 @@
+"""
+Content fingerprints and a local index for reusing the results of duplicate videos.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import subprocess
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+
+from .aws_clients import get_client
+from .mp4 import read_mp4_duration
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def dhash(frames: np.ndarray) -> np.ndarray:
+    """
+    Compute the difference hash of grayscale frames.
+    
+    Args:
+        frames: Array of shape (frames, 8, 9) with 8x9 grayscale thumbnails
+    
+    Returns:
+        One 64-bit hash per frame; bit i is set when pixel i is brighter than
+        its right neighbour
+    """
+    bits = frames[:, :, 1:] > frames[:, :, :-1]
+    return np.packbits(bits.reshape(len(frames), 64), axis=1).view('>u8').ravel().astype(np.uint64)
+
+def hamming_distances(hashes: np.ndarray, signature: np.ndarray) -> np.ndarray:
+    """
+    Compute the mean Hamming distance per frame between signatures.
+    
+    Args:
+        hashes: Array of shape (videos, frames) of per-frame hashes
+        signature: Array of shape (frames,) to compare against
+    
+    Returns:
+        Mean number of differing bits per frame for each video
+    """
+    differing = np.bitwise_xor(hashes, signature)
+    bits = np.unpackbits(differing.view(np.uint8).reshape(len(hashes), -1), axis=1).sum(axis=1)
+    return bits / signature.shape[0]
+
+def extract_dhash(
+    source: str,
+    frames: int = 8,
+    max_duration: int = 30,
+    duration: Optional[float] = None,
+    timeout: float = 120.0
+) -> Optional[np.ndarray]:
+    """
+    Compute a perceptual signature from frames sampled evenly over a video.
+    
+    ffmpeg decodes the sampled frames straight into 9x8 grayscale thumbnails,
+    so no images are encoded or written. Copies of a clip re-encoded at another
+    bitrate or resolution get signatures only a few bits apart.
+    
+    When the duration is known, ffmpeg seeks to one point in the middle of each
+    of frames equal slices of the whole video, so only the data around those
+    points is read and decoded and videos sharing an intro still differ.
+    Otherwise the first max_duration seconds are decoded and sampled.
+    
+    Args:
+        source: Local path or URL ffmpeg reads the video from
+        frames: Number of frames in the signature
+        max_duration: Seconds sampled when the duration is unknown
+        duration: Duration of the video if known
+        timeout: Seconds to wait for ffmpeg
+    
+    Returns:
+        Per-frame hashes, or None if fewer than frames frames were decoded
+    """
+    cmd = ['ffmpeg', '-v', 'error', '-nostdin']
+    if duration:
+        # One input per sample point, each seeked and cut to its first frame
+        for index in range(frames):
+            cmd += ['-ss', f"{duration * (index + 0.5) / frames:.3f}", '-i', source]
+        chains = ';'.join(
+            f"[{index}:v:0]trim=end_frame=1,scale=9:8:flags=area,format=gray[v{index}]" for index in range(frames)
+        )
+        inputs = ''.join(f"[v{index}]" for index in range(frames))
+        cmd += [
+            '-filter_complex', f"{chains};{inputs}concat=n={frames}:v=1:a=0,setpts=N/TB[out]",
+            '-map', '[out]', '-fps_mode', 'passthrough'
+        ]
+    else:
+        cmd += [
+            '-t', str(max_duration), '-i', source,
+            '-an', '-vf', f"fps={frames}/{max_duration},scale=9:8:flags=area,format=gray"
+        ]
+    cmd += ['-f', 'rawvideo', 'pipe:1']
+    result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        error = result.stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {error}")
+    
+    decoded = len(result.stdout) // 72
+    if decoded < frames:
+        logger.warning(f"Only {decoded} of {frames} frames decoded from {source}")
+        return None
+    thumbnails = np.frombuffer(result.stdout[:frames * 72], dtype=np.uint8).reshape(frames, 8, 9)
+    return dhash(thumbnails)
+
+class DedupIndex:
+    """
+    Index of classified videos keyed by content fingerprints.
+    
+    A video is looked up by its S3 ETag and size, which identifies exact
+    re-uploads with a single head_object call. A copy of a video that is still
+    being classified waits for that result instead of being classified again.
+    With perceptual matching enabled, a miss then computes a signature from
+    sampled frames and compares it against the signatures of all indexed
+    videos, which catches re-encoded copies. Entries are stored per namespace,
+    so results are only reused between runs with the same model, prompts and
+    settings.
+    """
+    
+    def __init__(
+        self,
+        path: str = ".cache/video_dedup.sqlite3",
+        region: str = "us-east-1",
+        max_distance: float = 6.0,
+        frames: int = 8,
+        max_duration: int = 30,
+        perceptual: bool = False
+    ):
+        """
+        Initialize the index.
+        
+        Args:
+            path: Path to the SQLite index file
+            region: AWS region
+            max_distance: Largest mean number of differing bits per 64-bit frame
+                hash for two videos to count as the same content
+            frames: Number of frames in a perceptual signature
+            max_duration: Seconds sampled for a signature when the duration of
+                the video cannot be read
+            perceptual: Whether to fall back to perceptual signatures when the
+                ETag and size do not match
+        """
+        self.path = path
+        self.region = region
+        self.max_distance = max_distance
+        self.frames = frames
+        self.max_duration = max_duration
+        self.perceptual = perceptual
+        self.stats = {'exact_hits': 0, 'similar_hits': 0, 'in_flight_hits': 0, 'misses': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        # Content being classified, keyed by (namespace, content key): (URI, Future set once it is indexed or released)
+        self._in_flight: Dict[Tuple[str, str], Tuple[str, Future]] = {}
+        # Signatures of each namespace, loaded on first use: (URIs, array of shape (videos, frames))
+        self._signatures: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS videos ("
+            "namespace TEXT NOT NULL, "
+            "s3_uri TEXT NOT NULL, "
+            "content_key TEXT, "
+            "signature BLOB, "
+            "source_uri TEXT NOT NULL, "
+            "result TEXT NOT NULL, "
+            "created REAL NOT NULL, "
+            "PRIMARY KEY (namespace, s3_uri))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS videos_content_key ON videos (namespace, content_key)")
+        self._conn.commit()
+    
+    def content_key(self, s3_uri: str) -> str:
+        """
+        Get the exact-content key of a video.
+        
+        Args:
+            s3_uri: S3 URI of the video
+        
+        Returns:
+            ETag and size of the object
+        """
+        s3_client = get_client('s3', self.region)
+        bucket_name = s3_uri.split('/')[2]
+        object_key = '/'.join(s3_uri.split('/')[3:])
+        response = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+        etag = response['ETag'].strip('"')
+        return f"{etag}:{response['ContentLength']}"
+    
+    def signature(self, s3_uri: str) -> Optional[np.ndarray]:
+        """
+        Compute the perceptual signature of a video in S3 without downloading it.
+        
+        Args:
+            s3_uri: S3 URI of the video
+        
+        Returns:
+            Per-frame hashes, or None if the video has too few frames
+        """
+        s3_client = get_client('s3', self.region)
+        bucket_name = s3_uri.split('/')[2]
+        object_key = '/'.join(s3_uri.split('/')[3:])
+        source_url = s3_client.generate_presigned_url(
+            'get_object', Params={'Bucket': bucket_name, 'Key': object_key}, ExpiresIn=3600
+        )
+        duration = read_mp4_duration(s3_uri, region=self.region)
+        return extract_dhash(source_url, frames=self.frames, max_duration=self.max_duration, duration=duration)
+    
+    def _load_signatures(self, namespace: str) -> Tuple[List[str], np.ndarray]:
+        """Get the signatures of a namespace, reading them from the index once."""
+        if namespace not in self._signatures:
+            rows = self._conn.execute(
+                "SELECT s3_uri, signature FROM videos WHERE namespace = ? AND signature IS NOT NULL", (namespace,)
+            ).fetchall()
+            uris = [row[0] for row in rows if len(row[1]) == self.frames * 8]
+            hashes = np.array(
+                [np.frombuffer(row[1], dtype=np.uint64) for row in rows if len(row[1]) == self.frames * 8],
+                dtype=np.uint64
+            ).reshape(len(uris), self.frames)
+            self._signatures[namespace] = (uris, hashes)
+        return self._signatures[namespace]
+    
+    def _get_entry(self, namespace: str, s3_uri: str) -> Tuple[str, Dict[str, Any]]:
+        """Get the source URI and result of an indexed video."""
+        row = self._conn.execute(
+            "SELECT source_uri, result FROM videos WHERE namespace = ? AND s3_uri = ?", (namespace, s3_uri)
+        ).fetchone()
+        return row[0], json.loads(row[1])
+    
+    def lookup(
+        self,
+        namespace: str,
+        s3_uri: str
+    ) -> Tuple[Optional[Tuple[str, Dict[str, Any]]], Dict[str, Any]]:
+        """
+        Look for an indexed video with the same content.
+        
+        Args:
+            namespace: Namespace of the classifier settings
+            s3_uri: S3 URI of the video
+        
+        Returns:
+            Tuple of (match, fingerprint). match is (URI of the video the result
+            was classified from, stored result) or None; fingerprint is passed to
+            add once the video is classified, or to release if that fails.
+            Fingerprinting errors count as a miss.
+        """
+        fingerprint: Dict[str, Any] = {'content_key': None, 'signature': None}
+        try:
+            fingerprint['content_key'] = self.content_key(s3_uri)
+            key = (namespace, fingerprint['content_key'])
+            waited = False
+            while True:
+                with self._lock:
+                    row = self._conn.execute(
+                        "SELECT s3_uri FROM videos WHERE namespace = ? AND content_key = ? AND s3_uri != ? LIMIT 1",
+                        (namespace, fingerprint['content_key'], s3_uri)
+                    ).fetchone()
+                    if row is not None:
+                        self.stats['in_flight_hits' if waited else 'exact_hits'] += 1
+                        logger.info(f"{s3_uri} has the same content as {row[0]}")
+                        return self._get_entry(namespace, row[0]), fingerprint
+                    
+                    # Claim the content, or wait for the copy that claimed it; a
+                    # released claim (failed classification) is taken over by one waiter
+                    claim = self._in_flight.get(key)
+                    if claim is None or claim[0] == s3_uri:
+                        if claim is None:
+                            self._in_flight[key] = (s3_uri, Future())
+                            fingerprint['claimed'] = True
+                        break
+                
+                logger.info(f"{s3_uri} has the same content as {claim[0]}, which is being classified; waiting for it")
+                claim[1].result()
+                waited = True
+            
+            if self.perceptual:
+                fingerprint['signature'] = self.signature(s3_uri)
+                if fingerprint['signature'] is not None:
+                    with self._lock:
+                        uris, hashes = self._load_signatures(namespace)
+                        if uris:
+                            distances = hamming_distances(hashes, fingerprint['signature'])
+                            distances[[uri == s3_uri for uri in uris]] = np.inf
+                            nearest = int(np.argmin(distances))
+                            if distances[nearest] <= self.max_distance:
+                                self.stats['similar_hits'] += 1
+                                logger.info(f"{s3_uri} is similar to {uris[nearest]} (mean distance {distances[nearest]:.1f} bits)")
+                                return self._get_entry(namespace, uris[nearest]), fingerprint
+        except Exception as e:
+            logger.warning(f"Could not fingerprint {s3_uri}: {e}")
+            with self._lock:
+                self.stats['errors'] += 1
+        
+        with self._lock:
+            self.stats['misses'] += 1
+        return None, fingerprint
+    
+    def release(self, namespace: str, fingerprint: Dict[str, Any]) -> None:
+        """
+        Let copies waiting on a video go ahead, e.g. after its classification failed.
+        
+        Args:
+            namespace: Namespace of the classifier settings
+            fingerprint: Fingerprint returned by lookup
+        """
+        if not fingerprint.pop('claimed', False):
+            return
+        with self._lock:
+            claim = self._in_flight.pop((namespace, fingerprint['content_key']), None)
+        if claim is not None:
+            claim[1].set_result(None)
+    
+    def add(
+        self,
+        namespace: str,
+        s3_uri: str,
+        fingerprint: Dict[str, Any],
+        result: Dict[str, Any],
+        source_uri: Optional[str] = None
+    ) -> None:
+        """
+        Index a classified video.
+        
+        Args:
+            namespace: Namespace of the classifier settings
+            s3_uri: S3 URI of the video
+            fingerprint: Fingerprint returned by lookup
+            result: JSON-serializable result to reuse for duplicates
+            source_uri: URI the result was classified from, if it was reused
+        """
+        signature = fingerprint.get('signature')
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO videos "
+                "(namespace, s3_uri, content_key, signature, source_uri, result, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    namespace,
+                    s3_uri,
+                    fingerprint.get('content_key'),
+                    signature.astype(np.uint64).tobytes() if signature is not None else None,
+                    source_uri or s3_uri,
+                    json.dumps(result),
+                    time.time()
+                )
+            )
+            self._conn.commit()
+            
+            if signature is not None and namespace in self._signatures:
+                uris, hashes = self._signatures[namespace]
+                if s3_uri not in uris:
+                    uris.append(s3_uri)
+                    self._signatures[namespace] = (uris, np.vstack([hashes, signature[np.newaxis]]))
+        
+        # Copies waiting on this video now find it by its content key
+        self.release(namespace, fingerprint)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get the lookup counters.
+        
+        Returns:
+            Exact hits, similar hits, hits on copies that were being classified,
+            misses and fingerprinting errors
+        """
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,178 @@
+"""
+Deterministic local repair of malformed JSON in model responses.
+"""
+import re
+import json
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Any, List, Tuple, Callable
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_stats_lock = threading.Lock()
+_stats: Counter = Counter()
+
+def record_parse_outcome(outcome: str) -> None:
+    """
+    Count how a response was parsed.
+    
+    Args:
+        outcome: Outcome name, e.g. 'strict', 'llm_fallback' or a repair rule name
+    """
+    with _stats_lock:
+        _stats[outcome] += 1
+
+def get_json_repair_stats() -> Dict[str, int]:
+    """
+    Get the parse outcome counters.
+    
+    Returns:
+        Mapping of outcome name to count: 'strict' for responses that parsed as-is,
+        'repaired' plus one entry per repair rule that fired, 'repaired_not_object'
+        when the repair produced something other than an object, 'llm_fallback'
+        for responses sent to the model, and 'failed' for responses without JSON
+        or that the model could not fix either
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+def strip_code_fences(text: str) -> str:
+    """Keep only the body of a ```json fenced block."""
+    match = re.search(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|$)", text, re.DOTALL)
+    return match.group(1).strip() if match else text
+
+def extract_object(text: str) -> str:
+    """Drop prose before the first '{' or '[' and after the last closing bracket."""
+    starts = [i for i in (text.find('{'), text.find('[')) if i >= 0]
+    if not starts:
+        return text
+    text = text[min(starts):]
+    end = max(text.rfind('}'), text.rfind(']'))
+    # Without any closing bracket the object is truncated; keep it whole for close_brackets
+    return text[:end + 1] if end >= 0 and _is_balanced(text[:end + 1]) else text
+
+def convert_single_quotes(text: str) -> str:
+    """Turn single-quoted strings into double-quoted ones and unescape \\' (not valid in JSON)."""
+    output = []
+    i = 0
+    in_double = False
+    while i < len(text):
+        char = text[i]
+        if in_double:
+            if char == '\\' and i + 1 < len(text):
+                output.append("'" if text[i + 1] == "'" else text[i:i + 2])
+                i += 1
+            else:
+                output.append(char)
+                if char == '"':
+                    in_double = False
+        elif char == '"':
+            in_double = True
+            output.append(char)
+        elif char == "'":
+            # Copy the single-quoted string, escaping any double quotes inside it
+            output.append('"')
+            i += 1
+            while i < len(text) and text[i] != "'":
+                if text[i] == '\\' and i + 1 < len(text):
+                    output.append("'" if text[i + 1] == "'" else text[i:i + 2])
+                    i += 2
+                    continue
+                output.append('\\"' if text[i] == '"' else text[i])
+                i += 1
+            output.append('"')
+        else:
+            output.append(char)
+        i += 1
+    return ''.join(output)
+
+def replace_python_literals(text: str) -> str:
+    """Replace True/False/None outside strings with their JSON spellings."""
+    parts = re.split(r'("(?:[^"\\]|\\.)*")', text)
+    for index in range(0, len(parts), 2):
+        parts[index] = re.sub(r'\bTrue\b', 'true', parts[index])
+        parts[index] = re.sub(r'\bFalse\b', 'false', parts[index])
+        parts[index] = re.sub(r'\bNone\b', 'null', parts[index])
+    return ''.join(parts)
+
+def remove_trailing_commas(text: str) -> str:
+    """Remove commas directly before a closing bracket."""
+    parts = re.split(r'("(?:[^"\\]|\\.)*")', text)
+    for index in range(0, len(parts), 2):
+        parts[index] = re.sub(r',(\s*[}\]])', r'\1', parts[index])
+    return ''.join(parts)
+
+def close_brackets(text: str) -> str:
+    """Close an unterminated string and any brackets left open by truncation."""
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]' and stack and stack[-1] == char:
+            stack.pop()
+    
+    if not stack and not in_string:
+        return text
+    
+    if in_string:
+        text += '"'
+    
+    # Drop a dangling separator or a key that never got its value
+    text = re.sub(r'\s*,\s*$', '', text)
+    text = re.sub(r',?\s*"(?:[^"\\]|\\.)*"\s*:\s*$', '', text)
+    return text + ''.join(reversed(stack))
+
+def _is_balanced(text: str) -> bool:
+    return close_brackets(text) == text
+
+REPAIR_RULES: List[Tuple[str, Callable[[str], str]]] = [
+    ('code_fences', strip_code_fences),
+    ('extract_object', extract_object),
+    ('single_quotes', convert_single_quotes),
+    ('python_literals', replace_python_literals),
+    ('trailing_commas', remove_trailing_commas),
+    ('close_brackets', close_brackets)
+]
+
+def repair_json(text: str) -> Tuple[Any, List[str]]:
+    """
+    Parse JSON from model output, applying local repair rules until it parses.
+    
+    Args:
+        text: Text containing a possibly malformed JSON object
+    
+    Returns:
+        Tuple of (parsed JSON, names of the rules that changed the text)
+    
+    Raises:
+        ValueError: If the text cannot be repaired
+    """
+    applied = []
+    for name, rule in REPAIR_RULES:
+        repaired = rule(text)
+        if repaired != text:
+            applied.append(name)
+            text = repaired
+            try:
+                return json.loads(text), applied
+            except json.JSONDecodeError:
+                continue
+    
+    try:
+        return json.loads(text), applied
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Could not repair JSON locally: {e}")
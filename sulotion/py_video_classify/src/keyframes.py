@@ -0,0 +1,141 @@
+"""
+Keyframe extraction module.
+"""
+import functools
+import logging
+import subprocess
+from typing import List, Tuple
+import numpy as np
+
+from .aws_clients import get_client
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+JPEG_START = b'\xff\xd8\xff'
+
+def split_jpeg_stream(data: bytes) -> List[bytes]:
+    """
+    Split the concatenated JPEGs written by ffmpeg's image2pipe muxer.
+    
+    Args:
+        data: Concatenated JPEG images
+    
+    Returns:
+        List of JPEG images
+    """
+    starts = []
+    offset = data.find(JPEG_START)
+    while offset != -1:
+        starts.append(offset)
+        offset = data.find(JPEG_START, offset + len(JPEG_START))
+    return [data[start:end] for start, end in zip(starts, starts[1:] + [len(data)])]
+
+def sample_evenly(frames: List[bytes], max_frames: int) -> List[bytes]:
+    """
+    Keep at most max_frames frames spread evenly over the list.
+    
+    Args:
+        frames: Frames in chronological order
+        max_frames: Maximum number of frames to keep
+    
+    Returns:
+        Selected frames, first and last included
+    """
+    if len(frames) <= max_frames:
+        return frames
+    indices = np.unique(np.linspace(0, len(frames) - 1, max_frames).round().astype(int))
+    return [frames[index] for index in indices]
+
+def extract_keyframes(
+    source: str,
+    max_frames: int = 8,
+    max_duration: int = 30,
+    scene_threshold: float = 0.3,
+    width: int = 512,
+    quality: int = 5,
+    timeout: float = 120.0
+) -> List[bytes]:
+    """
+    Extract scene-change keyframes of a video as downscaled JPEGs.
+    
+    A single ffmpeg pass selects the first frame, every frame whose scene-change
+    score exceeds the threshold, and a frame whenever no frame was selected for
+    max_duration / max_frames seconds, so static videos are still covered. The
+    frames are piped back as JPEGs and thinned out evenly to max_frames.
+    
+    Args:
+        source: Local path or URL ffmpeg reads the video from (e.g. a presigned S3 URL)
+        max_frames: Maximum number of frames to return
+        max_duration: Only the first max_duration seconds are sampled
+        scene_threshold: Scene-change score (0-1) above which a frame is selected
+        width: Width of the frames in pixels; the aspect ratio is kept
+        quality: JPEG quality scale of ffmpeg (2 is best, 31 is worst)
+        timeout: Seconds to wait for ffmpeg
+    
+    Returns:
+        JPEG images in chronological order
+    """
+    interval = max_duration / max(1, max_frames)
+    select = (
+        f"select='eq(n,0)+gt(scene,{scene_threshold})"
+        f"+gte(t-prev_selected_t,{interval})',"
+        f"scale='min({width},iw)':-2"
+    )
+    cmd = [
+        'ffmpeg', '-v', 'error', '-nostdin',
+        '-t', str(max_duration), '-i', source,
+        '-an', '-vf', select, '-vsync', 'vfr',
+        '-q:v', str(quality), '-f', 'image2pipe', '-vcodec', 'mjpeg', 'pipe:1'
+    ]
+    result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        error = result.stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"ffmpeg exited with code {result.returncode}: {error}")
+    
+    frames = split_jpeg_stream(result.stdout)
+    if not frames:
+        raise RuntimeError(f"No frames extracted from {source}")
+    
+    selected = sample_evenly(frames, max_frames)
+    logger.info(f"Extracted {len(selected)} of {len(frames)} candidate keyframes ({sum(map(len, selected))} bytes)")
+    return selected
+
+@functools.lru_cache(maxsize=32)
+def get_keyframes(
+    s3_uri: str,
+    region: str = "us-east-1",
+    max_frames: int = 8,
+    max_duration: int = 30,
+    width: int = 512
+) -> Tuple[bytes, ...]:
+    """
+    Extract the keyframes of a video in S3 without downloading it first.
+    
+    ffmpeg reads the video over a presigned URL, fetching only the ranges it
+    needs. The two-step classifier passes the frames from step 1 to step 2
+    itself; the few recent results kept in memory only spare comparison runs
+    that send the same video to several models a second extraction.
+    
+    Args:
+        s3_uri: S3 URI of the video
+        region: AWS region
+        max_frames: Maximum number of frames to return
+        max_duration: Only the first max_duration seconds are sampled
+        width: Width of the frames in pixels
+    
+    Returns:
+        JPEG images in chronological order
+    """
+    try:
+        s3_client = get_client('s3', region)
+        bucket_name = s3_uri.split('/')[2]
+        object_key = '/'.join(s3_uri.split('/')[3:])
+        source_url = s3_client.generate_presigned_url(
+            'get_object', Params={'Bucket': bucket_name, 'Key': object_key}, ExpiresIn=3600
+        )
+        return tuple(extract_keyframes(source_url, max_frames=max_frames, max_duration=max_duration, width=width))
+    except Exception as e:
+        logger.error(f"Error extracting keyframes of {s3_uri}: {e}")
+        raise
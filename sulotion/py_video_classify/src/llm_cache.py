@@ -0,0 +1,227 @@
+"""
+Persistent cache for Bedrock LLM responses.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Tuple, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class LLMResponseCache:
+    """
+    Content-addressed on-disk cache of converse responses.
+    
+    Entries live in a SQLite file and are keyed on a hash of everything that
+    determines the response: model ID, prompt, system text, inference config and
+    the ETag of the input video. When the total size of the cached responses
+    exceeds ``max_bytes`` the least recently used entries are evicted.
+    """
+    
+    def __init__(
+        self,
+        path: str = ".cache/llm_responses.sqlite3",
+        max_bytes: int = 512 * 1024 * 1024,
+        enabled: bool = True
+    ):
+        """
+        Initialize the cache.
+        
+        Args:
+            path: Path to the SQLite cache file
+            max_bytes: Maximum total size of cached responses in bytes
+            enabled: Whether lookups and stores are performed at all
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._size_bytes = 0
+        
+        if self.enabled:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, "
+                "response_text TEXT NOT NULL, "
+                "token_usage TEXT NOT NULL, "
+                "size_bytes INTEGER NOT NULL, "
+                "last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            self._conn.commit()
+            self._size_bytes = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM responses").fetchone()[0]
+    
+    @staticmethod
+    def make_key(
+        model_id: str,
+        prompt: str,
+        system: str,
+        inference_config: Dict[str, Any],
+        etag: str = "",
+        extra: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Build the cache key for a request.
+        
+        Args:
+            model_id: Model ID
+            prompt: Prompt text
+            system: System prompt
+            inference_config: Inference configuration sent to converse
+            etag: ETag of the input video, empty if there is no video
+            extra: Any other request fields that change the response
+        
+        Returns:
+            Hex digest identifying the request
+        """
+        key_data = {
+            'model_id': model_id,
+            'prompt': hashlib.sha256(prompt.encode('utf-8')).hexdigest(),
+            'system': hashlib.sha256(system.encode('utf-8')).hexdigest(),
+            'inference_config': inference_config,
+            'etag': etag,
+            'extra': extra or {}
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, int]]]:
+        """
+        Look up a cached response.
+        
+        Args:
+            key: Cache key from make_key
+        
+        Returns:
+            Tuple of (response text, token usage) or None on a miss
+        """
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response_text, token_usage FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        
+        return row[0], json.loads(row[1])
+    
+    def put(self, key: str, response_text: str, token_usage: Dict[str, int]) -> None:
+        """
+        Store a response, evicting least recently used entries if over budget.
+        
+        Args:
+            key: Cache key from make_key
+            response_text: Response text
+            token_usage: Token usage of the original call
+        """
+        if not self.enabled:
+            return
+        
+        usage_text = json.dumps(token_usage)
+        size_bytes = len(response_text.encode('utf-8')) + len(usage_text)
+        
+        with self._lock:
+            previous = self._conn.execute("SELECT size_bytes FROM responses WHERE key = ?", (key,)).fetchone()
+            if previous is not None:
+                self._size_bytes -= previous[0]
+            
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response_text, token_usage, size_bytes, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response_text, usage_text, size_bytes, time.time())
+            )
+            self._size_bytes += size_bytes
+            
+            # Evict least recently used entries until the cache fits its budget
+            while self._size_bytes > self.max_bytes:
+                oldest = self._conn.execute(
+                    "SELECT key, size_bytes FROM responses ORDER BY last_access ASC LIMIT 1"
+                ).fetchone()
+                if oldest is None or oldest[0] == key:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (oldest[0],))
+                self._size_bytes -= oldest[1]
+            
+            self._conn.commit()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters.
+        
+        Returns:
+            Dictionary with hits, misses, hit rate, entry count and size in bytes
+        """
+        if not self.enabled:
+            return {'enabled': False, 'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'entries': 0, 'size_bytes': 0}
+        
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'enabled': True,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': entries,
+                'size_bytes': self._size_bytes
+            }
+    
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self.enabled = False
+
+_default_cache: Optional[LLMResponseCache] = None
+
+def configure_default_cache(
+    path: str = ".cache/llm_responses.sqlite3",
+    max_bytes: int = 512 * 1024 * 1024,
+    enabled: bool = True
+) -> Optional[LLMResponseCache]:
+    """
+    Set the cache used by call_bedrock_llm when no cache is passed explicitly.
+    
+    Args:
+        path: Path to the SQLite cache file
+        max_bytes: Maximum total size of cached responses in bytes
+        enabled: Whether to enable the cache; False removes the default cache
+    
+    Returns:
+        The configured cache, or None if disabled
+    """
+    global _default_cache
+    if _default_cache is not None:
+        _default_cache.close()
+    _default_cache = LLMResponseCache(path=path, max_bytes=max_bytes) if enabled else None
+    return _default_cache
+
+def get_default_cache() -> Optional[LLMResponseCache]:
+    """
+    Get the default response cache.
+    
+    Returns:
+        The default cache, or None if none has been configured
+    """
+    return _default_cache
@@ -6,19 +6,48 @@ import sys
 import argparse
 import logging
 import json
-import pandas as pd
+import signal
 import csv
-from typing import Dict, Any, List, Tuple, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Tuple, Optional, Iterable, Iterator
 
-from .common import call_bedrock_llm, video_to_text, calibrate_classification, parse_json_result
-from .video_classifier import VideoClassifier, TwoStepVideoClassifier
+from .common import video_to_text, transcribe_videos
+from .video_classifier import VideoClassifier, TwoStepVideoClassifier, OUTPUT_CSV_COLUMNS, INPUT_MODES
 from .video_evaluator import VideoEvaluator
 from .comparison_tester import ComparisonTester
+from .llm_cache import LLMResponseCache, configure_default_cache
+from .checkpoint import CheckpointJournal
+from .result_store import ResultStore, OUTPUT_FORMATS, store_path_for
+from .manifest import iter_manifest
+from .dedup import DedupIndex
+from .queue_worker import QueueWorker, InMemoryQueue
+from .aws_clients import configure_clients, DEFAULT_MAX_POOL_CONNECTIONS
+from .rate_governor import configure_governor, get_governor_stats
+from .json_repair import get_json_repair_stats
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def get_output_csv(args) -> str:
+    """
+    Get the output CSV path, generated from the method and model ID if not given.
+    
+    Args:
+        args: Command-line arguments
+        
+    Returns:
+        Path to the output CSV
+    """
+    output_csv = args.output_csv
+    if output_csv is None:
+        # Extract model name from model_id (e.g., 'nova-lite' from 'amazon.nova-lite-v1:0')
+        model_name = args.model_id.split('.')[1].split('-v')[0] if '.' in args.model_id and '-v' in args.model_id else args.model_id
+        output_csv = f"data/classification_results_{args.method}_{model_name}.csv"
+        logger.info(f"Generated output CSV filename: {output_csv}")
+    return output_csv
+
 def classify_video(args):
     """
     Classify a video.
@@ -28,12 +57,7 @@ def classify_video(args):
     """
     try:
         # Generate output CSV filename if not provided
-        output_csv = args.output_csv
-        if output_csv is None:
-            # Extract model name from model_id (e.g., 'nova-lite' from 'amazon.nova-lite-v1:0')
-            model_name = args.model_id.split('.')[1].split('-v')[0] if '.' in args.model_id and '-v' in args.model_id else args.model_id
-            output_csv = f"data/classification_results_{args.method}_{model_name}.csv"
-            logger.info(f"Generated output CSV filename: {output_csv}")
+        output_csv = get_output_csv(args)
         
         # Create classifier
         if args.method == "two_step":
@@ -43,7 +67,13 @@ def classify_video(args):
                 model_id=args.model_id,
                 region=args.region,
                 output_csv=output_csv,
-                categories_path=args.categories_path
+                categories_path=args.categories_path,
+                structured_output=args.structured_output,
+                prompt_cache=args.prompt_cache,
+                second_model_id=args.second_model_id,
+                text_only_second_step=args.text_only_second_step,
+                input_mode=args.input_mode,
+                max_keyframes=args.max_keyframes
             )
         else:  # one_step
             classifier = VideoClassifier(
@@ -51,7 +81,11 @@ def classify_video(args):
                 model_id=args.model_id,
                 region=args.region,
                 output_csv=output_csv,
-                categories_path=args.categories_path
+                categories_path=args.categories_path,
+                structured_output=args.structured_output,
+                prompt_cache=args.prompt_cache,
+                input_mode=args.input_mode,
+                max_keyframes=args.max_keyframes
             )
         
         # Classify video
@@ -80,7 +114,8 @@ def evaluate_videos(args):
             ground_truth_csv=args.ground_truth_csv,
             model_id=args.model_id,
             region=args.region,
-            output_csv=args.output_csv
+            output_csv=args.output_csv,
+            llm_judge_threshold=args.llm_judge_threshold
         )
         
         # Evaluate results
@@ -108,7 +143,13 @@ def run_comparison(args):
             videos_csv=args.videos_csv,
             ground_truth_csv=args.ground_truth_csv,
             output_dir=args.output_dir,
-            region=args.region
+            region=args.region,
+            prompt_path=args.prompt,
+            first_prompt_path=args.first_prompt,
+            second_prompt_path=args.second_prompt,
+            categories_path=args.categories_path,
+            model_concurrency=args.model_concurrency,
+            output_format=args.output_format
         )
         
         # Parse model IDs and methods
@@ -139,12 +180,27 @@ def transcribe_video(args):
         args: Command-line arguments
     """
     try:
-        # Transcribe video
-        transcript = video_to_text(
-            s3_uri=args.s3_uri,
-            max_duration=args.max_duration,
-            region=args.region
-        )
+        if len(args.s3_uri) == 1:
+            # Transcribe video
+            transcript = video_to_text(
+                s3_uri=args.s3_uri[0],
+                max_duration=args.max_duration,
+                region=args.region,
+                streaming=args.streaming
+            )
+        else:
+            # Transcribe all videos at once; one poller tracks every job
+            transcripts = transcribe_videos(
+                s3_uris=args.s3_uri,
+                max_duration=args.max_duration,
+                region=args.region,
+                streaming=args.streaming,
+                concurrency=args.concurrency
+            )
+            transcript = '\n\n'.join(
+                f"# {s3_uri}\n{text if text is not None else '[transcription failed]'}"
+                for s3_uri, text in transcripts.items()
+            )
         
         # Print transcript
         print(transcript)
@@ -159,168 +215,412 @@ def transcribe_video(args):
         logger.error(f"Error transcribing video: {e}")
         sys.exit(1)
 
+def classify_in_order(
+    classifier: VideoClassifier,
+    videos: Iterable[Tuple[str, Any]],
+    concurrency: int = 1
+) -> Iterator[Tuple[str, Any, Optional[Dict[str, Any]]]]:
+    """
+    Classify videos through a bounded worker pool.
+    
+    At most ``2 * concurrency`` videos are in flight at any time, and results are
+    yielded in the same order as the input regardless of completion order. The
+    classifier is called with ``write_csv=False``; the caller writes the results.
+    
+    Args:
+        classifier: VideoClassifier or TwoStepVideoClassifier instance
+        videos: Iterable of (S3 URI, row) pairs
+        concurrency: Number of worker threads
+        
+    Yields:
+        Tuples of (S3 URI, row, classification result or None if it failed)
+    """
+    concurrency = max(1, concurrency)
+    window = concurrency * 2
+    
+    def resolve(item):
+        s3_uri, row, future = item
+        try:
+            return s3_uri, row, future.result()
+        except Exception as e:
+            logger.error(f"Error processing video {s3_uri}: {e}")
+            return s3_uri, row, None
+    
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='classify') as executor:
+        in_flight = deque()
+        for s3_uri, row in videos:
+            logger.info(f"Processing video with S3 URI: {s3_uri}")
+            future = executor.submit(classifier.classify_video, s3_uri, write_csv=False)
+            in_flight.append((s3_uri, row, future))
+            if len(in_flight) >= window:
+                yield resolve(in_flight.popleft())
+        
+        while in_flight:
+            yield resolve(in_flight.popleft())
+
+def classify_pipelined(
+    classifier: TwoStepVideoClassifier,
+    videos: Iterable[Tuple[str, Any]],
+    describe_workers: int = 1,
+    classify_workers: int = 1,
+    queue_size: int = 8
+) -> Iterator[Tuple[str, Any, Optional[Dict[str, Any]]]]:
+    """
+    Classify videos through the two-step pipeline.
+    
+    Step 1 of later videos overlaps with step 2 of earlier ones. Results are
+    yielded in input order, like classify_in_order, and per-step metrics are
+    logged once the input is exhausted.
+    
+    Args:
+        classifier: TwoStepVideoClassifier instance
+        videos: Iterable of (S3 URI, row) pairs with unique S3 URIs
+        describe_workers: Concurrent step-1 calls
+        classify_workers: Concurrent step-2 calls
+        queue_size: Capacity of the queue in front of each step
+        
+    Yields:
+        Tuples of (S3 URI, row, classification result or None if it failed)
+    """
+    pipeline = classifier.build_pipeline(
+        describe_workers=describe_workers,
+        classify_workers=classify_workers,
+        queue_size=queue_size
+    )
+    rows = {}
+    
+    def feed() -> Iterator[str]:
+        for s3_uri, row in videos:
+            rows[s3_uri] = row
+            yield s3_uri
+    
+    for s3_uri, result, error in pipeline.run(feed()):
+        if error is not None:
+            logger.error(f"Error processing video {s3_uri}: {error}")
+        yield s3_uri, rows.pop(s3_uri), result
+    
+    for stage, stats in pipeline.stats().items():
+        logger.info(f"Pipeline stage {stage}: {stats}")
+
+def create_classifier(args, output_csv: str, result_store: Optional[ResultStore] = None) -> VideoClassifier:
+    """
+    Create the classifier selected by the command-line arguments.
+    
+    Args:
+        args: Command-line arguments
+        output_csv: Path to the output CSV
+        result_store: Store that receives the results instead of the output CSV
+        
+    Returns:
+        VideoClassifier or TwoStepVideoClassifier instance
+    """
+    # Results of videos already classified under another key are reused
+    dedup_index = None
+    if args.dedup:
+        dedup_index = DedupIndex(
+            path=args.dedup_index_path,
+            region=args.region,
+            max_distance=args.dedup_max_distance,
+            perceptual=args.dedup_perceptual
+        )
+    
+    if args.method == "two_step":
+        return TwoStepVideoClassifier(
+            first_prompt_path=args.first_prompt,
+            second_prompt_path=args.second_prompt,
+            model_id=args.model_id,
+            region=args.region,
+            output_csv=output_csv,
+            categories_path=args.categories_path,
+            structured_output=args.structured_output,
+            prompt_cache=args.prompt_cache,
+            second_model_id=args.second_model_id,
+            text_only_second_step=args.text_only_second_step,
+            input_mode=args.input_mode,
+            max_keyframes=args.max_keyframes,
+            result_store=result_store,
+            dedup_index=dedup_index
+        )
+    else:  # one_step
+        return VideoClassifier(
+            prompt_path=args.prompt,
+            model_id=args.model_id,
+            region=args.region,
+            output_csv=output_csv,
+            categories_path=args.categories_path,
+            structured_output=args.structured_output,
+            prompt_cache=args.prompt_cache,
+            input_mode=args.input_mode,
+            max_keyframes=args.max_keyframes,
+            result_store=result_store,
+            dedup_index=dedup_index
+        )
+
 def process_videos(args):
     """
-    Process videos from CSV file.
+    Process videos from a CSV or JSON lines manifest.
+    
+    The manifest is streamed, so videos are handed to the workers as they are
+    read and memory use does not grow with the size of the manifest.
     
     Args:
         args: Command-line arguments
+        
+    Returns:
+        Number of videos classified and written
     """
     try:
         # Generate output CSV filename if not provided
-        output_csv = args.output_csv
-        if output_csv is None:
-            # Extract model name from model_id (e.g., 'nova-lite' from 'amazon.nova-lite-v1:0')
-            model_name = args.model_id.split('.')[1].split('-v')[0] if '.' in args.model_id and '-v' in args.model_id else args.model_id
-            output_csv = f"data/classification_results_{args.method}_{model_name}.csv"
-            logger.info(f"Generated output CSV filename: {output_csv}")
-        
-        # Load input data with proper quoting to handle JSON in fields
-        try:
-            logger.info(f"Attempting to load CSV with proper quoting: {args.input_csv}")
-            df = pd.read_csv(args.input_csv, quotechar='"', escapechar='\\')
-            logger.info(f"Successfully loaded {len(df)} videos from {args.input_csv}")
-        except Exception as e:
-            logger.warning(f"Error loading CSV with standard method: {e}")
-            logger.info("Falling back to extracting S3 URIs directly from the file...")
-            
-            # Extract S3 URIs directly from the file
-            s3_uris = []
-            with open(args.input_csv, 'r', encoding='utf-8') as f:
-                content = f.read()
-                lines = content.split('\n')
-                
-                for line in lines:
-                    if 's3://' in line:
-                        start = line.find('s3://')
-                        end = line.find('.mp4', start)
-                        if end != -1:
-                            s3_uri = line[start:end+4]
-                            s3_uris.append(s3_uri)
-            
-            # Create a DataFrame with just the S3 URIs
-            df = pd.DataFrame({'S3 URI': s3_uris})
-            logger.info(f"Extracted {len(df)} S3 URIs from {args.input_csv}")
+        output_csv = get_output_csv(args)
+        
+        # With Parquet output, results are buffered in a store next to the CSV; the
+        # CSV is exported from it at the end, in input order
+        result_store = None
+        if args.output_format == 'parquet':
+            os.makedirs(os.path.dirname(output_csv) or '.', exist_ok=True)
+            result_store = ResultStore(
+                store_path_for(output_csv),
+                columns=OUTPUT_CSV_COLUMNS,
+                seed_csv=output_csv,
+                csv_kwargs={'quotechar': '"', 'escapechar': '\\'}
+            )
         
         # Create output CSV with headers if it doesn't exist
-        if not os.path.exists(output_csv):
+        elif not os.path.exists(output_csv):
             os.makedirs(os.path.dirname(output_csv), exist_ok=True)
             with open(output_csv, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
-                writer.writerow([
-                    'S3 URI',
-                    'catetory',
-                    'tags',
-                    'result',
-                    'new catetory',
-                    'new tags',
-                    'Input Tokens',
-                    'Output Tokens'
-                ])
+                writer.writerow(OUTPUT_CSV_COLUMNS)
         
         # Initialize classifier based on method
-        if args.method == "two_step":
-            classifier = TwoStepVideoClassifier(
-                first_prompt_path=args.first_prompt,
-                second_prompt_path=args.second_prompt,
-                model_id=args.model_id,
-                region=args.region,
-                output_csv=output_csv,
-                categories_path=args.categories_path
-            )
-        else:  # one_step
-            classifier = VideoClassifier(
-                prompt_path=args.prompt,
-                model_id=args.model_id,
-                region=args.region,
-                output_csv=output_csv,
-                categories_path=args.categories_path
+        classifier = create_classifier(args, output_csv, result_store=result_store)
+        
+        # Load the processed videos once; the journal is seeded from the output CSV on first use.
+        # The result store knows its own keys and only holds rows that were flushed.
+        if result_store is not None:
+            journal = None
+            processed = result_store
+        else:
+            journal = CheckpointJournal(
+                f"{output_csv}.journal",
+                seed_csv=output_csv,
+                key_column='S3 URI',
+                csv_kwargs={'quotechar': '"', 'escapechar': '\\'}
             )
+            processed = journal
+        
+        manifest_kwargs = {
+            'start': args.start,
+            'limit': args.limit,
+            'chunk_size': args.chunk_size
+        }
+        logger.info(f"Streaming videos from {args.input_csv} ({manifest_kwargs})")
         
-        # Process each video
-        results = []
-        for _, row in df.iterrows():
-            # Make sure we're getting the S3 URI from the correct column
-            if 'S3 URI' in row:
-                s3_uri = row['S3 URI']
-            else:
-                # Try to find a column that contains an S3 URI
-                for col, value in row.items():
-                    if isinstance(value, str) and value.startswith('s3://'):
-                        s3_uri = value
-                        break
-                else:
-                    logger.warning(f"Could not find S3 URI in row: {row}")
+        # Videos handed to the workers but not written yet; written videos are in processed
+        queued = set()
+        
+        def pending_videos() -> Iterator[Tuple[str, Dict[str, Any]]]:
+            """Yield the videos of the manifest that still need processing."""
+            for s3_uri, row in iter_manifest(args.input_csv, **manifest_kwargs):
+                # Skip if already processed
+                if s3_uri in processed:
+                    logger.info(f"Skipping already processed video: {s3_uri}")
                     continue
-            
-            # Skip if already processed
-            if os.path.exists(output_csv):
-                try:
-                    output_df = pd.read_csv(output_csv, quotechar='"', escapechar='\\')
-                    if s3_uri in output_df['S3 URI'].values:
-                        logger.info(f"Skipping already processed video: {s3_uri}")
-                        continue
-                except Exception as e:
-                    logger.warning(f"Error checking if video is already processed: {e}")
-                    # Continue with processing as a fallback
-            
-            logger.info(f"Processing video: {s3_uri}")
-            
-            # Get original category and tags if available
-            original_category = row.get('catetory', '')
-            original_tags = row.get('tags', '')
-            original_result = row.get('result', '')
-            
-            # Verify S3 URI format
-            if not s3_uri.startswith('s3://'):
-                logger.warning(f"Skipping invalid S3 URI: {s3_uri}")
-                continue
-                
-            # Classify video
-            try:
-                logger.info(f"Processing video with S3 URI: {s3_uri}")
-                result = classifier.classify_video(s3_uri)
                 
-                # Extract classification results for results list
-                categories = result['calibrated_classification']['catetorys']
-                tags = result['calibrated_classification']['tags']
+                # Verify S3 URI format
+                if not isinstance(s3_uri, str) or not s3_uri.startswith('s3://'):
+                    logger.warning(f"Skipping invalid S3 URI: {s3_uri}")
+                    continue
                 
-                # Get token usage
-                input_tokens = result['token_usage']['input_tokens']
-                output_tokens = result['token_usage']['output_tokens']
+                # Skip duplicates within the input so each video is written only once
+                if s3_uri in queued:
+                    logger.info(f"Skipping duplicate video in input: {s3_uri}")
+                    continue
                 
-                # Note: We don't write to CSV here because the VideoClassifier.classify_video method 
-                # already writes to the CSV file via its _write_to_csv method
+                queued.add(s3_uri)
+                yield s3_uri, row
+        
+        concurrency = max(1, getattr(args, 'concurrency', 1))
+        second_concurrency = max(1, args.second_concurrency or concurrency)
+        logger.info(f"Classifying videos with concurrency {concurrency}")
+        
+        # Every worker shares the same clients, so the pool must fit all of them
+        configure_clients(
+            max_pool_connections=max(
+                getattr(args, 'max_pool_connections', DEFAULT_MAX_POOL_CONNECTIONS),
+                concurrency + (second_concurrency if args.pipelined else 0)
+            )
+        )
+        
+        if args.pipelined and args.method == "two_step":
+            classified = classify_pipelined(classifier, pending_videos(), concurrency, second_concurrency, args.queue_size)
+        else:
+            if args.pipelined:
+                logger.warning("--pipelined only applies to the two_step method; using the worker pool")
+            classified = classify_in_order(classifier, pending_videos(), concurrency)
+        
+        # Classify videos in the worker pool; results come back in input order and are
+        # written to the CSV from this thread only, so every row is appended exactly once.
+        written = 0
+        for s3_uri, row, result in classified:
+            # A failed video may be retried if it appears again later in the manifest
+            queued.discard(s3_uri)
+            if result is None:
+                continue
+            
+            try:
+                classifier.write_result(result)
+                if journal is not None:
+                    journal.record(s3_uri)
+                written += 1
                 
                 logger.info(f"Successfully processed video: {s3_uri}")
                 
-                # Add to results
-                results.append({
-                    's3_uri': s3_uri,
-                    'original_category': original_category,
-                    'original_tags': original_tags,
-                    'original_result': original_result,
-                    'new_category': categories,
-                    'new_tags': tags,
-                    'input_tokens': input_tokens,
-                    'output_tokens': output_tokens
-                })
-                
             except Exception as e:
                 logger.error(f"Error processing video {s3_uri}: {e}")
                 continue
         
-        logger.info(f"Processed {len(results)} videos")
+        if result_store is not None:
+            result_store.close()
+            # Re-read the manifest lazily; the export merges it with the store chunk by chunk
+            result_store.export_csv(output_csv, order=(s3_uri for s3_uri, _ in iter_manifest(args.input_csv, **manifest_kwargs)))
+        
+        logger.info(f"Processed {written} videos")
+        if classifier.dedup_index is not None:
+            logger.info(f"Dedup index stats: {classifier.dedup_index.get_stats()}")
         logger.info(f"Results written to {output_csv}")
         
-        return results
+        return written
         
     except Exception as e:
         logger.error(f"Error processing videos: {e}")
         sys.exit(1)
 
-def main():
-    """Main entry point."""
+def run_worker(args):
+    """
+    Classify the videos announced on a queue until stopped.
+    
+    Args:
+        args: Command-line arguments
+    """
+    try:
+        output_csv = get_output_csv(args)
+        os.makedirs(os.path.dirname(output_csv) or '.', exist_ok=True)
+        classifier = create_classifier(args, output_csv)
+        
+        # Redelivered messages of videos already written are acknowledged without classifying
+        journal = CheckpointJournal(
+            f"{output_csv}.journal",
+            seed_csv=output_csv,
+            key_column='S3 URI',
+            csv_kwargs={'quotechar': '"', 'escapechar': '\\'}
+        )
+        
+        configure_clients(
+            max_pool_connections=max(
+                getattr(args, 'max_pool_connections', DEFAULT_MAX_POOL_CONNECTIONS),
+                args.concurrency + 2
+            )
+        )
+        
+        # A local file of message bodies stands in for SQS, for trying the worker out
+        sqs_client = None
+        queue_url = args.queue_url
+        if args.local_queue_file:
+            sqs_client = InMemoryQueue(visibility_timeout=args.visibility_timeout)
+            queue_url = 'local'
+            with open(args.local_queue_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        sqs_client.send_message(QueueUrl=queue_url, MessageBody=line.strip())
+        elif not queue_url:
+            raise ValueError("--queue-url or --local-queue-file is required")
+        
+        worker = QueueWorker(
+            classifier,
+            queue_url,
+            region=args.region,
+            sqs_client=sqs_client,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            wait_time=args.wait_time,
+            visibility_timeout=args.visibility_timeout,
+            processed=journal,
+            journal=journal
+        )
+        
+        # Finish the messages in flight on Ctrl-C or when the container is stopped
+        def stop(signum, frame):
+            logger.info(f"Received signal {signum}, finishing messages in flight")
+            worker.stop()
+        
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        
+        return worker.run(
+            max_messages=args.max_messages,
+            stop_when_idle=args.stop_when_idle or bool(args.local_queue_file)
+        )
+        
+    except Exception as e:
+        logger.error(f"Error running queue worker: {e}")
+        sys.exit(1)
+
+def add_classifier_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the classifier arguments shared by the batch and queue commands.
+    
+    Args:
+        parser: Command parser
+    """
+    parser.add_argument('--method', choices=['one_step', 'two_step'], default='one_step', help='Classification method')
+    parser.add_argument('--model-id', default='amazon.nova-lite-v1:0', help='Model ID')
+    parser.add_argument('--region', default='us-east-1', help='AWS region')
+    parser.add_argument('--categories-path', default='category.json', help='Path to categories JSON file')
+    parser.add_argument('--structured-output', action='store_true', help='Have the model answer through a tool with a JSON schema instead of free-text JSON')
+    parser.add_argument('--prompt-cache', action='store_true', help='Send the instructions and taxonomy as a static prefix behind a Bedrock prompt cache checkpoint')
+    parser.add_argument('--input-mode', choices=INPUT_MODES, default='video', help='Send the video itself, or scene-change keyframes extracted locally with ffmpeg')
+    parser.add_argument('--max-keyframes', type=int, default=8, help='Maximum number of keyframes sent per request (for keyframes input mode)')
+    parser.add_argument('--prompt', default='prompt/one_step_prompt.md', help='Path to prompt file (for one-step method)')
+    parser.add_argument('--first-prompt', default='prompt/two_step1_prompt.md', help='Path to first prompt file (for two-step method)')
+    parser.add_argument('--second-prompt', default='prompt/two_stop2_prompt.md', help='Path to second prompt file (for two-step method)')
+    parser.add_argument('--second-model-id', help='Model ID of the second step (for two-step method, defaults to --model-id)')
+    parser.add_argument('--text-only-second-step', action='store_true', help='Classify from the step-1 description only, without sending the video again (for two-step method)')
+    parser.add_argument('--max-pool-connections', type=int, default=DEFAULT_MAX_POOL_CONNECTIONS, help='Maximum pooled HTTP connections per AWS client')
+    parser.add_argument('--dedup', action='store_true', help='Reuse the results of videos with the same or near-identical content instead of classifying them again')
+    parser.add_argument('--dedup-index-path', default='.cache/video_dedup.sqlite3', help='Path to the dedup index file')
+    parser.add_argument('--dedup-max-distance', type=float, default=6.0, help='Largest mean per-frame perceptual hash distance (bits out of 64) counted as the same content')
+    parser.add_argument('--dedup-perceptual', action='store_true', help='Also match re-encoded copies by perceptual hashes of frames sampled over the whole video, not only videos with the same S3 ETag and size')
+
+def add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the LLM response cache arguments to a command parser.
+    
+    Args:
+        parser: Command parser
+    """
+    parser.add_argument('--llm-cache-path', default='.cache/llm_responses.sqlite3', help='Path to the LLM response cache file')
+    parser.add_argument('--llm-cache-max-mb', type=int, default=512, help='Maximum size of the LLM response cache in MB')
+    parser.add_argument('--no-llm-cache', action='store_true', help='Disable the LLM response cache')
+
+def add_rate_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the Bedrock quota arguments to a command parser.
+    
+    Args:
+        parser: Command parser
+    """
+    parser.add_argument('--rpm', type=float, help='Requests-per-minute quota of each model (unlimited if not set)')
+    parser.add_argument('--tpm', type=float, help='Tokens-per-minute quota of each model (unlimited if not set)')
+    parser.add_argument('--max-model-concurrency', type=int, default=64, help='Upper bound of the adaptive per-model concurrency limit')
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the command-line parser.
+    
+    Returns:
+        Parser with one subcommand per command
+    """
     parser = argparse.ArgumentParser(description='Video Classification Tool')
     subparsers = parser.add_subparsers(dest='command', help='Command to run')
     
@@ -331,10 +631,18 @@ def main():
     classify_parser.add_argument('--prompt', default='prompt/one_step_prompt.md', help='Path to prompt file (for one-step method)')
     classify_parser.add_argument('--first-prompt', default='prompt/two_step1_prompt.md', help='Path to first prompt file (for two-step method)')
     classify_parser.add_argument('--second-prompt', default='prompt/two_stop2_prompt.md', help='Path to second prompt file (for two-step method)')
+    classify_parser.add_argument('--second-model-id', help='Model ID of the second step (for two-step method, defaults to --model-id)')
+    classify_parser.add_argument('--text-only-second-step', action='store_true', help='Classify from the step-1 description only, without sending the video again (for two-step method)')
     classify_parser.add_argument('--model-id', default='amazon.nova-lite-v1:0', help='Model ID')
     classify_parser.add_argument('--region', default='us-east-1', help='AWS region')
     classify_parser.add_argument('--output-csv', help='Path to output CSV file (if not provided, will be generated based on method and model-id)')
     classify_parser.add_argument('--categories-path', default='category.json', help='Path to categories JSON file')
+    classify_parser.add_argument('--structured-output', action='store_true', help='Have the model answer through a tool with a JSON schema instead of free-text JSON')
+    classify_parser.add_argument('--prompt-cache', action='store_true', help='Send the instructions and taxonomy as a static prefix behind a Bedrock prompt cache checkpoint')
+    classify_parser.add_argument('--input-mode', choices=INPUT_MODES, default='video', help='Send the video itself, or scene-change keyframes extracted locally with ffmpeg')
+    classify_parser.add_argument('--max-keyframes', type=int, default=8, help='Maximum number of keyframes sent per request (for keyframes input mode)')
+    add_cache_arguments(classify_parser)
+    add_rate_arguments(classify_parser)
     
     # Evaluate command
     evaluate_parser = subparsers.add_parser('evaluate', help='Evaluate video classification results')
@@ -343,37 +651,116 @@ def main():
     evaluate_parser.add_argument('--model-id', default='amazon.nova-lite-v1:0', help='Model ID')
     evaluate_parser.add_argument('--region', default='us-east-1', help='AWS region')
     evaluate_parser.add_argument('--output-csv', default='data/evaluation_results.csv', help='Path to output CSV file')
+    evaluate_parser.add_argument('--llm-judge-threshold', type=float, help='Re-judge videos whose local accuracy score is below this value with the model (local scoring only if not set)')
+    add_cache_arguments(evaluate_parser)
+    add_rate_arguments(evaluate_parser)
     
     # Compare command
     compare_parser = subparsers.add_parser('compare', help='Run comparison tests')
     compare_parser.add_argument('videos_csv', help='Path to CSV file with video S3 URIs')
     compare_parser.add_argument('ground_truth_csv', help='Path to ground truth CSV')
     compare_parser.add_argument('--model-ids', default='amazon.nova-lite-v1:0,amazon.nova-v1:0', help='Comma-separated list of model IDs')
-    compare_parser.add_argument('--methods', default='one_step,two_step', help='Comma-separated list of methods')
+    compare_parser.add_argument('--methods', default='one_step,two_step', help='Comma-separated list of methods (one_step, two_step, keyframes)')
     compare_parser.add_argument('--region', default='us-east-1', help='AWS region')
     compare_parser.add_argument('--output-dir', default='data/comparison_results', help='Directory to store output files')
+    compare_parser.add_argument('--prompt', default='prompt/one_step_prompt.md', help='Path to prompt file (for one-step method)')
+    compare_parser.add_argument('--first-prompt', default='prompt/two_step1_prompt.md', help='Path to first prompt file (for two-step method)')
+    compare_parser.add_argument('--second-prompt', default='prompt/two_stop2_prompt.md', help='Path to second prompt file (for two-step method)')
+    compare_parser.add_argument('--categories-path', default='category.json', help='Path to categories JSON file')
+    compare_parser.add_argument('--model-concurrency', type=int, default=4, help='Videos classified at once per model, shared by all methods of that model')
+    compare_parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='csv', help='Append classification rows to CSVs, or buffer them in Parquet stores and export the CSVs at the end')
+    add_cache_arguments(compare_parser)
+    add_rate_arguments(compare_parser)
     
     # Transcribe command
     transcribe_parser = subparsers.add_parser('transcribe', help='Transcribe a video')
-    transcribe_parser.add_argument('s3_uri', help='S3 URI of the video')
+    transcribe_parser.add_argument('s3_uri', nargs='+', help='S3 URI of the video (several URIs are transcribed concurrently)')
     transcribe_parser.add_argument('--max-duration', type=int, default=30, help='Maximum duration in seconds')
     transcribe_parser.add_argument('--region', default='us-east-1', help='AWS region')
     transcribe_parser.add_argument('--output-file', help='Path to output file')
+    transcribe_parser.add_argument('--concurrency', type=int, default=4, help='Number of audio extractions running at once when transcribing several videos')
+    transcribe_parser.add_argument('--streaming', action='store_true', help='Extract audio in a single ffmpeg pass streamed from and to S3, without local temp files')
     
     # Process videos command
     process_parser = subparsers.add_parser('process', help='Process videos from CSV file')
-    process_parser.add_argument('--input-csv', default='data/classification_data.csv', help='Path to input CSV file')
+    process_parser.add_argument('--input-csv', default='data/classification_data.csv', help='Path to input CSV or JSON lines (.jsonl, .ndjson) manifest')
+    process_parser.add_argument('--start', type=int, default=0, help='Number of manifest rows to skip (for sharding)')
+    process_parser.add_argument('--limit', type=int, help='Maximum number of manifest rows to process after --start')
+    process_parser.add_argument('--chunk-size', type=int, default=10000, help='Rows parsed at once from the manifest CSV')
     process_parser.add_argument('--output-csv', help='Path to output CSV file (if not provided, will be generated based on method and model-id)')
-    process_parser.add_argument('--method', choices=['one_step', 'two_step'], default='one_step', help='Classification method')
-    process_parser.add_argument('--model-id', default='amazon.nova-lite-v1:0', help='Model ID')
-    process_parser.add_argument('--region', default='us-east-1', help='AWS region')
-    process_parser.add_argument('--categories-path', default='category.json', help='Path to categories JSON file')
-    process_parser.add_argument('--prompt', default='prompt/one_step_prompt.md', help='Path to prompt file (for one-step method)')
-    process_parser.add_argument('--first-prompt', default='prompt/two_step1_prompt.md', help='Path to first prompt file (for two-step method)')
-    process_parser.add_argument('--second-prompt', default='prompt/two_stop2_prompt.md', help='Path to second prompt file (for two-step method)')
+    add_classifier_arguments(process_parser)
+    process_parser.add_argument('--concurrency', type=int, default=1, help='Number of videos to classify concurrently')
+    process_parser.add_argument('--pipelined', action='store_true', help='Overlap step 1 and step 2 of different videos in a staged pipeline (for two-step method)')
+    process_parser.add_argument('--second-concurrency', type=int, help='Concurrent step-2 calls in the pipeline (defaults to --concurrency)')
+    process_parser.add_argument('--queue-size', type=int, default=8, help='Capacity of the queue between pipeline steps')
+    process_parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='csv', help='Append rows to the CSV, or buffer them in a Parquet store next to it and export the CSV in input order at the end')
+    add_cache_arguments(process_parser)
+    add_rate_arguments(process_parser)
+    
+    # Queue worker command
+    worker_parser = subparsers.add_parser('worker', help='Classify videos announced on an SQS queue until stopped')
+    worker_parser.add_argument('--queue-url', help='URL of the SQS queue receiving S3 event notifications')
+    worker_parser.add_argument('--local-queue-file', help='File with one message body per line, processed through an in-memory queue instead of SQS')
+    worker_parser.add_argument('--output-csv', help='Path to output CSV file (if not provided, will be generated based on method and model-id)')
+    add_classifier_arguments(worker_parser)
+    worker_parser.add_argument('--concurrency', type=int, default=4, help='Number of messages classified concurrently')
+    worker_parser.add_argument('--batch-size', type=int, default=10, help='Maximum messages per receive call (at most 10)')
+    worker_parser.add_argument('--wait-time', type=int, default=20, help='Long polling wait in seconds (at most 20)')
+    worker_parser.add_argument('--visibility-timeout', type=int, default=300, help='Visibility timeout in seconds; messages still being classified are extended at half of it')
+    worker_parser.add_argument('--max-messages', type=int, help='Stop after receiving this many messages')
+    worker_parser.add_argument('--stop-when-idle', action='store_true', help='Stop once the queue is empty and nothing is in flight')
+    add_cache_arguments(worker_parser)
+    add_rate_arguments(worker_parser)
+    
+    return parser
+
+def configure_cache(args) -> Optional[LLMResponseCache]:
+    """
+    Configure the LLM response cache for commands that call Bedrock.
+    
+    Args:
+        args: Command-line arguments
+        
+    Returns:
+        The configured cache, or None if the command has no cache or it is disabled
+    """
+    if not hasattr(args, 'no_llm_cache'):
+        return None
+    return configure_default_cache(
+        path=args.llm_cache_path,
+        max_bytes=args.llm_cache_max_mb * 1024 * 1024,
+        enabled=not args.no_llm_cache
+    )
+
+def configure_governors(args) -> None:
+    """
+    Configure the rate governors of the models a command uses.
     
+    Args:
+        args: Command-line arguments
+    """
+    if not hasattr(args, 'rpm'):
+        return
+    model_ids = args.model_ids.split(',') if hasattr(args, 'model_ids') else [args.model_id]
+    if getattr(args, 'second_model_id', None):
+        model_ids.append(args.second_model_id)
+    for model_id in model_ids:
+        configure_governor(
+            model_id,
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm,
+            max_concurrency=args.max_model_concurrency
+        )
+
+def main():
+    """Main entry point."""
+    parser = build_parser()
     args = parser.parse_args()
     
+    # Configure the LLM response cache and the per-model rate governors
+    cache = configure_cache(args)
+    configure_governors(args)
+    
     if args.command == 'classify':
         classify_video(args)
     elif args.command == 'evaluate':
@@ -384,9 +771,21 @@ def main():
         transcribe_video(args)
     elif args.command == 'process':
         process_videos(args)
+    elif args.command == 'worker':
+        run_worker(args)
     else:
         parser.print_help()
         sys.exit(1)
+    
+    if cache is not None:
+        logger.info(f"LLM response cache stats: {cache.stats()}")
+    
+    for model_id, stats in get_governor_stats().items():
+        logger.info(f"Rate governor stats for {model_id}: {stats}")
+    
+    json_stats = get_json_repair_stats()
+    if json_stats:
+        logger.info(f"JSON parse stats: {json_stats}")
 
 if __name__ == '__main__':
     main()
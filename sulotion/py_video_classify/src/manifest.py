@@ -0,0 +1,128 @@
+"""
+Streaming reader for video manifests.
+"""
+import json
+import logging
+from itertools import islice
+from typing import Dict, Any, Iterator, Optional, Tuple
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+
+def find_s3_uri(row: Dict[str, Any], key_column: str = 'S3 URI') -> Optional[str]:
+    """
+    Get the S3 URI of a manifest row.
+    
+    Args:
+        row: Manifest row
+        key_column: Column expected to hold the S3 URI
+    
+    Returns:
+        Value of the key column, or the first value that looks like an S3 URI,
+        or None if the row has neither
+    """
+    if key_column in row:
+        return row[key_column]
+    for value in row.values():
+        if isinstance(value, str) and value.startswith('s3://'):
+            return value
+    return None
+
+def _iter_csv_rows(path: str, chunk_size: int, skip: int) -> Iterator[Dict[str, Any]]:
+    """Yield the rows of a CSV file one chunk at a time, skipping the first rows."""
+    reader = pd.read_csv(
+        path,
+        quotechar='"',
+        escapechar='\\',
+        dtype=str,
+        keep_default_na=False,
+        chunksize=chunk_size
+    )
+    with reader:
+        for chunk in reader:
+            # Whole chunks before the start row are dropped without building row dicts
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            chunk.columns = chunk.columns.str.strip()
+            yield from chunk.iloc[skip:].to_dict('records')
+            skip = 0
+
+def _iter_json_lines(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the objects of a newline-delimited JSON file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping invalid JSON on line {line_number} of {path}: {e}")
+                continue
+            yield row if isinstance(row, dict) else {'S3 URI': row}
+
+def _scan_s3_uris(path: str) -> Iterator[Dict[str, Any]]:
+    """Extract S3 URIs of MP4 files line by line from a file that cannot be parsed as CSV."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if 's3://' in line:
+                start = line.find('s3://')
+                end = line.find('.mp4', start)
+                if end != -1:
+                    yield {'S3 URI': line[start:end+4]}
+
+def iter_manifest(
+    path: str,
+    start: int = 0,
+    limit: Optional[int] = None,
+    chunk_size: int = 10000,
+    key_column: str = 'S3 URI'
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Read the videos of a manifest lazily.
+    
+    CSV files are parsed chunk_size rows at a time and newline-delimited JSON
+    files (.jsonl, .ndjson) one line at a time, so memory use does not depend on
+    the size of the manifest. If a CSV file cannot be parsed, the S3 URIs are
+    extracted from its lines instead.
+    
+    Args:
+        path: Path to the CSV or JSON lines manifest
+        start: Number of manifest rows to skip, for sharding a manifest across runs
+        limit: Maximum number of rows to read after start (all if not set)
+        chunk_size: Rows parsed at once from CSV files
+        key_column: Column holding the S3 URI
+    
+    Yields:
+        Tuples of (S3 URI, row); rows without an S3 URI are skipped with a warning
+        but still count towards start and limit
+    """
+    start = max(0, start)
+    
+    def rows() -> Iterator[Dict[str, Any]]:
+        if path.endswith(JSON_LINES_EXTENSIONS):
+            yield from islice(_iter_json_lines(path), start, None)
+            return
+        
+        read = 0
+        try:
+            for row in _iter_csv_rows(path, max(1, chunk_size), start):
+                read += 1
+                yield row
+        except Exception as e:
+            logger.warning(f"Error reading CSV {path} after {start + read} rows: {e}")
+            logger.info("Falling back to extracting S3 URIs directly from the file...")
+            # Resume after the rows already read so the shard boundaries stay the same
+            yield from islice(_scan_s3_uris(path), start + read, None)
+    
+    for row in islice(rows(), limit):
+        s3_uri = find_s3_uri(row, key_column)
+        if s3_uri is None:
+            logger.warning(f"Could not find S3 URI in row: {row}")
+            continue
+        yield s3_uri, row
@@ -0,0 +1,139 @@
+"""
+Latency and throughput metrics.
+"""
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class LatencyRecorder:
+    """
+    Thread-safe recorder of request latencies and token counts.
+    
+    Throughput is measured over wall-clock time from the first recorded start
+    to the last recorded end, so it reflects concurrency rather than the sum of
+    the individual latencies.
+    """
+    
+    def __init__(self, name: str = ""):
+        """
+        Initialize the recorder.
+        
+        Args:
+            name: Name used in logs
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._latencies: List[float] = []
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.failures = 0
+        self.first_start: Optional[float] = None
+        self.last_end: Optional[float] = None
+    
+    def record(self, start: float, end: float, input_tokens: int = 0, output_tokens: int = 0) -> None:
+        """
+        Record a successful request.
+        
+        Args:
+            start: Start time from time.monotonic()
+            end: End time from time.monotonic()
+            input_tokens: Input tokens used by the request
+            output_tokens: Output tokens generated by the request
+        """
+        with self._lock:
+            self._latencies.append(end - start)
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self._extend_window(start, end)
+    
+    def record_failure(self, start: float, end: float) -> None:
+        """
+        Record a failed request.
+        
+        Args:
+            start: Start time from time.monotonic()
+            end: End time from time.monotonic()
+        """
+        with self._lock:
+            self.failures += 1
+            self._extend_window(start, end)
+    
+    def _extend_window(self, start: float, end: float) -> None:
+        self.first_start = start if self.first_start is None else min(self.first_start, start)
+        self.last_end = end if self.last_end is None else max(self.last_end, end)
+    
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the recorded requests.
+        
+        Returns:
+            Dictionary with request counts, mean and p50/p95/p99 latency in
+            seconds, token totals, wall time, requests per second and tokens
+            per second
+        """
+        with self._lock:
+            latencies = np.array(self._latencies)
+            wall_time = (self.last_end - self.first_start) if self.first_start is not None else 0.0
+            total_tokens = self.input_tokens + self.output_tokens
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies.size else (0.0, 0.0, 0.0)
+            return {
+                'requests': int(latencies.size),
+                'failures': self.failures,
+                'mean_latency_s': float(latencies.mean()) if latencies.size else 0.0,
+                'p50_latency_s': float(p50),
+                'p95_latency_s': float(p95),
+                'p99_latency_s': float(p99),
+                'input_tokens': self.input_tokens,
+                'output_tokens': self.output_tokens,
+                'wall_time_s': wall_time,
+                'requests_per_second': latencies.size / wall_time if wall_time > 0 else 0.0,
+                'tokens_per_second': total_tokens / wall_time if wall_time > 0 else 0.0,
+                'output_tokens_per_second': self.output_tokens / wall_time if wall_time > 0 else 0.0
+            }
+    
+    def timer(self) -> 'RequestTimer':
+        """
+        Time one request with a context manager.
+        
+        Returns:
+            Context manager recording the request when it exits; set its
+            token counts with RequestTimer.tokens before leaving the block
+        """
+        return RequestTimer(self)
+
+class RequestTimer:
+    """Context manager timing one request for a LatencyRecorder."""
+    
+    def __init__(self, recorder: LatencyRecorder):
+        self.recorder = recorder
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.start = 0.0
+    
+    def tokens(self, token_usage: Dict[str, int]) -> None:
+        """
+        Set the token usage of the request.
+        
+        Args:
+            token_usage: Dictionary with input_tokens and output_tokens
+        """
+        self.input_tokens = token_usage.get('input_tokens', 0)
+        self.output_tokens = token_usage.get('output_tokens', 0)
+    
+    def __enter__(self) -> 'RequestTimer':
+        self.start = time.monotonic()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        end = time.monotonic()
+        if exc_type is None:
+            self.recorder.record(self.start, end, self.input_tokens, self.output_tokens)
+        else:
+            self.recorder.record_failure(self.start, end)
+        return False
@@ -0,0 +1,227 @@
+"""
+MP4 container inspection without decoding or full downloads.
+"""
+import os
+import struct
+import logging
+import urllib.request
+from typing import Dict, Any, List, Optional, Tuple, Callable, Iterator
+
+from .aws_clients import get_client
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Top-level boxes of a well-formed MP4 file
+TOP_LEVEL_BOXES = {b'ftyp', b'styp', b'moov', b'mdat', b'free', b'skip', b'wide', b'uuid', b'meta', b'pdin', b'sidx', b'moof', b'mfra'}
+
+def fetch_range(url: str, start: int, end: int, timeout: float = 30.0) -> Tuple[bytes, Optional[int]]:
+    """
+    Fetch a byte range of a URL.
+    
+    Args:
+        url: HTTP(S) URL
+        start: First byte offset
+        end: Last byte offset (inclusive)
+        timeout: Request timeout in seconds
+    
+    Returns:
+        Tuple of (bytes, total size of the resource or None if unknown)
+    """
+    request = urllib.request.Request(url, headers={'Range': f"bytes={start}-{end}"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        if response.status != 206:
+            raise ValueError(f"Server ignored the range request (HTTP {response.status})")
+        content_range = response.headers.get('Content-Range', '')
+        total = content_range.rsplit('/', 1)[-1]
+        return response.read(end - start + 1), int(total) if total.isdigit() else None
+
+def parse_box_header(data: bytes, offset: int = 0) -> Optional[Tuple[int, bytes, int]]:
+    """
+    Parse an MP4 box header.
+    
+    Args:
+        data: Buffer holding the header
+        offset: Offset of the header in the buffer
+    
+    Returns:
+        Tuple of (box size, box type, header length), or None if the buffer
+        does not hold the whole header. A size of 0 means the box runs to the
+        end of the file.
+    """
+    if len(data) < offset + 8:
+        return None
+    size, box_type = struct.unpack_from('>I4s', data, offset)
+    if size == 1:
+        if len(data) < offset + 16:
+            return None
+        return struct.unpack_from('>Q', data, offset + 8)[0], box_type, 16
+    return size, box_type, 8
+
+def probe_mp4_layout(url: str, head_size: int = 64 * 1024, max_boxes: int = 64) -> Optional[Dict[str, Any]]:
+    """
+    Locate the top-level boxes of a remote MP4 file without downloading it.
+    
+    The first head_size bytes are fetched with one range request; boxes beyond
+    them are located by fetching only their 16-byte headers.
+    
+    Args:
+        url: HTTP(S) URL of the video
+        head_size: Bytes fetched by the first request
+        max_boxes: Maximum number of top-level boxes to walk
+    
+    Returns:
+        Dictionary with content_length, boxes (type, offset and size of each
+        top-level box) and faststart (moov before mdat), or None if the server
+        does not support range requests or the file is not a readable MP4
+    """
+    try:
+        buffer, content_length = fetch_range(url, 0, head_size - 1)
+        if content_length is None:
+            logger.warning(f"Unknown content length for {url}")
+            return None
+        
+        boxes: List[Dict[str, Any]] = []
+        offset = 0
+        while offset < content_length and len(boxes) < max_boxes:
+            header = parse_box_header(buffer, offset)
+            if header is None:
+                header_bytes, _ = fetch_range(url, offset, min(offset + 15, content_length - 1))
+                header = parse_box_header(header_bytes)
+            if header is None:
+                return None
+            
+            size, box_type, _ = header
+            if size == 0:
+                size = content_length - offset
+            if size < 8 or box_type not in TOP_LEVEL_BOXES:
+                logger.warning(f"Unexpected box {box_type!r} of size {size} at offset {offset} in {url}")
+                return None
+            
+            boxes.append({'type': box_type.decode('ascii'), 'offset': offset, 'size': size})
+            offset += size
+        
+        types = [box['type'] for box in boxes]
+        if 'moov' not in types or 'mdat' not in types:
+            logger.warning(f"No moov or mdat box found in {url}")
+            return None
+        
+        return {
+            'content_length': content_length,
+            'boxes': boxes,
+            'faststart': types.index('moov') < types.index('mdat')
+        }
+    except Exception as e:
+        logger.warning(f"Could not probe MP4 layout of {url}: {e}")
+        return None
+
+class _BlockReader:
+    """Read byte ranges through a fetch function, reusing blocks already fetched."""
+    
+    def __init__(self, fetch: Callable[[int, int], bytes], block_size: int = 4096):
+        self.fetch = fetch
+        self.block_size = block_size
+        self.blocks: List[Tuple[int, bytes]] = []
+    
+    def read(self, offset: int, length: int) -> bytes:
+        for start, data in self.blocks:
+            if start <= offset and offset + length <= start + len(data):
+                return data[offset - start:offset - start + length]
+        data = self.fetch(offset, max(length, self.block_size))
+        self.blocks.append((offset, data))
+        return data[:length]
+
+def _walk_boxes(reader: _BlockReader, start: int, end: int) -> Iterator[Tuple[bytes, int, int, int]]:
+    """Yield (type, offset, size, header length) of the boxes between two offsets."""
+    offset = start
+    while offset + 8 <= end:
+        header = parse_box_header(reader.read(offset, min(16, end - offset)))
+        if header is None:
+            return
+        size, box_type, header_length = header
+        if size == 0:
+            size = end - offset
+        if size < header_length or offset + size > end:
+            return
+        yield box_type, offset, size, header_length
+        offset += size
+
+def parse_mvhd_duration(payload: bytes) -> Optional[float]:
+    """
+    Get the duration from the payload of an mvhd box.
+    
+    Args:
+        payload: mvhd box content after the box header
+    
+    Returns:
+        Duration in seconds, or None if the box is truncated or has no duration
+    """
+    if len(payload) < 4:
+        return None
+    version = payload[0]
+    if version == 1:
+        if len(payload) < 32:
+            return None
+        timescale, duration = struct.unpack_from('>IQ', payload, 20)
+    else:
+        if len(payload) < 20:
+            return None
+        timescale, duration = struct.unpack_from('>II', payload, 12)
+    # Fragmented files leave the duration at zero (or all ones) and keep it in the fragments
+    if timescale == 0 or duration == 0 or duration in (0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+        return None
+    return duration / timescale
+
+def _read_duration(fetch: Callable[[int, int], bytes], file_size: int) -> Optional[float]:
+    """Find moov/mvhd through a range fetch function and return the duration."""
+    reader = _BlockReader(fetch)
+    for box_type, offset, size, header_length in _walk_boxes(reader, 0, file_size):
+        if box_type not in TOP_LEVEL_BOXES:
+            return None
+        if box_type != b'moov':
+            continue
+        for child_type, child_offset, child_size, child_header in _walk_boxes(reader, offset + header_length, offset + size):
+            if child_type == b'mvhd':
+                return parse_mvhd_duration(reader.read(child_offset + child_header, min(child_size - child_header, 112)))
+        return None
+    return None
+
+def read_mp4_duration(source: str, region: str = "us-east-1") -> Optional[float]:
+    """
+    Read the duration of an MP4/MOV file from its mvhd box.
+    
+    Only the box headers on the way to moov and the mvhd box itself are read,
+    usually a few KB at the start of the file, plus a few KB at the end when the
+    moov box comes after the media data.
+    
+    Args:
+        source: Local path or S3 URI of the video; S3 objects are read with range requests
+        region: AWS region
+    
+    Returns:
+        Duration in seconds, or None if the file is not an MP4/MOV container
+        with a movie duration
+    """
+    try:
+        if source.startswith('s3://'):
+            s3_client = get_client('s3', region)
+            bucket_name = source.split('/')[2]
+            object_key = '/'.join(source.split('/')[3:])
+            
+            def fetch_s3(offset: int, length: int) -> bytes:
+                response = s3_client.get_object(Bucket=bucket_name, Key=object_key, Range=f"bytes={offset}-{offset + length - 1}")
+                return response['Body'].read()
+            
+            file_size = s3_client.head_object(Bucket=bucket_name, Key=object_key)['ContentLength']
+            return _read_duration(fetch_s3, file_size)
+        
+        with open(source, 'rb') as f:
+            def fetch_file(offset: int, length: int) -> bytes:
+                f.seek(offset)
+                return f.read(length)
+            
+            return _read_duration(fetch_file, os.fstat(f.fileno()).st_size)
+    except Exception as e:
+        logger.warning(f"Could not read MP4 duration of {source}: {e}")
+        return None
@@ -0,0 +1,187 @@
+"""
+Staged pipeline with bounded queues between stages.
+"""
+import time
+import queue
+import logging
+import threading
+from typing import Dict, Any, List, Tuple, Optional, Callable, Iterable, Iterator
+
+from .metrics import LatencyRecorder
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class Stage:
+    """One stage of a StagedPipeline."""
+    
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Any],
+        workers: int = 1,
+        token_usage: Optional[Callable[[Any], Dict[str, int]]] = None
+    ):
+        """
+        Initialize the stage.
+        
+        Args:
+            name: Stage name used in logs and metrics
+            fn: Function mapping the output of the previous stage to this stage's output
+            workers: Number of worker threads of the stage
+            token_usage: Function returning the token usage of a stage output, if any
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.token_usage = token_usage
+        self.latency = LatencyRecorder(name)
+        self.max_queue_depth = 0
+
+class StagedPipeline:
+    """
+    Run items through a chain of stages, each with its own worker pool.
+    
+    Stages are connected by bounded queues, so a slow stage applies back-pressure
+    to the stages before it instead of letting work pile up in memory, and
+    different items occupy different stages at the same time. An item whose stage
+    function raises skips the remaining stages and is reported with its error.
+    """
+    
+    def __init__(self, stages: List[Stage], queue_size: int = 8):
+        """
+        Initialize the pipeline.
+        
+        Args:
+            stages: Stages in execution order
+            queue_size: Capacity of the queue in front of each stage
+        """
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+    
+    def run(self, items: Iterable[Any], ordered: bool = True) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+        """
+        Feed items through the pipeline.
+        
+        Args:
+            items: Input items; consumed lazily as the first queue has room
+            ordered: Yield results in input order rather than completion order
+        
+        Yields:
+            Tuples of (input item, final stage output or None, exception or None)
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        output = queue.Queue()
+        # Bounds the items between the feeder and the consumer, including those
+        # waiting in the reorder buffer behind a slow item
+        in_flight = threading.Semaphore(self.queue_size * (len(self.stages) + 1) + sum(stage.workers for stage in self.stages))
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+        
+        def put(index: int, entry: Any) -> None:
+            queues[index].put(entry)
+            # Shutdown sentinels are not work, so they do not count towards the depth
+            if entry is not _STOP:
+                stage = self.stages[index]
+                stage.max_queue_depth = max(stage.max_queue_depth, queues[index].qsize())
+        
+        def work(index: int) -> None:
+            stage = self.stages[index]
+            is_last = index == len(self.stages) - 1
+            while True:
+                entry = queues[index].get()
+                if entry is _STOP:
+                    with remaining_lock:
+                        remaining[index] -= 1
+                        last_worker = remaining[index] == 0
+                    # The last worker to stop passes the shutdown on to the next stage
+                    if last_worker:
+                        if is_last:
+                            output.put(_STOP)
+                        else:
+                            for _ in range(self.stages[index + 1].workers):
+                                put(index + 1, _STOP)
+                    return
+                
+                seq, item, value, error = entry
+                if error is None:
+                    start = time.monotonic()
+                    try:
+                        value = stage.fn(value)
+                        usage = stage.token_usage(value) if stage.token_usage else {}
+                        stage.latency.record(start, time.monotonic(), usage.get('input_tokens', 0), usage.get('output_tokens', 0))
+                    except Exception as e:
+                        stage.latency.record_failure(start, time.monotonic())
+                        logger.error(f"Stage {stage.name} failed for {item}: {e}")
+                        value, error = None, e
+                
+                entry = (seq, item, value, error)
+                if is_last:
+                    output.put(entry)
+                else:
+                    put(index + 1, entry)
+        
+        def feed() -> None:
+            try:
+                for seq, item in enumerate(items):
+                    in_flight.acquire()
+                    put(0, (seq, item, item, None))
+            except Exception as e:
+                logger.error(f"Error reading pipeline input: {e}")
+            finally:
+                for _ in range(self.stages[0].workers):
+                    put(0, _STOP)
+        
+        threads = [threading.Thread(target=feed, name='pipeline-feed', daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(target=work, args=(index,), name=f"pipeline-{stage.name}-{worker}", daemon=True))
+        for thread in threads:
+            thread.start()
+        
+        buffered: Dict[int, Tuple[Any, Any, Optional[Exception]]] = {}
+        next_seq = 0
+        while True:
+            entry = output.get()
+            if entry is _STOP:
+                break
+            seq, item, value, error = entry
+            if not ordered:
+                in_flight.release()
+                yield item, value, error
+                continue
+            
+            buffered[seq] = (item, value, error)
+            while next_seq in buffered:
+                in_flight.release()
+                yield buffered.pop(next_seq)
+                next_seq += 1
+        
+        # Any items left behind a gap would mean a lost entry; yield them rather than drop them
+        for seq in sorted(buffered):
+            yield buffered.pop(seq)
+        
+        for thread in threads:
+            thread.join()
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get per-stage metrics.
+        
+        Returns:
+            Mapping of stage name to its latency summary (throughput, latency
+            percentiles, token counts) plus worker count and peak input queue depth
+        """
+        return {
+            stage.name: {
+                **stage.latency.summary(),
+                'workers': stage.workers,
+                'max_queue_depth': stage.max_queue_depth
+            }
+            for stage in self.stages
+        }
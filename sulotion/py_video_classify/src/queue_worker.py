@@ -0,0 +1,452 @@
+"""
+Queue-driven classification worker.
+"""
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional, Container
+
+from .aws_clients import get_client
+from .metrics import LatencyRecorder
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# SQS accepts at most 10 entries per batch call and per receive
+SQS_MAX_BATCH = 10
+
+def parse_s3_event(body: str) -> List[str]:
+    """
+    Get the S3 URIs of the objects a queue message refers to.
+    
+    Supported bodies are S3 event notifications (also wrapped in an SNS
+    notification), EventBridge "Object Created" events, {"s3_uri": ...} objects
+    and bare S3 URIs. Test events and other event types yield no URIs.
+    
+    Args:
+        body: Message body
+    
+    Returns:
+        S3 URIs in the order they appear in the message
+    """
+    try:
+        message = json.loads(body)
+    except json.JSONDecodeError:
+        body = body.strip()
+        return [body] if body.startswith('s3://') else []
+    
+    if isinstance(message, str):
+        return [message] if message.startswith('s3://') else []
+    if not isinstance(message, dict):
+        return []
+    
+    # SNS fan-out wraps the S3 event in a notification envelope
+    if message.get('Type') == 'Notification' and 'Message' in message:
+        return parse_s3_event(message['Message'])
+    
+    if 's3_uri' in message:
+        return [message['s3_uri']]
+    
+    if message.get('detail-type') == 'Object Created':
+        detail = message.get('detail', {})
+        return [f"s3://{detail['bucket']['name']}/{detail['object']['key']}"]
+    
+    s3_uris = []
+    for record in message.get('Records', []):
+        if not record.get('eventName', '').startswith('ObjectCreated'):
+            continue
+        # Keys in S3 event notifications are URL-encoded, with spaces as '+'
+        bucket_name = record['s3']['bucket']['name']
+        object_key = urllib.parse.unquote_plus(record['s3']['object']['key'])
+        s3_uris.append(f"s3://{bucket_name}/{object_key}")
+    return s3_uris
+
+class InMemoryQueue:
+    """
+    In-process stand-in for the SQS calls used by QueueWorker.
+    
+    It implements send_message, receive_message (with long polling and
+    visibility timeouts), delete_message_batch, change_message_visibility_batch
+    and get_queue_attributes with the same request and response shapes as the
+    boto3 SQS client, so the worker can be run and tested without AWS.
+    """
+    
+    def __init__(self, visibility_timeout: float = 30.0):
+        """
+        Initialize the queue.
+        
+        Args:
+            visibility_timeout: Default visibility timeout of received messages in seconds
+        """
+        self.visibility_timeout = visibility_timeout
+        self._condition = threading.Condition()
+        self._messages: Dict[str, Dict[str, Any]] = {}
+        self.deleted = 0
+    
+    def send_message(self, QueueUrl: str, MessageBody: str, **kwargs) -> Dict[str, Any]:
+        message_id = str(uuid.uuid4())
+        with self._condition:
+            self._messages[message_id] = {
+                'body': MessageBody,
+                'sent': time.time(),
+                'visible_at': 0.0,
+                'receipt': None,
+                'receive_count': 0
+            }
+            self._condition.notify_all()
+        return {'MessageId': message_id}
+    
+    def receive_message(
+        self,
+        QueueUrl: str,
+        MaxNumberOfMessages: int = 1,
+        WaitTimeSeconds: int = 0,
+        VisibilityTimeout: Optional[float] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        deadline = time.monotonic() + WaitTimeSeconds
+        visibility_timeout = self.visibility_timeout if VisibilityTimeout is None else VisibilityTimeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                visible = [message_id for message_id, message in self._messages.items() if message['visible_at'] <= now]
+                if visible or now >= deadline:
+                    break
+                # Wake up when the next in-flight message becomes visible again
+                next_visible = min((message['visible_at'] for message in self._messages.values()), default=deadline)
+                self._condition.wait(max(0.0, min(deadline, next_visible) - now))
+            
+            messages = []
+            for message_id in visible[:min(MaxNumberOfMessages, SQS_MAX_BATCH)]:
+                message = self._messages[message_id]
+                message['receipt'] = f"{message_id}:{uuid.uuid4().hex}"
+                message['visible_at'] = now + visibility_timeout
+                message['receive_count'] += 1
+                messages.append({
+                    'MessageId': message_id,
+                    'ReceiptHandle': message['receipt'],
+                    'Body': message['body'],
+                    'Attributes': {
+                        'SentTimestamp': str(int(message['sent'] * 1000)),
+                        'ApproximateReceiveCount': str(message['receive_count'])
+                    }
+                })
+        return {'Messages': messages} if messages else {}
+    
+    def _find(self, receipt_handle: str) -> Optional[Dict[str, Any]]:
+        message = self._messages.get(receipt_handle.split(':', 1)[0])
+        return message if message is not None and message['receipt'] == receipt_handle else None
+    
+    def delete_message_batch(self, QueueUrl: str, Entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        successful, failed = [], []
+        with self._condition:
+            for entry in Entries:
+                if self._find(entry['ReceiptHandle']) is None:
+                    failed.append({'Id': entry['Id'], 'Code': 'ReceiptHandleIsInvalid', 'SenderFault': True})
+                    continue
+                del self._messages[entry['ReceiptHandle'].split(':', 1)[0]]
+                self.deleted += 1
+                successful.append({'Id': entry['Id']})
+        return {'Successful': successful, 'Failed': failed}
+    
+    def change_message_visibility_batch(self, QueueUrl: str, Entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        successful, failed = [], []
+        with self._condition:
+            for entry in Entries:
+                message = self._find(entry['ReceiptHandle'])
+                if message is None:
+                    failed.append({'Id': entry['Id'], 'Code': 'ReceiptHandleIsInvalid', 'SenderFault': True})
+                    continue
+                message['visible_at'] = time.monotonic() + entry['VisibilityTimeout']
+                successful.append({'Id': entry['Id']})
+            self._condition.notify_all()
+        return {'Successful': successful, 'Failed': failed}
+    
+    def get_queue_attributes(self, QueueUrl: str, AttributeNames: Optional[List[str]] = None) -> Dict[str, Any]:
+        with self._condition:
+            now = time.monotonic()
+            visible = sum(1 for message in self._messages.values() if message['visible_at'] <= now)
+            return {'Attributes': {
+                'ApproximateNumberOfMessages': str(visible),
+                'ApproximateNumberOfMessagesNotVisible': str(len(self._messages) - visible)
+            }}
+
+class QueueWorker:
+    """
+    Long-running worker classifying the videos announced on an SQS queue.
+    
+    A receiver thread long-polls the queue in batches whenever a classification
+    slot is free, so at most ``concurrency`` messages are held at a time. The
+    calling thread writes results, deletes finished messages in batches and
+    extends the visibility timeout of messages still being classified. A message
+    is deleted only after all its videos were written; failed messages are left
+    to reappear after their visibility timeout, so the queue's redrive policy
+    decides when to give up on them.
+    """
+    
+    def __init__(
+        self,
+        classifier: Any,
+        queue_url: str,
+        region: str = "us-east-1",
+        sqs_client: Optional[Any] = None,
+        concurrency: int = 4,
+        batch_size: int = SQS_MAX_BATCH,
+        wait_time: int = 20,
+        visibility_timeout: int = 300,
+        processed: Optional[Container[str]] = None,
+        journal: Optional[Any] = None
+    ):
+        """
+        Initialize the worker.
+        
+        Args:
+            classifier: VideoClassifier or TwoStepVideoClassifier instance
+            queue_url: URL of the queue
+            region: AWS region of the queue
+            sqs_client: SQS client or stand-in such as InMemoryQueue (shared client if not set)
+            concurrency: Number of messages classified at once
+            batch_size: Maximum messages per receive call (at most 10)
+            wait_time: Long polling wait in seconds (at most 20)
+            visibility_timeout: Visibility timeout set on receive and on every extension
+            processed: Videos already written; they are acknowledged without classifying
+            journal: Checkpoint journal recording each written video
+        """
+        self.classifier = classifier
+        self.queue_url = queue_url
+        self.sqs = sqs_client or get_client('sqs', region)
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, min(batch_size, SQS_MAX_BATCH))
+        self.wait_time = max(0, min(wait_time, 20))
+        self.visibility_timeout = visibility_timeout
+        self.processed = processed if processed is not None else set()
+        self.journal = journal
+        self.stop_event = threading.Event()
+        self.processing_latency = LatencyRecorder("classification")
+        self.end_to_end_latency = LatencyRecorder("end-to-end")
+        self.stats = {
+            'received': 0, 'deleted': 0, 'failed': 0, 'skipped': 0,
+            'ignored': 0, 'extended': 0, 'delete_errors': 0
+        }
+        self._slots = threading.Semaphore(self.concurrency)
+        self._received: queue.Queue = queue.Queue()
+        # Messages received and not finished yet
+        self._held = 0
+        self._held_lock = threading.Lock()
+    
+    def stop(self) -> None:
+        """Stop receiving; messages in flight are finished before run returns."""
+        self.stop_event.set()
+    
+    def _receive_loop(self, max_messages: Optional[int], stop_when_idle: bool) -> None:
+        """Receive messages while there are free slots and hand them to the run loop."""
+        try:
+            while not self.stop_event.is_set():
+                if max_messages is not None and self.stats['received'] >= max_messages:
+                    return
+                if not self._slots.acquire(timeout=1.0):
+                    continue
+                # Take as many free slots as one receive call can fill
+                slots = 1
+                limit = self.batch_size if max_messages is None else min(self.batch_size, max_messages - self.stats['received'])
+                while slots < limit and self._slots.acquire(blocking=False):
+                    slots += 1
+                
+                try:
+                    response = self.sqs.receive_message(
+                        QueueUrl=self.queue_url,
+                        MaxNumberOfMessages=slots,
+                        WaitTimeSeconds=self.wait_time,
+                        VisibilityTimeout=self.visibility_timeout,
+                        AttributeNames=['SentTimestamp', 'ApproximateReceiveCount']
+                    )
+                except Exception as e:
+                    logger.error(f"Error receiving from {self.queue_url}: {e}")
+                    for _ in range(slots):
+                        self._slots.release()
+                    time.sleep(1.0)
+                    continue
+                
+                messages = response.get('Messages', [])
+                for _ in range(slots - len(messages)):
+                    self._slots.release()
+                with self._held_lock:
+                    self._held += len(messages)
+                    idle = not messages and self._held == 0
+                for message in messages:
+                    self.stats['received'] += 1
+                    self._received.put(message)
+                
+                # An empty poll with nothing in flight means the queue is drained
+                if stop_when_idle and idle:
+                    logger.info(f"Queue {self.queue_url} is empty, stopping")
+                    return
+        finally:
+            self._received.put(None)
+    
+    def _delete(self, messages: List[Dict[str, Any]]) -> None:
+        """Delete finished messages in batches of up to 10."""
+        for start in range(0, len(messages), SQS_MAX_BATCH):
+            batch = messages[start:start + SQS_MAX_BATCH]
+            try:
+                response = self.sqs.delete_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[{'Id': str(i), 'ReceiptHandle': m['receipt']} for i, m in enumerate(batch)]
+                )
+            except Exception as e:
+                logger.error(f"Error deleting {len(batch)} messages from {self.queue_url}: {e}")
+                self.stats['delete_errors'] += len(batch)
+                continue
+            
+            now = time.time()
+            for entry in response.get('Successful', []):
+                message = batch[int(entry['Id'])]
+                self.stats['deleted'] += 1
+                self.end_to_end_latency.record(message['sent'], now)
+            for entry in response.get('Failed', []):
+                logger.warning(f"Could not delete message {batch[int(entry['Id'])]['id']}: {entry.get('Code')}")
+                self.stats['delete_errors'] += 1
+    
+    def _extend(self, messages: List[Dict[str, Any]]) -> None:
+        """Extend the visibility timeout of messages still being classified."""
+        for start in range(0, len(messages), SQS_MAX_BATCH):
+            batch = messages[start:start + SQS_MAX_BATCH]
+            try:
+                self.sqs.change_message_visibility_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[
+                        {'Id': str(i), 'ReceiptHandle': m['receipt'], 'VisibilityTimeout': self.visibility_timeout}
+                        for i, m in enumerate(batch)
+                    ]
+                )
+                self.stats['extended'] += len(batch)
+            except Exception as e:
+                logger.warning(f"Error extending the visibility of {len(batch)} messages: {e}")
+            for message in batch:
+                message['extended_at'] = time.monotonic()
+    
+    def _classify(self, s3_uri: str) -> Dict[str, Any]:
+        """Classify a video, recording its latency and token usage."""
+        start = time.monotonic()
+        try:
+            result = self.classifier.classify_video(s3_uri, write_csv=False)
+        except Exception:
+            self.processing_latency.record_failure(start, time.monotonic())
+            raise
+        token_usage = result.get('token_usage', {})
+        self.processing_latency.record(
+            start, time.monotonic(), token_usage.get('input_tokens', 0), token_usage.get('output_tokens', 0)
+        )
+        return result
+    
+    def run(self, max_messages: Optional[int] = None, stop_when_idle: bool = False) -> Dict[str, Any]:
+        """
+        Process messages until stopped.
+        
+        Args:
+            max_messages: Stop after receiving this many messages (no limit if not set)
+            stop_when_idle: Stop once a poll finds the queue empty and nothing is in flight
+        
+        Returns:
+            Message counters and latency summaries
+        """
+        receiver = threading.Thread(
+            target=self._receive_loop, args=(max_messages, stop_when_idle), name='queue-receiver', daemon=True
+        )
+        receiver.start()
+        futures: Dict[Future, Dict[str, Any]] = {}
+        in_flight: List[Dict[str, Any]] = []
+        finished: List[Dict[str, Any]] = []
+        last_delete = time.monotonic()
+        receiving = True
+        
+        def finish(message: Dict[str, Any]) -> None:
+            in_flight.remove(message)
+            if message['failed']:
+                self.stats['failed'] += 1
+            else:
+                finished.append(message)
+            with self._held_lock:
+                self._held -= 1
+            self._slots.release()
+        
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='queue-classify') as executor:
+            while receiving or futures or finished:
+                # Start the videos of newly received messages
+                while True:
+                    try:
+                        raw = self._received.get(timeout=0.2 if not futures else 0.0)
+                    except queue.Empty:
+                        break
+                    if raw is None:
+                        receiving = False
+                        break
+                    
+                    attributes = raw.get('Attributes', {})
+                    message = {
+                        'id': raw['MessageId'],
+                        'receipt': raw['ReceiptHandle'],
+                        'sent': int(attributes.get('SentTimestamp', time.time() * 1000)) / 1000,
+                        'extended_at': time.monotonic(),
+                        'remaining': 0,
+                        'failed': False
+                    }
+                    in_flight.append(message)
+                    s3_uris = parse_s3_event(raw['Body'])
+                    if not s3_uris:
+                        logger.info(f"Ignoring message {message['id']} without S3 objects")
+                        self.stats['ignored'] += 1
+                    for s3_uri in s3_uris:
+                        if s3_uri in self.processed:
+                            logger.info(f"Skipping already processed video: {s3_uri}")
+                            self.stats['skipped'] += 1
+                            continue
+                        message['remaining'] += 1
+                        futures[executor.submit(self._classify, s3_uri)] = message
+                    if message['remaining'] == 0:
+                        finish(message)
+                
+                # Write finished classifications from this thread only
+                if futures:
+                    done, _ = wait(list(futures), timeout=0.1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        message = futures.pop(future)
+                        try:
+                            result = future.result()
+                            self.classifier.write_result(result)
+                            if self.journal is not None:
+                                self.journal.record(result['s3_uri'])
+                            logger.info(f"Successfully processed video: {result['s3_uri']} (message {message['id']})")
+                        except Exception as e:
+                            logger.error(f"Error processing message {message['id']}: {e}")
+                            message['failed'] = True
+                        message['remaining'] -= 1
+                        if message['remaining'] == 0:
+                            finish(message)
+                
+                # Deletes are batched, but never held back for more than a second
+                now = time.monotonic()
+                if len(finished) >= SQS_MAX_BATCH or (finished and (now - last_delete >= 1.0 or not futures)):
+                    self._delete(finished)
+                    finished = []
+                    last_delete = now
+                
+                # Slow videos get more time before their message becomes visible again
+                due = [m for m in in_flight if now - m['extended_at'] >= self.visibility_timeout / 2]
+                if due:
+                    self._extend(due)
+        
+        receiver.join()
+        summary = {
+            **self.stats,
+            'classification_latency': self.processing_latency.summary(),
+            'end_to_end_latency': self.end_to_end_latency.summary()
+        }
+        logger.info(f"Queue worker stats: {summary}")
+        return summary
@@ -0,0 +1,358 @@
+"""
+Per-model rate governor for Bedrock calls.
+"""
+import time
+import random
+import logging
+import threading
+from typing import Dict, Any, Callable, Optional, TypeVar
+from botocore.exceptions import ClientError, HTTPClientError, ConnectionError as BotocoreConnectionError
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+THROTTLING_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'ModelNotReadyException'
+}
+
+TRANSIENT_ERROR_CODES = {
+    'InternalServerException',
+    'InternalFailure',
+    'ServiceFailure',
+    'RequestTimeout',
+    'RequestTimeoutException'
+}
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    Check whether an exception is a Bedrock throttling error.
+    
+    Args:
+        error: Exception raised by a boto3 call
+    
+    Returns:
+        True if the call was throttled
+    """
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+    return False
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Check whether an exception is a transient failure worth retrying.
+    
+    These are the connection errors and server errors botocore would otherwise
+    retry itself; the governed clients make a single attempt.
+    
+    Args:
+        error: Exception raised by a boto3 call
+    
+    Returns:
+        True if the call failed on a connection or server error
+    """
+    if isinstance(error, (BotocoreConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return error.response.get('Error', {}).get('Code') in TRANSIENT_ERROR_CODES or status in (500, 502, 503, 504)
+    return False
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a per-minute rate."""
+    
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Initialize the token bucket.
+        
+        Args:
+            rate_per_minute: Tokens added per minute
+            capacity: Maximum number of stored tokens (defaults to one minute of quota)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def acquire(self, amount: float) -> float:
+        """
+        Take tokens from the bucket, blocking until they are available.
+        
+        Args:
+            amount: Number of tokens to take
+        
+        Returns:
+            Time spent waiting in seconds
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+    
+    def adjust(self, amount: float) -> None:
+        """
+        Correct an earlier estimate once the real cost is known.
+        
+        Args:
+            amount: Extra tokens to take (positive) or tokens to give back (negative)
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease."""
+    
+    def __init__(
+        self,
+        initial: int = 8,
+        minimum: int = 1,
+        maximum: int = 64,
+        decrease_factor: float = 0.5
+    ):
+        """
+        Initialize the limiter.
+        
+        Args:
+            initial: Initial concurrency limit
+            minimum: Lowest concurrency limit
+            maximum: Highest concurrency limit
+            decrease_factor: Factor applied to the limit on throttling
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._condition = threading.Condition()
+    
+    def acquire(self) -> float:
+        """
+        Wait for a free slot.
+        
+        Returns:
+            Time spent waiting in seconds
+        """
+        start = time.monotonic()
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        return time.monotonic() - start
+    
+    def release(self, throttled: bool = False) -> None:
+        """
+        Release a slot and adapt the limit.
+        
+        Args:
+            throttled: Whether the call was throttled
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            else:
+                # Grows by about one slot per full window of successful calls
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+class RateGovernor:
+    """
+    Rate governor for a single model.
+    
+    Calls wait for a concurrency slot and for request and token budget before they
+    are sent. Throttled calls shrink the concurrency limit and are retried with
+    exponential backoff, so callers run at the quota without fixed sleeps.
+    Transient connection and server errors are retried with the same backoff
+    without shrinking the limit. The governed clients do not retry in botocore,
+    so every attempt is paced and counted here.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        initial_concurrency: int = 8,
+        max_concurrency: int = 64,
+        max_retries: int = 6
+    ):
+        """
+        Initialize the rate governor.
+        
+        Args:
+            name: Name used in logs, usually the model ID
+            requests_per_minute: Request quota (unlimited if None)
+            tokens_per_minute: Token quota (unlimited if None)
+            initial_concurrency: Initial concurrency limit
+            max_concurrency: Highest concurrency limit
+            max_retries: Maximum retries of a throttled or transiently failed call
+        """
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.limiter = AIMDLimiter(initial=min(initial_concurrency, max_concurrency), maximum=max_concurrency)
+        self.max_retries = max_retries
+        
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttles = 0
+        self.wait_time = 0.0
+    
+    def call(
+        self,
+        fn: Callable[[], T],
+        estimated_tokens: int = 0,
+        count_tokens: Optional[Callable[[T], int]] = None
+    ) -> T:
+        """
+        Call a function under the governor.
+        
+        Args:
+            fn: Function performing the API call
+            estimated_tokens: Token cost charged before the call
+            count_tokens: Function returning the actual token cost from the result
+        
+        Returns:
+            Result of fn
+        """
+        for attempt in range(self.max_retries + 1):
+            waited = self.limiter.acquire()
+            if self.request_bucket is not None:
+                waited += self.request_bucket.acquire(1)
+            if self.token_bucket is not None:
+                waited += self.token_bucket.acquire(estimated_tokens)
+            
+            throttled = False
+            transient = False
+            try:
+                result = fn()
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                transient = not throttled and is_transient_error(e)
+                if not (throttled or transient) or attempt == self.max_retries:
+                    raise
+            finally:
+                self.limiter.release(throttled=throttled)
+                with self._lock:
+                    self.requests += 1
+                    self.wait_time += waited
+                    if throttled:
+                        self.throttles += 1
+            
+            if not throttled and not transient:
+                if self.token_bucket is not None and count_tokens is not None:
+                    self.token_bucket.adjust(count_tokens(result) - estimated_tokens)
+                return result
+            
+            backoff = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+            if throttled:
+                logger.warning(
+                    f"Throttled by {self.name}; concurrency limit now {int(self.limiter.limit)}, "
+                    f"retrying in {backoff:.1f}s (attempt {attempt + 1}/{self.max_retries})"
+                )
+            else:
+                logger.warning(
+                    f"Transient error from {self.name}, "
+                    f"retrying in {backoff:.1f}s (attempt {attempt + 1}/{self.max_retries})"
+                )
+            time.sleep(backoff)
+            with self._lock:
+                self.wait_time += backoff
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get governor counters.
+        
+        Returns:
+            Dictionary with request, throttle and wait time counters
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'throttles': self.throttles,
+                'wait_time_s': round(self.wait_time, 3),
+                'concurrency_limit': int(self.limiter.limit)
+            }
+
+_lock = threading.Lock()
+_governors: Dict[str, RateGovernor] = {}
+_quotas: Dict[str, Dict[str, Any]] = {}
+
+def configure_governor(
+    model_id: str,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    initial_concurrency: int = 8,
+    max_concurrency: int = 64
+) -> RateGovernor:
+    """
+    Set the quotas of a model's rate governor.
+    
+    Args:
+        model_id: Model ID
+        requests_per_minute: Request quota (unlimited if None)
+        tokens_per_minute: Token quota (unlimited if None)
+        initial_concurrency: Initial concurrency limit
+        max_concurrency: Highest concurrency limit
+    
+    Returns:
+        The new rate governor
+    """
+    with _lock:
+        _quotas[model_id] = {
+            'requests_per_minute': requests_per_minute,
+            'tokens_per_minute': tokens_per_minute,
+            'initial_concurrency': initial_concurrency,
+            'max_concurrency': max_concurrency
+        }
+        _governors[model_id] = RateGovernor(model_id, **_quotas[model_id])
+        return _governors[model_id]
+
+def get_governor(model_id: str) -> RateGovernor:
+    """
+    Get the rate governor of a model, creating an unlimited one if needed.
+    
+    Args:
+        model_id: Model ID
+    
+    Returns:
+        Rate governor
+    """
+    governor = _governors.get(model_id)
+    if governor is not None:
+        return governor
+    
+    with _lock:
+        if model_id not in _governors:
+            _governors[model_id] = RateGovernor(model_id, **_quotas.get(model_id, {}))
+        return _governors[model_id]
+
+def get_governor_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Get the counters of every rate governor.
+    
+    Returns:
+        Mapping of model ID to governor counters
+    """
+    with _lock:
+        governors = dict(_governors)
+    return {model_id: governor.stats() for model_id, governor in governors.items()}
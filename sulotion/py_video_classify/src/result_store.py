@@ -0,0 +1,310 @@
+"""
+Columnar result store backed by a Parquet dataset.
+"""
+import os
+import csv
+import uuid
+import glob
+import logging
+import functools
+import threading
+from itertools import islice
+from typing import Dict, Any, List, Optional, Iterable, Set, Tuple
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ['csv', 'parquet']
+
+# Largest row group written; the CSV export reads one row group at a time
+ROW_GROUP_ROWS = 10000
+
+def _require_pyarrow() -> None:
+    """Fail early with an install hint when the Parquet engine is missing."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError("Parquet output needs pyarrow; install it with `pip install pyarrow`") from e
+
+def store_path_for(csv_path: str) -> str:
+    """
+    Get the store directory that goes with a CSV output path.
+    
+    Args:
+        csv_path: Path of the CSV file
+    
+    Returns:
+        Path of the Parquet dataset directory next to it
+    """
+    root, _ = os.path.splitext(csv_path)
+    return f"{root}.parquet"
+
+def is_result_store(path: str) -> bool:
+    """Whether a path points to a Parquet dataset rather than a CSV file."""
+    return os.path.isdir(path) or path.endswith('.parquet')
+
+def load_results(path: str, key_column: str = 'S3 URI', csv_kwargs: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """
+    Load results from a CSV file or a Parquet dataset.
+    
+    Args:
+        path: CSV file or Parquet dataset directory
+        key_column: Column identifying a result; only the last row of each key is kept
+        csv_kwargs: Extra keyword arguments for pd.read_csv
+    
+    Returns:
+        Results DataFrame with stripped column names
+    """
+    if is_result_store(path):
+        df = ResultStore(path, key_column=key_column).read()
+    else:
+        df = pd.read_csv(path, **(csv_kwargs or {}))
+        df.columns = df.columns.str.strip()
+    if key_column in df.columns:
+        df = df.drop_duplicates(key_column, keep='last').reset_index(drop=True)
+    return df
+
+def reorder_frame(df: pd.DataFrame, order: Iterable[Any], key_column: str = 'S3 URI') -> pd.DataFrame:
+    """
+    Reorder results to follow a list of keys.
+    
+    Both df and order are held in memory; ResultStore.export_csv streams
+    instead for stores too large for that.
+    
+    Args:
+        df: Results DataFrame
+        order: Keys in the wanted order; keys missing from df are dropped
+        key_column: Column holding the keys
+    
+    Returns:
+        DataFrame with one row per key found, in the given order
+    """
+    order_df = pd.DataFrame({key_column: list(order)}).drop_duplicates(key_column)
+    return order_df.merge(df.drop_duplicates(key_column, keep='last'), on=key_column, how='inner')
+
+class ResultStore:
+    """
+    Buffered result store keyed by S3 URI.
+    
+    Rows are buffered in memory and written as one Parquet file per flush into
+    a dataset directory, so every flushed row survives a crash and nothing is
+    rewritten. Readers load the dataset as a single DataFrame in which the
+    latest row of each key wins; a streaming CSV export is provided for tools
+    that expect the legacy files.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        columns: Optional[List[str]] = None,
+        key_column: str = 'S3 URI',
+        flush_rows: int = 256,
+        seed_csv: Optional[str] = None,
+        csv_kwargs: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Initialize the store.
+        
+        Args:
+            path: Directory of the Parquet dataset (created if missing)
+            columns: Column order of the rows; taken from the data if not set
+            key_column: Column identifying a result
+            flush_rows: Number of buffered rows that triggers a flush
+            seed_csv: CSV file whose rows are imported when the store is created,
+                so switching an existing output to the store keeps its results
+            csv_kwargs: Extra keyword arguments for reading seed_csv
+        """
+        _require_pyarrow()
+        self.path = path
+        self.columns = list(columns) if columns else None
+        self.key_column = key_column
+        self.flush_rows = max(1, flush_rows)
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._keys: Set[Any] = set()
+        
+        is_new = not os.path.isdir(path)
+        os.makedirs(path, exist_ok=True)
+        for part in self._parts():
+            self._keys.update(pd.read_parquet(part, columns=[key_column])[key_column])
+        
+        if is_new and seed_csv and os.path.exists(seed_csv):
+            seed_df = pd.read_csv(seed_csv, **(csv_kwargs or {}))
+            seed_df.columns = seed_df.columns.str.strip()
+            if not seed_df.empty:
+                self._write_part(seed_df)
+                self._keys.update(seed_df[key_column])
+                logger.info(f"Imported {len(seed_df)} rows from {seed_csv} into result store {path}")
+        
+        logger.info(f"Opened result store {path} with {len(self._keys)} results")
+    
+    def __contains__(self, key: Any) -> bool:
+        return key in self._keys
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def __enter__(self) -> 'ResultStore':
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close()
+        return False
+    
+    def _parts(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+    
+    def _write_part(self, df: pd.DataFrame) -> None:
+        """Write a DataFrame as a new part file, atomically."""
+        # Part numbers give the write order, which decides the latest row of a key
+        parts = self._parts()
+        number = int(os.path.basename(parts[-1]).split('-')[1]) + 1 if parts else 0
+        name = f"part-{number:06d}-{uuid.uuid4().hex[:8]}.parquet"
+        temp_path = os.path.join(self.path, f".{name}.tmp")
+        df.to_parquet(temp_path, engine='pyarrow', index=False, row_group_size=max(min(len(df), ROW_GROUP_ROWS), 1))
+        os.replace(temp_path, os.path.join(self.path, name))
+    
+    def append(self, row: Dict[str, Any]) -> None:
+        """
+        Add a result row.
+        
+        Args:
+            row: Mapping of column name to value; it must contain the key column
+        """
+        with self._lock:
+            self._buffer.append(row)
+            self._keys.add(row[self.key_column])
+            if len(self._buffer) >= self.flush_rows:
+                self._flush_locked()
+    
+    def flush(self) -> None:
+        """Write the buffered rows as a new part of the dataset."""
+        with self._lock:
+            self._flush_locked()
+    
+    def _flush_locked(self) -> None:
+        if not self._buffer:
+            return
+        df = pd.DataFrame(self._buffer, columns=self.columns)
+        self._write_part(df)
+        logger.info(f"Flushed {len(self._buffer)} rows to result store {self.path}")
+        self._buffer = []
+    
+    def close(self) -> None:
+        """Flush the remaining rows."""
+        self.flush()
+    
+    def read(self) -> pd.DataFrame:
+        """
+        Read all results, including rows not flushed yet.
+        
+        Returns:
+            DataFrame with the latest row of each key, in the order they were written
+        """
+        with self._lock:
+            frames = [pd.read_parquet(part) for part in self._parts()]
+            if self._buffer:
+                frames.append(pd.DataFrame(self._buffer, columns=self.columns))
+        
+        if not frames:
+            return pd.DataFrame(columns=self.columns or [self.key_column])
+        df = pd.concat(frames, ignore_index=True)
+        if self.columns:
+            df = df.reindex(columns=[*self.columns, *[c for c in df.columns if c not in self.columns]])
+        return df.drop_duplicates(self.key_column, keep='last').reset_index(drop=True)
+    
+    def _locate_rows(self) -> Tuple[List[Tuple[str, int]], Dict[Any, int], List[str]]:
+        """
+        Find where the latest row of each key is stored, reading only the key column.
+        
+        Returns:
+            Tuple of (row groups as (part path, row group index) in write order,
+            mapping of key to its row group number << 32 | row within the group,
+            column names of all parts)
+        """
+        import pyarrow.parquet as pq
+        
+        groups: List[Tuple[str, int]] = []
+        locations: Dict[Any, int] = {}
+        columns = list(self.columns or [])
+        for part in self._parts():
+            parquet_file = pq.ParquetFile(part)
+            columns += [column for column in parquet_file.schema_arrow.names if column not in columns]
+            for index in range(parquet_file.num_row_groups):
+                keys = parquet_file.read_row_group(index, columns=[self.key_column]).column(0).to_pylist()
+                group = len(groups)
+                groups.append((part, index))
+                for row, key in enumerate(keys):
+                    locations[key] = group << 32 | row
+        return groups, locations, columns or [self.key_column]
+    
+    def export_csv(self, csv_path: str, order: Optional[Iterable[Any]] = None, chunk_size: int = 10000) -> int:
+        """
+        Write the results as a CSV file in the legacy quoting style.
+        
+        The export streams: order is consumed chunk_size keys at a time and only
+        the row groups holding the rows of the current chunk are read, so memory
+        use grows with the number of stored keys (one location per key) but not
+        with the length of order or the size of the rows.
+        
+        Args:
+            csv_path: Destination CSV file (overwritten)
+            order: Keys in the wanted row order, e.g. read lazily from a manifest;
+                rows of other keys follow them in the order they were written
+            chunk_size: Keys of order merged with the store at a time
+        
+        Returns:
+            Number of rows written
+        """
+        import pyarrow.parquet as pq
+        
+        self.flush()
+        groups, locations, columns = self._locate_rows()
+        
+        # Rows are written in roughly manifest order, so a few recent row groups cover a chunk
+        @functools.lru_cache(maxsize=8)
+        def read_group(group: int) -> pd.DataFrame:
+            part, index = groups[group]
+            return pq.ParquetFile(part).read_row_group(index).to_pandas()
+        
+        written = 0
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            def write_rows(found: List[int]) -> None:
+                nonlocal written
+                # Read each row group once, then put the rows back in the requested order
+                rows_by_group: Dict[int, List[Tuple[int, int]]] = {}
+                for position, location in enumerate(found):
+                    rows_by_group.setdefault(location >> 32, []).append((position, location & 0xFFFFFFFF))
+                frames = []
+                positions = []
+                for group, rows in rows_by_group.items():
+                    frames.append(read_group(group).iloc[[row for _, row in rows]])
+                    positions.extend(position for position, _ in rows)
+                chunk = pd.concat(frames, ignore_index=True)
+                chunk.index = positions
+                chunk = chunk.sort_index().reindex(columns=columns)
+                chunk.to_csv(f, header=written == 0, index=False, quoting=csv.QUOTE_ALL, escapechar='\\')
+                written += len(chunk)
+            
+            if order is not None:
+                keys = iter(order)
+                while True:
+                    chunk_keys = list(islice(keys, chunk_size))
+                    if not chunk_keys:
+                        break
+                    # Popping the exported keys also skips repeated keys and leaves the unordered rest
+                    found = [locations.pop(key) for key in chunk_keys if key in locations]
+                    if found:
+                        write_rows(found)
+            
+            remaining = sorted(locations.values())
+            for start in range(0, len(remaining), chunk_size):
+                write_rows(remaining[start:start + chunk_size])
+            
+            if written == 0:
+                pd.DataFrame(columns=columns).to_csv(f, index=False, quoting=csv.QUOTE_ALL, escapechar='\\')
+        
+        logger.info(f"Exported {written} results from {self.path} to {csv_path}")
+        return written
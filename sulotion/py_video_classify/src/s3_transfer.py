@@ -0,0 +1,189 @@
+"""
+Shared S3 transfer settings and skip-if-identical uploads.
+"""
+import os
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+from .aws_clients import get_client
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+DEFAULT_PART_SIZE = 8 * MB
+DEFAULT_TRANSFER_CONCURRENCY = 10
+
+_lock = threading.Lock()
+_transfer_config: Optional[TransferConfig] = None
+_transfer_settings: Dict[str, int] = {
+    'part_size': DEFAULT_PART_SIZE,
+    'max_concurrency': DEFAULT_TRANSFER_CONCURRENCY
+}
+_upload_stats: Dict[str, int] = {'uploaded': 0, 'skipped': 0, 'uploaded_bytes': 0, 'skipped_bytes': 0}
+
+def configure_transfers(part_size: Optional[int] = None, max_concurrency: Optional[int] = None) -> None:
+    """
+    Change the settings of the shared transfer configuration.
+    
+    Args:
+        part_size: Multipart threshold and part size in bytes (at least 5 MB)
+        max_concurrency: Parts transferred at once per file
+    """
+    global _transfer_config
+    with _lock:
+        if part_size is not None:
+            _transfer_settings['part_size'] = max(5 * MB, part_size)
+        if max_concurrency is not None:
+            _transfer_settings['max_concurrency'] = max(1, max_concurrency)
+        _transfer_config = None
+        logger.info(f"Configured S3 transfers: {_transfer_settings}")
+
+def get_transfer_config() -> TransferConfig:
+    """
+    Get the process-wide S3 transfer configuration.
+    
+    Files of at least one part size are uploaded in parts of that size, several
+    at a time, so the ETags of objects uploaded here can be recomputed locally.
+    
+    Returns:
+        boto3 TransferConfig
+    """
+    global _transfer_config
+    with _lock:
+        if _transfer_config is None:
+            _transfer_config = TransferConfig(
+                multipart_threshold=_transfer_settings['part_size'],
+                multipart_chunksize=_transfer_settings['part_size'],
+                max_concurrency=_transfer_settings['max_concurrency'],
+                use_threads=True
+            )
+        return _transfer_config
+
+def compute_etag(file_path: str, part_size: int) -> str:
+    """
+    Compute the S3 ETag a file gets when uploaded with the given part size.
+    
+    Args:
+        file_path: Path to the file
+        part_size: Multipart threshold and part size in bytes
+    
+    Returns:
+        MD5 hex digest for single-part uploads, otherwise the MD5 of the part
+        digests followed by the part count
+    """
+    size = os.path.getsize(file_path)
+    part_digests: List[bytes] = []
+    with open(file_path, 'rb') as f:
+        remaining = size
+        while remaining > 0 or not part_digests:
+            # Hash each part in blocks so large parts are never held in memory
+            digest = hashlib.md5()
+            part_remaining = min(part_size, remaining)
+            while part_remaining > 0:
+                block = f.read(min(MB, part_remaining))
+                if not block:
+                    break
+                digest.update(block)
+                part_remaining -= len(block)
+            part_digests.append(digest.digest())
+            remaining -= min(part_size, remaining)
+    
+    if size < part_size:
+        return part_digests[0].hex()
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+def _candidate_part_sizes(size: int, part_count: int) -> List[int]:
+    """Part sizes, in whole MB as most tools use, that split a file into part_count parts."""
+    candidates = [_transfer_settings['part_size']]
+    smallest = -(-size // part_count)
+    part_size = -(-smallest // MB) * MB
+    while -(-size // part_size) == part_count and len(candidates) < 8:
+        if part_size not in candidates:
+            candidates.append(part_size)
+        part_size += MB
+    return [candidate for candidate in candidates if -(-size // candidate) == part_count]
+
+def object_matches_file(file_path: str, head: Dict[str, Any]) -> bool:
+    """
+    Check whether an S3 object already holds the content of a local file.
+    
+    Args:
+        file_path: Path to the local file
+        head: head_object response of the S3 object
+    
+    Returns:
+        True if the sizes match and the local ETag equals the object's ETag
+    """
+    size = os.path.getsize(file_path)
+    if head.get('ContentLength') != size:
+        return False
+    
+    etag = head.get('ETag', '').strip('"')
+    if '-' not in etag:
+        return compute_etag(file_path, size + 1) == etag
+    
+    # Multipart ETags depend on the part size the object was uploaded with
+    part_count = etag.rsplit('-', 1)[1]
+    if not part_count.isdigit():
+        return False
+    return any(compute_etag(file_path, part_size) == etag for part_size in _candidate_part_sizes(size, int(part_count)))
+
+def upload_file(
+    file_path: str,
+    bucket_name: str,
+    object_key: str,
+    region: str = "us-east-1",
+    skip_if_identical: bool = True,
+    extra_args: Optional[Dict[str, Any]] = None
+) -> bool:
+    """
+    Upload a file to S3 with the shared transfer configuration.
+    
+    Args:
+        file_path: Path to the file
+        bucket_name: S3 bucket name
+        object_key: S3 object key
+        region: AWS region
+        skip_if_identical: Skip the upload if the object already has the same content
+        extra_args: ExtraArgs passed to upload_file, e.g. ContentType
+    
+    Returns:
+        True if the file was uploaded, False if the upload was skipped
+    """
+    s3_client = get_client('s3', region)
+    size = os.path.getsize(file_path)
+    
+    if skip_if_identical:
+        try:
+            head = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+            if object_matches_file(file_path, head):
+                logger.info(f"Skipping upload of {file_path}, s3://{bucket_name}/{object_key} is identical")
+                with _lock:
+                    _upload_stats['skipped'] += 1
+                    _upload_stats['skipped_bytes'] += size
+                return False
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                raise
+    
+    s3_client.upload_file(file_path, bucket_name, object_key, ExtraArgs=extra_args, Config=get_transfer_config())
+    with _lock:
+        _upload_stats['uploaded'] += 1
+        _upload_stats['uploaded_bytes'] += size
+    return True
+
+def get_upload_stats() -> Dict[str, int]:
+    """
+    Get the upload counters of the process.
+    
+    Returns:
+        Counts and bytes of uploaded and skipped files
+    """
+    with _lock:
+        return dict(_upload_stats)
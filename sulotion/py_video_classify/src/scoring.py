@@ -0,0 +1,182 @@
+"""
+Deterministic scoring of classification results against ground truth.
+"""
+import re
+import json
+import logging
+from typing import Dict, Any, List
+import numpy as np
+import pandas as pd
+
+from .json_repair import repair_json
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Label groups that are scored separately; category levels are full paths so a
+# level-2 label only matches under the same level-1 parent
+SCORE_GROUPS = ['level1', 'level2', 'level3', 'tags']
+
+PRED_CATEGORY_COLUMNS = ['new catetory', 'Classification Result', 'catetory']
+PRED_TAG_COLUMNS = ['new tags', 'Tags', 'tags']
+TRUE_CATEGORY_COLUMNS = ['catetory', 'Classification Result']
+TRUE_TAG_COLUMNS = ['tags', 'Tags']
+
+def resolve_column(df: pd.DataFrame, candidates: List[str]) -> str:
+    """
+    Find the first candidate column present in a DataFrame.
+    
+    Args:
+        df: DataFrame to search
+        candidates: Column names in order of preference
+    
+    Returns:
+        Name of the column
+    """
+    for column in candidates:
+        if column in df.columns:
+            return column
+    raise KeyError(f"None of the columns {candidates} found in {list(df.columns)}")
+
+def parse_json_cell(value: Any) -> List[Any]:
+    """
+    Parse a JSON list stored in a CSV cell.
+    
+    Args:
+        value: Cell value
+    
+    Returns:
+        Parsed list, empty if the cell is blank or unparseable
+    """
+    if not isinstance(value, str) or not value.strip():
+        return []
+    try:
+        parsed = json.loads(value)
+    except json.JSONDecodeError:
+        try:
+            parsed, _ = repair_json(value)
+        except ValueError:
+            return []
+    
+    if isinstance(parsed, dict):
+        parsed = parsed.get('catetorys', parsed.get('tags', [parsed]))
+    return parsed if isinstance(parsed, list) else []
+
+def normalize_label(label: Any) -> str:
+    """Lower-case a label and collapse whitespace so formatting differences still match."""
+    return re.sub(r'\s+', ' ', str(label)).strip().lower()
+
+def explode_labels(categories: pd.Series, tags: pd.Series) -> pd.DataFrame:
+    """
+    Flatten category and tag cells into one row per (video, group, label).
+    
+    Args:
+        categories: JSON category lists, one per video
+        tags: JSON tag lists, one per video
+    
+    Returns:
+        DataFrame with columns row, group and label, without duplicates
+    """
+    records = []
+    for row, cell in enumerate(categories):
+        for category in parse_json_cell(cell):
+            if not isinstance(category, dict):
+                continue
+            level1 = normalize_label(category.get('catetory1', ''))
+            level2 = f"{level1}/{normalize_label(category.get('catetory2', ''))}"
+            if level1:
+                records.append((row, 'level1', level1))
+            if category.get('catetory2'):
+                records.append((row, 'level2', level2))
+            level3 = category.get('catetory3', [])
+            for label in (level3 if isinstance(level3, list) else [level3]):
+                if label:
+                    records.append((row, 'level3', f"{level2}/{normalize_label(label)}"))
+    
+    for row, cell in enumerate(tags):
+        for tag in parse_json_cell(cell):
+            label = normalize_label(tag.get('tag', '') if isinstance(tag, dict) else tag)
+            if label:
+                records.append((row, 'tags', label))
+    
+    return pd.DataFrame(records, columns=['row', 'group', 'label']).drop_duplicates()
+
+def _count(labels: pd.DataFrame, n_rows: int) -> np.ndarray:
+    """Count labels per (row, group) as an n_rows x len(SCORE_GROUPS) matrix."""
+    counts = labels.groupby(['row', 'group']).size().unstack(fill_value=0)
+    return counts.reindex(index=range(n_rows), columns=SCORE_GROUPS, fill_value=0).to_numpy(dtype=float)
+
+def score_frame(
+    merged_df: pd.DataFrame,
+    pred_category_column: str,
+    pred_tag_column: str,
+    true_category_column: str,
+    true_tag_column: str,
+    category_weight: float = 0.5
+) -> pd.DataFrame:
+    """
+    Score every row of a merged prediction/ground-truth DataFrame at once.
+    
+    Set overlap is computed with one join over the flattened labels, and all
+    metrics are derived from the resulting count matrices with NumPy. A group
+    where both sides are empty counts as a perfect match.
+    
+    Args:
+        merged_df: DataFrame with prediction and ground truth columns
+        pred_category_column: Column with predicted categories
+        pred_tag_column: Column with predicted tags
+        true_category_column: Column with ground truth categories
+        true_tag_column: Column with ground truth tags
+        category_weight: Weight of the category score in the overall score
+    
+    Returns:
+        DataFrame aligned with merged_df holding, per group, precision, recall,
+        f1 and jaccard columns, plus exact_match, category_accuracy,
+        tag_accuracy and accuracy_score
+    """
+    n_rows = len(merged_df)
+    pred = explode_labels(merged_df[pred_category_column], merged_df[pred_tag_column])
+    true = explode_labels(merged_df[true_category_column], merged_df[true_tag_column])
+    
+    pred_count = _count(pred, n_rows)
+    true_count = _count(true, n_rows)
+    hits = _count(pred.merge(true, on=['row', 'group', 'label']), n_rows)
+    
+    union = pred_count + true_count - hits
+    both_empty = union == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(pred_count > 0, hits / pred_count, both_empty.astype(float))
+        recall = np.where(true_count > 0, hits / true_count, both_empty.astype(float))
+        f1 = np.where(both_empty, 1.0, 2 * hits / (pred_count + true_count))
+        jaccard = np.where(both_empty, 1.0, hits / union)
+    
+    scores = pd.DataFrame(index=merged_df.index)
+    for index, group in enumerate(SCORE_GROUPS):
+        scores[f'{group}_precision'] = precision[:, index]
+        scores[f'{group}_recall'] = recall[:, index]
+        scores[f'{group}_f1'] = f1[:, index]
+        scores[f'{group}_jaccard'] = jaccard[:, index]
+    
+    # Exact match means the same set of full category paths
+    level3 = SCORE_GROUPS.index('level3')
+    scores['exact_match'] = (hits[:, level3] == pred_count[:, level3]) & (hits[:, level3] == true_count[:, level3])
+    
+    scores['category_accuracy'] = f1[:, :3].mean(axis=1)
+    scores['tag_accuracy'] = f1[:, SCORE_GROUPS.index('tags')]
+    scores['accuracy_score'] = category_weight * scores['category_accuracy'] + (1 - category_weight) * scores['tag_accuracy']
+    return scores
+
+def summarize_scores(scores: pd.DataFrame) -> Dict[str, float]:
+    """
+    Average the per-row scores.
+    
+    Args:
+        scores: DataFrame returned by score_frame
+    
+    Returns:
+        Mapping of metric name to mean value
+    """
+    if scores.empty:
+        return {column: 0.0 for column in scores.columns}
+    return {column: float(value) for column, value in scores.mean(numeric_only=True).items()}
@@ -0,0 +1,739 @@
+"""
+Simulated AWS services for offline benchmarks.
+"""
+import io
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from botocore.exceptions import ClientError
+
+from .aws_clients import set_client_factory
+from .common import estimate_tokens
+from .metrics import LatencyRecorder
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Settings given as dictionaries in a configuration and turned into LatencyModel objects
+LATENCY_SETTINGS = ('latency', 'embedding_latency', 'job_latency')
+
+class LatencyModel:
+    """
+    Random latency of a simulated request.
+    
+    The base latency is lognormal, which gives the long right tail real services
+    show, and each input and output token adds a fixed cost on top.
+    """
+    
+    def __init__(
+        self,
+        median: float = 0.3,
+        sigma: float = 0.3,
+        per_input_token: float = 0.0,
+        per_output_token: float = 0.0,
+        minimum: float = 0.0
+    ):
+        """
+        Initialize the latency model.
+        
+        Args:
+            median: Median base latency in seconds
+            sigma: Standard deviation of the log of the base latency (0 for a fixed latency)
+            per_input_token: Seconds added per input token
+            per_output_token: Seconds added per output token
+            minimum: Lowest latency in seconds
+        """
+        self.median = median
+        self.sigma = sigma
+        self.per_input_token = per_input_token
+        self.per_output_token = per_output_token
+        self.minimum = minimum
+    
+    def sample(self, rng: random.Random, input_tokens: int = 0, output_tokens: int = 0) -> float:
+        """
+        Draw the latency of one request.
+        
+        Args:
+            rng: Random number generator
+            input_tokens: Input tokens of the request
+            output_tokens: Output tokens of the response
+        
+        Returns:
+            Latency in seconds
+        """
+        base = self.median * math.exp(rng.gauss(0.0, self.sigma)) if self.sigma > 0 else self.median
+        latency = base + input_tokens * self.per_input_token + output_tokens * self.per_output_token
+        return max(self.minimum, latency)
+
+def _client_error(code: str, message: str, operation: str) -> ClientError:
+    """Build a ClientError like the ones boto3 raises."""
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+class SimulatedService:
+    """
+    Base class of the simulated clients.
+    
+    Each request sleeps for a latency drawn from a LatencyModel and is rejected
+    with a ThrottlingException at a configurable rate, or whenever more requests
+    are in flight than the simulated service accepts. Latencies and tokens are
+    recorded per operation.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        throttle_rate: float = 0.0,
+        max_concurrency: Optional[int] = None,
+        reject_latency: float = 0.02,
+        seed: int = 0
+    ):
+        """
+        Initialize the service.
+        
+        Args:
+            name: Service name used in summaries
+            throttle_rate: Fraction of requests rejected with a throttling error
+            max_concurrency: Requests in flight above which requests are throttled (unlimited if None)
+            reject_latency: Longest time a throttled request takes to be rejected
+            seed: Seed of the random number generator
+        """
+        self.name = name
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.reject_latency = reject_latency
+        self.seed = seed
+        self.in_flight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.recorders: Dict[str, LatencyRecorder] = {}
+    
+    def _recorder(self, operation: str) -> LatencyRecorder:
+        """Get the recorder of an operation, creating it on first use."""
+        with self._lock:
+            if operation not in self.recorders:
+                self.recorders[operation] = LatencyRecorder(f"{self.name}.{operation}")
+            return self.recorders[operation]
+    
+    def _request(
+        self,
+        operation: str,
+        latency: LatencyModel,
+        input_tokens: int = 0,
+        output_tokens: int = 0
+    ) -> float:
+        """
+        Simulate the round trip of one request.
+        
+        Args:
+            operation: API operation name
+            latency: Latency model of the operation
+            input_tokens: Input tokens of the request
+            output_tokens: Output tokens of the response
+        
+        Returns:
+            Simulated latency in seconds
+        
+        Raises:
+            ClientError: ThrottlingException if the request is throttled
+        """
+        recorder = self._recorder(operation)
+        start = time.monotonic()
+        with self._lock:
+            self.in_flight += 1
+            throttled = (
+                (self.max_concurrency is not None and self.in_flight > self.max_concurrency)
+                or self._rng.random() < self.throttle_rate
+            )
+            delay = latency.sample(self._rng, input_tokens, output_tokens)
+        
+        try:
+            if throttled:
+                # Throttled requests are rejected before the model does any work
+                time.sleep(min(delay, self.reject_latency))
+                recorder.record_failure(start, time.monotonic())
+                raise _client_error('ThrottlingException', 'Rate exceeded (simulated)', operation)
+            
+            time.sleep(delay)
+            recorder.record(start, time.monotonic(), input_tokens, output_tokens)
+            return delay
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+    
+    def reset(self) -> None:
+        """Forget the recorded requests."""
+        with self._lock:
+            self.recorders = {}
+    
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Summarize the recorded requests.
+        
+        Returns:
+            Mapping of operation to LatencyRecorder summary; failures are throttled requests
+        """
+        with self._lock:
+            recorders = dict(self.recorders)
+        return {operation: recorder.summary() for operation, recorder in recorders.items()}
+
+class SimulatedS3(SimulatedService):
+    """
+    In-memory S3 client.
+    
+    Objects put into the client are stored in memory. Any other key reads as a
+    video whose ETag and size are derived from the key, so manifests of made-up
+    URIs can be processed; a fraction of them can be given the content of a
+    small pool of shared videos to exercise duplicate detection.
+    """
+    
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        video_size: int = 5 * 1024 * 1024,
+        duplicate_rate: float = 0.0,
+        duplicate_pool: int = 10,
+        throttle_rate: float = 0.0,
+        max_concurrency: Optional[int] = None,
+        seed: int = 0
+    ):
+        """
+        Initialize the client.
+        
+        Args:
+            latency: Latency of each request
+            video_size: Average size of the simulated videos in bytes
+            duplicate_rate: Fraction of videos that have the content of a shared video
+            duplicate_pool: Number of shared videos
+            throttle_rate: Fraction of requests rejected with a throttling error
+            max_concurrency: Requests in flight above which requests are throttled
+            seed: Seed of the random number generator
+        """
+        super().__init__('s3', throttle_rate=throttle_rate, max_concurrency=max_concurrency, seed=seed)
+        self.latency = latency or LatencyModel(median=0.02, sigma=0.2)
+        self.video_size = video_size
+        self.duplicate_rate = duplicate_rate
+        self.duplicate_pool = duplicate_pool
+        self._objects: Dict[Tuple[str, str], bytes] = {}
+    
+    def store(self, bucket: str, key: str, body: bytes) -> None:
+        """
+        Store an object without simulating a request, e.g. for output written by another service.
+        
+        Args:
+            bucket: Bucket name
+            key: Object key
+            body: Object content
+        """
+        with self._lock:
+            self._objects[(bucket, key)] = body
+    
+    def _metadata(self, bucket: str, key: str) -> Tuple[str, int]:
+        """Get the ETag and size of a stored or simulated object."""
+        with self._lock:
+            body = self._objects.get((bucket, key))
+        if body is not None:
+            return hashlib.md5(body).hexdigest(), len(body)
+        
+        rng = random.Random(f"{self.seed}:{bucket}/{key}")
+        content = f"{bucket}/{key}"
+        if rng.random() < self.duplicate_rate:
+            content = f"shared-{rng.randrange(self.duplicate_pool)}"
+        content_rng = random.Random(content)
+        return hashlib.md5(content.encode('utf-8')).hexdigest(), int(self.video_size * content_rng.uniform(0.5, 1.5))
+    
+    def put_object(self, Bucket: str, Key: str, Body: Any = b'', **kwargs) -> Dict[str, Any]:
+        body = Body.read() if hasattr(Body, 'read') else Body
+        body = body.encode('utf-8') if isinstance(body, str) else bytes(body)
+        self._request('PutObject', self.latency)
+        self.store(Bucket, Key, body)
+        return {'ETag': f'"{hashlib.md5(body).hexdigest()}"'}
+    
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> Dict[str, Any]:
+        self._request('HeadObject', self.latency)
+        etag, size = self._metadata(Bucket, Key)
+        return {'ETag': f'"{etag}"', 'ContentLength': size}
+    
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        self._request('GetObject', self.latency)
+        with self._lock:
+            body = self._objects.get((Bucket, Key))
+        if body is None:
+            # Simulated videos have no content that could be decoded
+            raise _client_error('NoSuchKey', 'The specified key does not exist (simulated)', 'GetObject')
+        if Range:
+            first, last = Range.split('=')[1].split('-')
+            body = body[int(first):int(last) + 1 if last else None]
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+    
+    def delete_object(self, Bucket: str, Key: str, **kwargs) -> Dict[str, Any]:
+        self._request('DeleteObject', self.latency)
+        with self._lock:
+            self._objects.pop((Bucket, Key), None)
+        return {}
+    
+    def generate_presigned_url(self, ClientMethod: str, Params: Dict[str, Any], ExpiresIn: int = 3600, **kwargs) -> str:
+        # Signing is local, so no request is simulated
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}"
+
+class SimulatedBedrockRuntime(SimulatedService):
+    """
+    Bedrock Runtime client answering converse and embedding requests locally.
+    
+    Classification requests are answered with categories drawn from the
+    taxonomy, some of them slightly misspelled so calibration has work to do;
+    other requests get a short description. Answers are seeded by the video, so
+    the same video gets the same answer. Token counts follow the request size,
+    the number of video and image blocks, and configurable output lengths, and
+    prefixes behind a cachePoint are reported as prompt cache writes and reads.
+    Embeddings are hashed character trigrams, so similar labels are close.
+    """
+    
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        model_latency: Optional[Dict[str, LatencyModel]] = None,
+        embedding_latency: Optional[LatencyModel] = None,
+        throttle_rate: float = 0.0,
+        max_concurrency: Optional[int] = None,
+        description_tokens: int = 200,
+        classification_tokens: int = 150,
+        token_jitter: float = 0.2,
+        video_tokens: int = 1500,
+        image_tokens: int = 800,
+        label_noise: float = 0.2,
+        malformed_rate: float = 0.0,
+        prompt_cache_ttl: float = 300.0,
+        embedding_dimensions: int = 256,
+        categories_path: str = "category.json",
+        seed: int = 0
+    ):
+        """
+        Initialize the client.
+        
+        Args:
+            latency: Latency of converse requests
+            model_latency: Latency of converse requests per model ID, overriding latency
+            embedding_latency: Latency of embedding requests
+            throttle_rate: Fraction of requests rejected with a throttling error
+            max_concurrency: Requests in flight above which requests are throttled
+            description_tokens: Mean output tokens of a video description
+            classification_tokens: Mean output tokens of a classification
+            token_jitter: Relative standard deviation of the output tokens
+            video_tokens: Input tokens of a video block
+            image_tokens: Input tokens of an image block
+            label_noise: Probability that a label of a classification is misspelled
+            malformed_rate: Fraction of free-text classifications returned as broken JSON
+            prompt_cache_ttl: Seconds a cached prompt prefix stays readable after its last use
+            embedding_dimensions: Length of the embedding vectors
+            categories_path: Path to the categories JSON file answers are drawn from
+            seed: Seed of the random number generators
+        """
+        super().__init__('bedrock-runtime', throttle_rate=throttle_rate, max_concurrency=max_concurrency, seed=seed)
+        self.latency = latency or LatencyModel(median=0.3, sigma=0.3, per_output_token=0.001)
+        self.model_latency = model_latency or {}
+        self.embedding_latency = embedding_latency or LatencyModel(median=0.03, sigma=0.2)
+        self.description_tokens = description_tokens
+        self.classification_tokens = classification_tokens
+        self.token_jitter = token_jitter
+        self.video_tokens = video_tokens
+        self.image_tokens = image_tokens
+        self.label_noise = label_noise
+        self.malformed_rate = malformed_rate
+        self.prompt_cache_ttl = prompt_cache_ttl
+        self.embedding_dimensions = embedding_dimensions
+        
+        with open(categories_path, 'r', encoding='utf-8') as f:
+            self.categories_json = json.load(f)
+        
+        # Expiry time of each cached prompt prefix
+        self._prompt_cache: Dict[str, float] = {}
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+    
+    def _noisy(self, label: str, rng: random.Random) -> str:
+        """Misspell a label with the configured probability."""
+        if rng.random() >= self.label_noise:
+            return label
+        variants = [
+            label.lower(),
+            label.replace('&', 'and'),
+            f"{label}s",
+            label.split(' ')[0]
+        ]
+        return rng.choice(variants)
+    
+    def classification(self, identity: str) -> Dict[str, Any]:
+        """
+        Draw the classification the simulated model gives a video.
+        
+        Args:
+            identity: Video S3 URI or another text identifying the request
+        
+        Returns:
+            Classification with catetorys and tags, as the prompts ask for
+        """
+        rng = random.Random(f"{self.seed}:{identity}")
+        categories = []
+        for _ in range(rng.randint(1, 3)):
+            category1 = rng.choice(list(self.categories_json))
+            category2 = rng.choice(list(self.categories_json[category1]))
+            level3 = list(self.categories_json[category1][category2])
+            category3 = rng.sample(level3, min(len(level3), rng.randint(1, 2)))
+            categories.append({
+                'catetory1': self._noisy(category1, rng),
+                'catetory2': self._noisy(category2, rng),
+                'catetory3': [self._noisy(label, rng) for label in category3],
+                'weight': {category1: rng.randint(30, 100)}
+            })
+        tags = [{'tag': f"tag-{rng.randrange(100)}", 'scores': rng.randint(10, 100)} for _ in range(rng.randint(1, 5))]
+        return {'catetorys': categories, 'tags': tags}
+    
+    def _count_input(self, request: Dict[str, Any]) -> Tuple[int, int, Optional[str], Optional[str], bool]:
+        """
+        Count the input tokens of a converse request.
+        
+        Returns:
+            Tuple of (tokens before the last cachePoint, tokens after it, key of the
+            cached prefix or None, S3 URI of the video or None, whether the
+            request asks for a classification)
+        """
+        blocks = list(request.get('system', []))
+        for message in request.get('messages', []):
+            blocks.extend(message.get('content', []))
+        
+        tokens = 0
+        prefix_tokens = 0
+        prefix = hashlib.sha256(request.get('modelId', '').encode('utf-8'))
+        prefix_key = None
+        video_uri = None
+        classify = 'toolConfig' in request
+        for block in blocks:
+            if 'cachePoint' in block:
+                prefix_tokens += tokens
+                tokens = 0
+                prefix_key = prefix.hexdigest()
+            elif 'text' in block:
+                tokens += estimate_tokens(block['text'])
+                prefix.update(block['text'].encode('utf-8'))
+                classify = classify or 'catetory' in block['text'] or 'JSON' in block['text']
+            elif 'video' in block:
+                tokens += self.video_tokens
+                video_uri = block['video']['source'].get('s3Location', {}).get('uri')
+                prefix.update((video_uri or '').encode('utf-8'))
+            elif 'image' in block:
+                tokens += self.image_tokens
+                prefix.update(hashlib.sha256(block['image']['source']['bytes']).digest())
+        return prefix_tokens, tokens, prefix_key, video_uri, classify
+    
+    def converse(self, **request) -> Dict[str, Any]:
+        prefix_tokens, input_tokens, prefix_key, video_uri, classify = self._count_input(request)
+        
+        # A prefix is written to the prompt cache on first use and read while it stays warm
+        cache_read_tokens = cache_write_tokens = 0
+        if prefix_key is not None:
+            now = time.monotonic()
+            with self._lock:
+                if self._prompt_cache.get(prefix_key, 0.0) > now:
+                    cache_read_tokens = prefix_tokens
+                else:
+                    cache_write_tokens = prefix_tokens
+                self._prompt_cache[prefix_key] = now + self.prompt_cache_ttl
+        else:
+            input_tokens += prefix_tokens
+        
+        # Text-only requests are identified by their last text block, e.g. the video description
+        texts = [block['text'] for message in request.get('messages', []) for block in message.get('content', []) if 'text' in block]
+        identity = video_uri or (texts[-1] if texts else '')
+        rng = random.Random(f"{self.seed}:{identity}:{classify}")
+        
+        max_tokens = request.get('inferenceConfig', {}).get('maxTokens', 4096)
+        mean_tokens = self.classification_tokens if classify else self.description_tokens
+        output_tokens = int(min(max_tokens, max(1, rng.gauss(mean_tokens, mean_tokens * self.token_jitter))))
+        
+        latency = self.model_latency.get(request.get('modelId'), self.latency)
+        delay = self._request('Converse', latency, input_tokens, output_tokens)
+        with self._lock:
+            self.cache_read_tokens += cache_read_tokens
+            self.cache_write_tokens += cache_write_tokens
+        
+        if classify and 'toolConfig' in request:
+            tool_name = request['toolConfig']['tools'][0]['toolSpec']['name']
+            content = [{'toolUse': {'toolUseId': f"tooluse_{rng.randrange(10 ** 12)}", 'name': tool_name, 'input': self.classification(identity)}}]
+        elif classify:
+            text = json.dumps(self.classification(identity), ensure_ascii=False, indent=2)
+            if rng.random() < self.malformed_rate:
+                # A trailing comma inside a code fence, as models sometimes return
+                text = f"```json\n{text[:-1].rstrip()},\n}}\n```"
+            content = [{'text': text}]
+        else:
+            content = [{'text': f"Simulated description of {identity[:200]}: a short clip with people talking."}]
+        
+        return {
+            'output': {'message': {'role': 'assistant', 'content': content}},
+            'stopReason': 'tool_use' if 'toolUse' in content[0] else 'end_turn',
+            'usage': {
+                'inputTokens': input_tokens,
+                'outputTokens': output_tokens,
+                'totalTokens': input_tokens + output_tokens + cache_read_tokens + cache_write_tokens,
+                'cacheReadInputTokens': cache_read_tokens,
+                'cacheWriteInputTokens': cache_write_tokens
+            },
+            'metrics': {'latencyMs': int(delay * 1000)}
+        }
+    
+    def embed(self, text: str) -> List[float]:
+        """
+        Compute the simulated embedding of a text.
+        
+        Args:
+            text: Text to embed
+        
+        Returns:
+            Bag of hashed character trigrams, L2-normalized
+        """
+        padded = f"  {text.lower()} "
+        vector = np.zeros(self.embedding_dimensions, dtype=np.float32)
+        for i in range(len(padded) - 2):
+            digest = hashlib.md5(padded[i:i + 3].encode('utf-8')).digest()
+            vector[int.from_bytes(digest[:4], 'little') % self.embedding_dimensions] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
+    
+    def invoke_model(self, modelId: str, body: Any, **kwargs) -> Dict[str, Any]:
+        text = json.loads(body)['inputText']
+        input_tokens = estimate_tokens(text)
+        self._request('InvokeModel', self.embedding_latency, input_tokens)
+        response_body = json.dumps({'embedding': self.embed(text), 'inputTextTokenCount': input_tokens})
+        return {'body': io.BytesIO(response_body.encode('utf-8')), 'contentType': 'application/json'}
+    
+    def reset(self) -> None:
+        super().reset()
+        with self._lock:
+            self.cache_read_tokens = 0
+            self.cache_write_tokens = 0
+
+class SimulatedTranscribe(SimulatedService):
+    """
+    Amazon Transcribe client running jobs on a simulated clock.
+    
+    A job completes, or fails at a configurable rate, once its simulated duration
+    has passed; its transcript is then written to the simulated S3 client.
+    """
+    
+    def __init__(
+        self,
+        s3: SimulatedS3,
+        latency: Optional[LatencyModel] = None,
+        job_latency: Optional[LatencyModel] = None,
+        failure_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        max_concurrency: Optional[int] = None,
+        transcript: str = "This is a simulated transcript.",
+        seed: int = 0
+    ):
+        """
+        Initialize the client.
+        
+        Args:
+            s3: Simulated S3 client the transcripts are written to
+            latency: Latency of each API request
+            job_latency: Time a job takes to finish
+            failure_rate: Fraction of jobs that fail
+            throttle_rate: Fraction of requests rejected with a throttling error
+            max_concurrency: Requests in flight above which requests are throttled
+            transcript: Text of every transcript
+            seed: Seed of the random number generator
+        """
+        super().__init__('transcribe', throttle_rate=throttle_rate, max_concurrency=max_concurrency, seed=seed)
+        self.s3 = s3
+        self.latency = latency or LatencyModel(median=0.05, sigma=0.2)
+        self.job_latency = job_latency or LatencyModel(median=5.0, sigma=0.3)
+        self.failure_rate = failure_rate
+        self.transcript = transcript
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+    
+    def _status(self, job: Dict[str, Any]) -> str:
+        """Get the status of a job on the simulated clock."""
+        if time.monotonic() < job['ready']:
+            return 'IN_PROGRESS'
+        return 'FAILED' if job['failed'] else 'COMPLETED'
+    
+    def start_transcription_job(self, TranscriptionJobName: str, OutputBucketName: str, **kwargs) -> Dict[str, Any]:
+        self._request('StartTranscriptionJob', self.latency)
+        with self._lock:
+            if TranscriptionJobName in self._jobs:
+                raise _client_error('ConflictException', 'The requested job name already exists (simulated)', 'StartTranscriptionJob')
+            job = {
+                'name': TranscriptionJobName,
+                'bucket': OutputBucketName,
+                'ready': time.monotonic() + self.job_latency.sample(self._rng),
+                'failed': self._rng.random() < self.failure_rate
+            }
+            self._jobs[TranscriptionJobName] = job
+        return {'TranscriptionJob': {'TranscriptionJobName': TranscriptionJobName, 'TranscriptionJobStatus': 'IN_PROGRESS'}}
+    
+    def list_transcription_jobs(
+        self,
+        Status: Optional[str] = None,
+        JobNameContains: Optional[str] = None,
+        MaxResults: int = 100,
+        NextToken: Optional[str] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        self._request('ListTranscriptionJobs', self.latency)
+        with self._lock:
+            jobs = list(self._jobs.values())
+        summaries = [
+            {'TranscriptionJobName': job['name'], 'TranscriptionJobStatus': self._status(job)}
+            for job in sorted(jobs, key=lambda job: job['name'])
+            if (JobNameContains is None or JobNameContains in job['name'])
+        ]
+        summaries = [summary for summary in summaries if Status is None or summary['TranscriptionJobStatus'] == Status]
+        for summary in summaries:
+            if summary['TranscriptionJobStatus'] == 'FAILED':
+                summary['FailureReason'] = 'Simulated failure'
+        
+        offset = int(NextToken or 0)
+        response = {'TranscriptionJobSummaries': summaries[offset:offset + MaxResults]}
+        if offset + MaxResults < len(summaries):
+            response['NextToken'] = str(offset + MaxResults)
+        return response
+    
+    def get_transcription_job(self, TranscriptionJobName: str, **kwargs) -> Dict[str, Any]:
+        self._request('GetTranscriptionJob', self.latency)
+        with self._lock:
+            job = self._jobs.get(TranscriptionJobName)
+        if job is None:
+            raise _client_error('BadRequestException', 'The requested job could not be found (simulated)', 'GetTranscriptionJob')
+        
+        status = self._status(job)
+        description = {'TranscriptionJobName': job['name'], 'TranscriptionJobStatus': status}
+        if status == 'COMPLETED':
+            key = f"{job['name']}.json"
+            transcript = {'results': {'transcripts': [{'transcript': self.transcript}]}}
+            self.s3.store(job['bucket'], key, json.dumps(transcript).encode('utf-8'))
+            description['Transcript'] = {'TranscriptFileUri': f"https://s3.amazonaws.com/{job['bucket']}/{key}"}
+        elif status == 'FAILED':
+            description['FailureReason'] = 'Simulated failure'
+        return {'TranscriptionJob': description}
+
+class SimulatedAWS:
+    """
+    Simulated bedrock-runtime, transcribe and s3 clients behind the shared client registry.
+    
+    Used as a context manager, every get_client call inside the block returns
+    one of the simulated clients, so the classifier, calibration and
+    transcription code runs unchanged without AWS credentials or quota.
+    """
+    
+    def __init__(
+        self,
+        bedrock: Optional[SimulatedBedrockRuntime] = None,
+        transcribe: Optional[SimulatedTranscribe] = None,
+        s3: Optional[SimulatedS3] = None
+    ):
+        """
+        Initialize the simulated services.
+        
+        Args:
+            bedrock: Simulated Bedrock Runtime client
+            transcribe: Simulated Transcribe client
+            s3: Simulated S3 client
+        """
+        self.s3 = s3 or SimulatedS3()
+        self.bedrock = bedrock or SimulatedBedrockRuntime()
+        self.transcribe = transcribe or SimulatedTranscribe(self.s3)
+    
+    @classmethod
+    def from_config(
+        cls,
+        config: Dict[str, Any],
+        categories_path: str = "category.json",
+        seed: int = 0
+    ) -> 'SimulatedAWS':
+        """
+        Create the simulated services from a benchmark configuration.
+        
+        Args:
+            config: Configuration with optional 'bedrock', 'transcribe' and 's3'
+                sections holding the keyword arguments of each client; latency
+                settings are given as LatencyModel keyword arguments
+            categories_path: Path to the categories JSON file
+            seed: Seed used by sections that do not set their own
+        
+        Returns:
+            Simulated services
+        """
+        def settings(section: str) -> Dict[str, Any]:
+            kwargs = dict(config.get(section) or {})
+            for name in LATENCY_SETTINGS:
+                if isinstance(kwargs.get(name), dict):
+                    kwargs[name] = LatencyModel(**kwargs[name])
+            if 'model_latency' in kwargs:
+                kwargs['model_latency'] = {
+                    model_id: LatencyModel(**latency) for model_id, latency in kwargs['model_latency'].items()
+                }
+            kwargs.setdefault('seed', seed)
+            return kwargs
+        
+        s3 = SimulatedS3(**settings('s3'))
+        return cls(
+            bedrock=SimulatedBedrockRuntime(categories_path=categories_path, **settings('bedrock')),
+            transcribe=SimulatedTranscribe(s3, **settings('transcribe')),
+            s3=s3
+        )
+    
+    @property
+    def services(self) -> List[SimulatedService]:
+        """Simulated clients."""
+        return [self.bedrock, self.transcribe, self.s3]
+    
+    def client(self, service: str, region: str = "us-east-1") -> Any:
+        """
+        Get the simulated client of a service.
+        
+        Args:
+            service: AWS service name
+            region: AWS region (all regions share the same clients)
+        
+        Returns:
+            Simulated client
+        """
+        for simulated in self.services:
+            if simulated.name == service:
+                return simulated
+        # Failing loudly keeps a benchmark from reaching real AWS by accident
+        raise ValueError(f"No simulated client for service {service}")
+    
+    def reset(self) -> None:
+        """Forget the requests recorded so far, e.g. after a warm-up."""
+        for simulated in self.services:
+            simulated.reset()
+    
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Summarize the requests of every simulated client.
+        
+        Returns:
+            Mapping of 'service.Operation' to LatencyRecorder summary
+        """
+        return {
+            f"{simulated.name}.{operation}": stats
+            for simulated in self.services
+            for operation, stats in simulated.summary().items()
+        }
+    
+    def __enter__(self) -> 'SimulatedAWS':
+        set_client_factory(self.client)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        set_client_factory(None)
+        return False
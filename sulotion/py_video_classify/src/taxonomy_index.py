@@ -0,0 +1,309 @@
+"""
+Precomputed embedding index for the category taxonomy.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Tuple, Optional, Iterable
+import numpy as np
+
+from .common import get_embedding
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+LEVELS = (1, 2, 3)
+
+# Loaded indexes shared by every TaxonomyIndex of the process, keyed by (categories hash, model id)
+_loaded_lock = threading.Lock()
+_load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_loaded: Dict[Tuple[str, str], Tuple[Dict[int, np.ndarray], Dict[int, List[List[str]]], Dict[int, Dict[Tuple[str, ...], np.ndarray]]]] = {}
+
+class TaxonomyIndex:
+    """
+    Embedding index over the level 1/2/3 labels of a category JSON file.
+    
+    Label embeddings are computed once, L2-normalized and stored as one NumPy
+    matrix per level under ``cache_dir/<file hash>-<model>/``. Later runs open the
+    matrices memory-mapped, so calibration only needs to embed the query label.
+    The cache directory is keyed on the SHA-256 of the category file, so editing
+    the taxonomy invalidates the index automatically. Instances built from the
+    same file and model share one loaded index per process.
+    
+    Query labels are embedded on a bounded thread pool. Their embeddings are kept
+    for ``query_ttl`` seconds, and a label already being embedded by another
+    thread is waited for rather than embedded twice, so concurrent videos with
+    the same unknown labels share one request.
+    """
+    
+    def __init__(
+        self,
+        categories_path: str = "category.json",
+        cache_dir: str = ".cache/taxonomy_index",
+        model_id: str = "amazon.titan-embed-text-v2:0",
+        region: str = "us-east-1",
+        embedding_concurrency: int = 8,
+        query_ttl: float = 600.0,
+        max_cached_queries: int = 4096
+    ):
+        """
+        Initialize the taxonomy index. The index is loaded or built on first use.
+        
+        Args:
+            categories_path: Path to the categories JSON file
+            cache_dir: Directory to store the embedding matrices
+            model_id: Embedding model ID
+            region: AWS region
+            embedding_concurrency: Maximum embedding requests in flight
+            query_ttl: Seconds a query embedding is reused
+            max_cached_queries: Maximum number of query embeddings kept
+        """
+        self.categories_path = categories_path
+        self.cache_dir = cache_dir
+        self.model_id = model_id
+        self.region = region
+        
+        with open(categories_path, 'rb') as f:
+            content = f.read()
+        self.categories_hash = hashlib.sha256(content).hexdigest()
+        self.categories_json = json.loads(content.decode('utf-8'))
+        
+        self.model_slug = model_id.replace(':', '_').replace('/', '_')
+        self.index_dir = os.path.join(cache_dir, f"{self.categories_hash[:16]}-{self.model_slug}")
+        
+        self._matrices: Dict[int, np.ndarray] = {}
+        self._labels: Dict[int, List[List[str]]] = {}
+        self._rows_by_parent: Dict[int, Dict[Tuple[str, ...], np.ndarray]] = {}
+        
+        self.embedding_concurrency = max(1, embedding_concurrency)
+        self.query_ttl = query_ttl
+        self.max_cached_queries = max_cached_queries
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # The lock is re-entered when a finished future runs its callback immediately
+        self._query_lock = threading.RLock()
+        self._queries: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+    
+    def _label_paths(self) -> Dict[int, List[List[str]]]:
+        """
+        Enumerate the label paths of every level in taxonomy order.
+        
+        Returns:
+            Mapping of level to a list of label paths
+        """
+        paths = {1: [], 2: [], 3: []}
+        for category1, level2 in self.categories_json.items():
+            paths[1].append([category1])
+            for category2, level3 in (level2 or {}).items():
+                paths[2].append([category1, category2])
+                for category3 in (level3 or {}):
+                    paths[3].append([category1, category2, category3])
+        return paths
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Get the embedding thread pool, creating it on first use."""
+        with self._query_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.embedding_concurrency, thread_name_prefix='taxonomy-embed'
+                )
+            return self._executor
+    
+    def _embed(self, text: str) -> np.ndarray:
+        """Embed a text and L2-normalize the vector."""
+        return _normalize(np.asarray(
+            get_embedding(text, model_id=self.model_id, region=self.region),
+            dtype=np.float32
+        ))
+    
+    def _store_query(self, text: str, future: Future) -> None:
+        """Keep the embedding of a finished query and evict the oldest ones."""
+        with self._query_lock:
+            self._pending.pop(text, None)
+            if future.exception() is not None:
+                return
+            self._queries[text] = (time.monotonic() + self.query_ttl, future.result())
+            self._queries.move_to_end(text)
+            while len(self._queries) > self.max_cached_queries:
+                self._queries.popitem(last=False)
+    
+    def embed_queries(self, texts: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Embed query labels concurrently.
+        
+        Duplicates are embedded once, recent embeddings are reused, and labels
+        already being embedded by another thread are waited for.
+        
+        Args:
+            texts: Label texts
+        
+        Returns:
+            Mapping of each text to its normalized embedding
+        """
+        now = time.monotonic()
+        embeddings: Dict[str, np.ndarray] = {}
+        futures: Dict[str, Future] = {}
+        
+        with self._query_lock:
+            for text in dict.fromkeys(texts):
+                cached = self._queries.get(text)
+                if cached is not None and cached[0] > now:
+                    embeddings[text] = cached[1]
+                    continue
+                
+                future = self._pending.get(text)
+                if future is None:
+                    future = self._get_executor().submit(self._embed, text)
+                    self._pending[text] = future
+                    future.add_done_callback(lambda done, text=text: self._store_query(text, done))
+                futures[text] = future
+        
+        if futures:
+            logger.info(f"Embedding {len(futures)} query labels ({len(embeddings)} reused)")
+        for text, future in futures.items():
+            embeddings[text] = future.result()
+        return embeddings
+    
+    def _build(self) -> None:
+        """Embed every label and write the per-level matrices to the index directory."""
+        label_paths = self._label_paths()
+        total = sum(len(paths) for paths in label_paths.values())
+        logger.info(f"Building taxonomy index for {self.categories_path} ({total} labels) in {self.index_dir}")
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f"{os.path.basename(self.index_dir)}.tmp-", dir=self.cache_dir)
+        
+        try:
+            # The same label text can appear under several parents; embed it once
+            labels = list(dict.fromkeys(path[-1] for level in LEVELS for path in label_paths[level]))
+            embeddings = dict(zip(labels, self._get_executor().map(self._embed, labels)))
+            for level in LEVELS:
+                vectors = [embeddings[path[-1]] for path in label_paths[level]]
+                matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+                np.save(os.path.join(tmp_dir, f"level{level}.npy"), matrix)
+            
+            with open(os.path.join(tmp_dir, 'labels.json'), 'w', encoding='utf-8') as f:
+                json.dump({
+                    'categories_hash': self.categories_hash,
+                    'model_id': self.model_id,
+                    'labels': {str(level): label_paths[level] for level in LEVELS}
+                }, f, ensure_ascii=False)
+            
+            # Publish atomically; another process may have published the same index first
+            try:
+                os.replace(tmp_dir, self.index_dir)
+            except OSError:
+                if not os.path.exists(os.path.join(self.index_dir, 'labels.json')):
+                    raise
+                logger.info(f"Taxonomy index {self.index_dir} was built by another process")
+        finally:
+            # Failed builds leave no .tmp- directories behind, which stale-index cleanup skips
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        
+        # Drop indexes built from older versions of the file
+        self._remove_stale_indexes()
+    
+    def _remove_stale_indexes(self) -> None:
+        """Remove index directories built for a different version of the category file."""
+        suffix = f"-{self.model_slug}"
+        current = os.path.basename(self.index_dir)
+        for name in os.listdir(self.cache_dir):
+            if name != current and name.endswith(suffix) and '.tmp-' not in name:
+                logger.info(f"Removing stale taxonomy index {name}")
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+    
+    def _ensure_loaded(self) -> None:
+        """Load the index from disk, building it first if needed."""
+        if self._matrices:
+            return
+        
+        key = (self.categories_hash, self.model_id)
+        with _loaded_lock:
+            load_lock = _load_locks.setdefault(key, threading.Lock())
+        
+        with load_lock:
+            if key not in _loaded:
+                _loaded[key] = self._load()
+                logger.info(f"Loaded taxonomy index from {self.index_dir}")
+        
+        # Matrices are published last, since other threads check them without the lock
+        matrices, self._labels, self._rows_by_parent = _loaded[key]
+        self._matrices = matrices
+    
+    def _load(self) -> Tuple[Dict[int, np.ndarray], Dict[int, List[List[str]]], Dict[int, Dict[Tuple[str, ...], np.ndarray]]]:
+        """
+        Read the index directory, building it first if needed.
+        
+        Returns:
+            Tuple of (matrices, label paths, rows by parent path), each keyed by level
+        """
+        labels_path = os.path.join(self.index_dir, 'labels.json')
+        if not os.path.exists(labels_path):
+            self._build()
+        
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        matrices: Dict[int, np.ndarray] = {}
+        labels_by_level: Dict[int, List[List[str]]] = {}
+        rows_by_level: Dict[int, Dict[Tuple[str, ...], np.ndarray]] = {}
+        for level in LEVELS:
+            labels = manifest['labels'][str(level)]
+            rows_by_parent: Dict[Tuple[str, ...], List[int]] = {}
+            for row, path in enumerate(labels):
+                rows_by_parent.setdefault(tuple(path[:-1]), []).append(row)
+            
+            labels_by_level[level] = labels
+            rows_by_level[level] = {
+                parent: np.asarray(rows, dtype=np.int64) for parent, rows in rows_by_parent.items()
+            }
+            matrices[level] = np.load(
+                os.path.join(self.index_dir, f"level{level}.npy"), mmap_mode='r'
+            )
+        return matrices, labels_by_level, rows_by_level
+    
+    def find_most_similar(self, text: str, parent_path: Tuple[str, ...] = ()) -> Tuple[str, float]:
+        """
+        Find the taxonomy label most similar to a text.
+        
+        Args:
+            text: Label text to calibrate
+            parent_path: Calibrated parent labels; () for level 1, (category1,) for level 2
+                and (category1, category2) for level 3
+        
+        Returns:
+            Tuple of (most similar label, cosine similarity)
+        """
+        self._ensure_loaded()
+        
+        level = len(parent_path) + 1
+        rows = self._rows_by_parent.get(level, {}).get(tuple(parent_path))
+        if rows is None or len(rows) == 0:
+            raise ValueError(f"No level {level} categories under {list(parent_path)}")
+        
+        query = self.embed_queries([text])[text]
+        similarities = self._matrices[level][rows] @ query
+        best = int(np.argmax(similarities))
+        
+        return self._labels[level][rows[best]][-1], float(similarities[best])
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize a vector so dot products are cosine similarities.
+    
+    Args:
+        vector: Input vector
+    
+    Returns:
+        Normalized vector
+    """
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
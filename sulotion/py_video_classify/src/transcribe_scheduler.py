@@ -0,0 +1,225 @@
+"""
+Multiplexed scheduler for Amazon Transcribe jobs.
+"""
+import uuid
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Set, Callable, Optional
+
+from .aws_clients import get_client
+from .rate_governor import get_governor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class TranscriptionScheduler:
+    """
+    Submit many transcription jobs and track them all from one poller thread.
+    
+    Jobs are named after a run-specific prefix and a batch number, with at most
+    ``batch_size`` jobs per batch. Each poll lists the finished jobs of only
+    the batches that still have pending jobs, one ``list_transcription_jobs``
+    page per batch, so the cost of a poll does not grow with the jobs already
+    resolved. The poll interval backs off while nothing finishes
+    and resets as soon as a job completes. Each submitted job gets a Future.
+    """
+    
+    def __init__(
+        self,
+        region: str = "us-east-1",
+        job_prefix: str = "video-classify",
+        min_interval: float = 2.0,
+        max_interval: float = 30.0,
+        backoff_factor: float = 1.5,
+        callback_workers: int = 4,
+        batch_size: int = 100
+    ):
+        """
+        Initialize the scheduler.
+        
+        Args:
+            region: AWS region
+            job_prefix: Prefix of the transcription job names
+            min_interval: Shortest time between polls in seconds
+            max_interval: Longest time between polls in seconds
+            backoff_factor: Factor applied to the poll interval when nothing finished
+            callback_workers: Threads running the result callbacks of finished jobs
+            batch_size: Jobs sharing a batch name prefix; at most one list page (100)
+        """
+        self.region = region
+        self.run_prefix = f"{job_prefix}-{uuid.uuid4().hex[:8]}-"
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.batch_size = max(1, min(batch_size, 100))
+        
+        self._condition = threading.Condition()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._poller: Optional[threading.Thread] = None
+        self._batch = 0
+        self._batch_jobs = 0
+        self._callbacks = ThreadPoolExecutor(max_workers=callback_workers, thread_name_prefix='transcribe-callback')
+        self.polls = 0
+    
+    def _next_batch_prefix(self) -> str:
+        """
+        Get the name prefix of the batch the next job joins, starting a new batch when full.
+        
+        Returns:
+            Batch name prefix
+        """
+        with self._condition:
+            if self._batch_jobs >= self.batch_size:
+                self._batch += 1
+                self._batch_jobs = 0
+            self._batch_jobs += 1
+            return f"{self.run_prefix}{self._batch}-"
+    
+    def submit(
+        self,
+        job_id: str,
+        media_uri: str,
+        output_bucket: str,
+        media_format: str = "wav",
+        language_options: Optional[List[str]] = None,
+        on_complete: Optional[Callable[[Dict[str, Any]], Any]] = None
+    ) -> Future:
+        """
+        Start a transcription job.
+        
+        Args:
+            job_id: Unique job ID
+            media_uri: S3 URI of the audio
+            output_bucket: Bucket the transcript is written to
+            media_format: Audio format
+            language_options: Candidate languages for language identification
+            on_complete: Function called with the finished job description; its
+                return value becomes the result of the Future
+        
+        Returns:
+            Future resolving to the result of on_complete, or to the job description
+        """
+        batch_prefix = self._next_batch_prefix()
+        job_name = f"{batch_prefix}{job_id}"
+        transcribe_client = get_client('transcribe', self.region)
+        
+        get_governor('transcribe').call(lambda: transcribe_client.start_transcription_job(
+            TranscriptionJobName=job_name,
+            Media={'MediaFileUri': media_uri},
+            MediaFormat=media_format,
+            LanguageOptions=language_options or ['en-US', 'zh-CN', 'ja-JP', 'ko-KR'],
+            IdentifyLanguage=True,
+            OutputBucketName=output_bucket
+        ))
+        
+        future = Future()
+        with self._condition:
+            self._pending[job_name] = {'future': future, 'on_complete': on_complete, 'batch_prefix': batch_prefix}
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name='transcribe-poller', daemon=True)
+                self._poller.start()
+        
+        logger.info(f"Started transcription job {job_name}")
+        return future
+    
+    def _list_finished_jobs(self, pending: Dict[str, Set[str]]) -> Dict[str, Dict[str, Any]]:
+        """
+        List the finished jobs of the batches that have pending jobs.
+        
+        Args:
+            pending: Mapping of batch name prefix to the names of its pending jobs
+        
+        Returns:
+            Mapping of job name to job summary
+        """
+        transcribe_client = get_client('transcribe', self.region)
+        finished = {}
+        for batch_prefix, names in pending.items():
+            # A batch fits in one page, so it is listed without a status filter and
+            # paging stops as soon as every pending job of the batch has been seen
+            unseen = set(names)
+            kwargs = {'JobNameContains': batch_prefix, 'MaxResults': 100}
+            while unseen:
+                response = get_governor('transcribe').call(lambda: transcribe_client.list_transcription_jobs(**kwargs))
+                for summary in response.get('TranscriptionJobSummaries', []):
+                    unseen.discard(summary['TranscriptionJobName'])
+                    if summary['TranscriptionJobStatus'] in ('COMPLETED', 'FAILED'):
+                        finished[summary['TranscriptionJobName']] = summary
+                if 'NextToken' not in response:
+                    break
+                kwargs['NextToken'] = response['NextToken']
+        return finished
+    
+    def _resolve(self, job_name: str, summary: Dict[str, Any], entry: Dict[str, Any]) -> None:
+        """
+        Resolve the Future of a finished job.
+        
+        Args:
+            job_name: Transcription job name
+            summary: Job summary from list_transcription_jobs
+            entry: Pending entry holding the Future and callback
+        """
+        future = entry['future']
+        try:
+            if summary['TranscriptionJobStatus'] == 'FAILED':
+                raise Exception(f"Transcription job failed: {summary.get('FailureReason', 'Unknown error')}")
+            
+            # The summaries carry no transcript location, so describe each job once
+            transcribe_client = get_client('transcribe', self.region)
+            job = get_governor('transcribe').call(
+                lambda: transcribe_client.get_transcription_job(TranscriptionJobName=job_name)
+            )['TranscriptionJob']
+            future.set_result(entry['on_complete'](job) if entry['on_complete'] else job)
+        except Exception as e:
+            future.set_exception(e)
+    
+    def _poll_loop(self) -> None:
+        """Poll until every pending job has finished."""
+        interval = self.min_interval
+        while True:
+            with self._condition:
+                if not self._pending:
+                    # Cleared under the lock so the next submit starts a new poller
+                    self._poller = None
+                    return
+                self._condition.wait(timeout=interval)
+                pending: Dict[str, Set[str]] = {}
+                for name, entry in self._pending.items():
+                    pending.setdefault(entry['batch_prefix'], set()).add(name)
+            
+            try:
+                finished = self._list_finished_jobs(pending)
+            except Exception as e:
+                logger.warning(f"Error listing transcription jobs: {e}")
+                finished = {}
+            self.polls += 1
+            
+            with self._condition:
+                done = {name: self._pending.pop(name) for name in list(self._pending) if name in finished}
+            
+            for job_name, entry in done.items():
+                self._callbacks.submit(self._resolve, job_name, finished[job_name], entry)
+            
+            interval = self.min_interval if done else min(self.max_interval, interval * self.backoff_factor)
+            if done:
+                logger.info(f"{len(done)} transcription jobs finished, {len(self._pending)} pending")
+
+_lock = threading.Lock()
+_schedulers: Dict[str, TranscriptionScheduler] = {}
+
+def get_transcription_scheduler(region: str = "us-east-1") -> TranscriptionScheduler:
+    """
+    Get the shared transcription scheduler of a region.
+    
+    Args:
+        region: AWS region
+    
+    Returns:
+        Transcription scheduler
+    """
+    with _lock:
+        if region not in _schedulers:
+            _schedulers[region] = TranscriptionScheduler(region=region)
+        return _schedulers[region]
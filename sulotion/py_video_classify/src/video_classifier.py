@@ -4,7 +4,9 @@ Video classification module.
 import os
 import json
 import csv
+import hashlib
 import logging
+import threading
 from typing import Dict, Any, List, Tuple, Optional
 import pandas as pd
 
@@ -12,13 +14,104 @@ from .common import (
     call_bedrock_llm,
     video_to_text,
     calibrate_classification,
-    parse_json_result
+    prefetch_label_embeddings,
+    parse_json_result,
+    read_prompt_file
 )
+from .taxonomy_index import TaxonomyIndex
+from .keyframes import get_keyframes
+from .result_store import ResultStore
+from .dedup import DedupIndex
+from .pipeline import Stage, StagedPipeline
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+OUTPUT_CSV_COLUMNS = [
+    'S3 URI',
+    'catetory',
+    'tags',
+    'result',
+    'new catetory',
+    'new tags',
+    'Input Tokens',
+    'Output Tokens',
+    'Cache Read Tokens',
+    'Cache Write Tokens',
+    'Latency (ms)',
+    'Duplicate Of'
+]
+
+# Columns after the first eight are optional: CSVs created before they existed
+# keep their header and only get the columns they already have
+OPTIONAL_CSV_COLUMNS = {
+    'Cache Read Tokens': 'cache_read_tokens',
+    'Cache Write Tokens': 'cache_write_tokens',
+    'Latency (ms)': 'latency_ms',
+    'Duplicate Of': 'duplicate_of'
+}
+
+# How the video is given to the model: the mp4 itself through its S3 location,
+# or scene-change keyframes extracted locally and sent as JPEG images
+INPUT_MODES = ['video', 'keyframes']
+
+CLASSIFICATION_TOOL_NAME = "record_classification"
+
+# Converse tool whose input schema mirrors the JSON the prompts ask for; forcing
+# the model to call it returns the classification as already-parsed JSON
+CLASSIFICATION_TOOL_CONFIG = {
+    "tools": [
+        {
+            "toolSpec": {
+                "name": CLASSIFICATION_TOOL_NAME,
+                "description": "Record the categories and tags of the video.",
+                "inputSchema": {
+                    "json": {
+                        "type": "object",
+                        "properties": {
+                            "catetorys": {
+                                "type": "array",
+                                "minItems": 1,
+                                "maxItems": 3,
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "catetory1": {"type": "string"},
+                                        "catetory2": {"type": "string"},
+                                        "catetory3": {"type": "array", "items": {"type": "string"}},
+                                        "weight": {
+                                            "type": "object",
+                                            "description": "Weight between 0 and 100 of each category",
+                                            "additionalProperties": {"type": "integer"}
+                                        }
+                                    },
+                                    "required": ["catetory1", "catetory2", "catetory3"]
+                                }
+                            },
+                            "tags": {
+                                "type": "array",
+                                "minItems": 1,
+                                "maxItems": 5,
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "tag": {"type": "string"},
+                                        "scores": {"type": "integer"}
+                                    },
+                                    "required": ["tag", "scores"]
+                                }
+                            }
+                        },
+                        "required": ["catetorys", "tags"]
+                    }
+                }
+            }
+        }
+    ],
+    "toolChoice": {"tool": {"name": CLASSIFICATION_TOOL_NAME}}
+}
+
 class VideoClassifier:
     """Video classifier class."""
     
@@ -28,7 +121,14 @@ class VideoClassifier:
         model_id: str = "amazon.nova-lite-v1:0",
         region: str = "us-east-1",
         output_csv: str = "data/classification_results.csv",
-        categories_path: str = "category.json"
+        categories_path: str = "category.json",
+        use_taxonomy_index: bool = True,
+        structured_output: bool = False,
+        prompt_cache: bool = False,
+        input_mode: str = "video",
+        max_keyframes: int = 8,
+        result_store: Optional[ResultStore] = None,
+        dedup_index: Optional[DedupIndex] = None
     ):
         """
         Initialize the video classifier.
@@ -39,11 +139,34 @@ class VideoClassifier:
             region: AWS region
             output_csv: Path to output CSV file
             categories_path: Path to the categories JSON file
+            use_taxonomy_index: Calibrate against precomputed taxonomy embeddings
+            structured_output: Force the model to answer through a tool with a JSON
+                schema instead of free text
+            prompt_cache: Send the instructions and taxonomy as a static prefix
+                behind a Bedrock prompt cache checkpoint
+            input_mode: 'video' to send the mp4, 'keyframes' to send scene-change
+                keyframes as images instead
+            max_keyframes: Maximum number of keyframes sent in keyframes mode
+            result_store: Store that receives the results instead of the output CSV
+            dedup_index: Index of classified videos; results of videos with the same
+                or near-identical content are reused instead of calling the model
         """
+        if input_mode not in INPUT_MODES:
+            raise ValueError(f"Unknown input mode {input_mode}, expected one of {INPUT_MODES}")
+        
         self.prompt_path = prompt_path
         self.model_id = model_id
         self.region = region
         self.output_csv = output_csv
+        self.structured_output = structured_output
+        self.prompt_cache = prompt_cache
+        self.input_mode = input_mode
+        self.max_keyframes = max_keyframes
+        self.result_store = result_store
+        self.dedup_index = dedup_index
+        self._dedup_namespace: Optional[str] = None
+        self._csv_lock = threading.Lock()
+        self._csv_header: Optional[List[str]] = None
         self.system_prompt = "You are a professional video expert. You are given a video, and you need to classify the video into categories and tags."
         
         # Load categories from JSON file
@@ -55,11 +178,13 @@ class VideoClassifier:
             logger.error(f"Error loading categories from {categories_path}: {e}")
             raise
         
+        # Label embeddings are built once per category file and reused across runs
+        self.taxonomy_index = TaxonomyIndex(categories_path, region=region) if use_taxonomy_index else None
+        
         # Load prompt and replace categories placeholder
         try:
-            with open(prompt_path, 'r', encoding='utf-8') as f:
-                prompt_template = f.read()
-                
+            prompt_template = read_prompt_file(prompt_path)
+            
             # Convert categories to string format for prompt
             categories_str = json.dumps(self.categories_json, indent=2)
             
@@ -71,116 +196,310 @@ class VideoClassifier:
             raise
             
         # Create output CSV if it doesn't exist
-        if not os.path.exists(self.output_csv):
+        if self.result_store is None and not os.path.exists(self.output_csv):
             try:
                 with open(self.output_csv, 'w', newline='', encoding='utf-8') as f:
                     writer = csv.writer(f, quoting=csv.QUOTE_ALL, escapechar='\\')
-                    writer.writerow([
-                        'S3 URI',
-                        'catetory',
-                        'tags',
-                        'result',
-                        'new catetory',
-                        'new tags',
-                        'Input Tokens',
-                        'Output Tokens'
-                    ])
+                    writer.writerow(OUTPUT_CSV_COLUMNS)
             except Exception as e:
                 logger.error(f"Error creating output CSV {self.output_csv}: {e}")
                 raise
     
-    def classify_video(self, s3_uri: str) -> Dict[str, Any]:
+    def classify_video(self, s3_uri: str, write_csv: bool = True) -> Dict[str, Any]:
         """
         Classify a video.
         
         Args:
             s3_uri: S3 URI of the video
+            write_csv: Whether to append the result to the output CSV
             
         Returns:
             Classification results
         """
+        fingerprint = None
         try:
             logger.info(f"Classifying video: {s3_uri}")
             
+            # Reuse the result of an already classified copy of the video
+            duplicate, fingerprint = self._find_duplicate(s3_uri)
+            if duplicate is not None:
+                if write_csv:
+                    self.write_result(duplicate)
+                return duplicate
+            
             # Call Bedrock LLM
             response_text, token_usage = call_bedrock_llm(
                 s3_uri=s3_uri,
-                prompt=self.prompt,
+                prompt="" if self.prompt_cache else self.prompt,
                 system=self.system_prompt,
                 model_id=self.model_id,
                 region=self.region,
                 max_tokens=512,
                 temperature=0.0,
                 top_p=0.9,
-                sleep_time=60.0
+                tool_config=CLASSIFICATION_TOOL_CONFIG if self.structured_output else None,
+                prompt_cache=self.prompt_cache,
+                cached_prefix=self.prompt if self.prompt_cache else None,
+                images=self._keyframes(s3_uri)
             )
             
             logger.info(f"Raw response: {response_text}")
             
             # Parse JSON result
-            classification_result = parse_json_result(
-                text=response_text,
-                model_id=self.model_id,
-                region=self.region
-            )
+            classification_result = self._parse_response(response_text)
             
             logger.info(f"Parsed classification result: {classification_result}")
             
-            # Calibrate classification results
-            calibrated_results = []
-            
-            for category in classification_result.get('catetorys', []):
-                category1 = category.get('catetory1', '')
-                category2 = category.get('catetory2', '')
-                category3 = category.get('catetory3', [])
-                
-                calibrated = calibrate_classification(
-                    category1=category1,
-                    category2=category2,
-                    category3=category3,
-                    categories_json=self.categories_json,
-                    region=self.region
-                )
-                
-                calibrated_results.append({
-                    'original': category,
-                    'calibrated': {
-                        'catetory1': calibrated['calibrated_category1'],
-                        'catetory2': calibrated['calibrated_category2'],
-                        'catetory3': calibrated['calibrated_category3'],
-                        'weight': category.get('weight', {})
-                    }
-                })
-            
             # Prepare final result
             final_result = {
                 's3_uri': s3_uri,
                 'original_classification': classification_result,
-                'calibrated_classification': {
-                    'catetorys': [item['calibrated'] for item in calibrated_results],
-                    'tags': classification_result.get('tags', [])
-                },
+                'calibrated_classification': self._calibrate(classification_result),
                 'token_usage': token_usage
             }
+            self._remember(s3_uri, fingerprint, final_result)
             
             # Write to CSV
-            self._write_to_csv(
-                s3_uri=s3_uri,
-                classification_result=final_result['calibrated_classification'],
-                token_usage=token_usage
-            )
+            if write_csv:
+                self.write_result(final_result)
             
             return final_result
             
         except Exception as e:
             logger.error(f"Error classifying video {s3_uri}: {e}")
+            self._release(fingerprint)
             raise
     
+    def _keyframes(self, s3_uri: str) -> Optional[List[bytes]]:
+        """
+        Get the keyframes to send instead of the video.
+        
+        Args:
+            s3_uri: S3 URI of the video
+            
+        Returns:
+            JPEG keyframes in keyframes mode, None in video mode
+        """
+        if self.input_mode != 'keyframes':
+            return None
+        return list(get_keyframes(s3_uri, region=self.region, max_frames=self.max_keyframes))
+    
+    def _dedup_settings(self) -> Dict[str, Any]:
+        """
+        Get the settings a reused result must have been classified with.
+        
+        Returns:
+            Settings that change the classification of a video
+        """
+        return {
+            'method': type(self).__name__,
+            'model_id': self.model_id,
+            'prompt': hashlib.sha256(self.prompt.encode('utf-8')).hexdigest(),
+            'structured_output': self.structured_output,
+            'input_mode': self.input_mode,
+            'max_keyframes': self.max_keyframes
+        }
+    
+    def _find_duplicate(self, s3_uri: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Look up a video in the dedup index.
+        
+        Args:
+            s3_uri: S3 URI of the video
+            
+        Returns:
+            Tuple of (result reused from a copy of the video or None, fingerprint
+            to pass to _remember or None without a dedup index)
+        """
+        if self.dedup_index is None:
+            return None, None
+        
+        if self._dedup_namespace is None:
+            self._dedup_namespace = hashlib.sha256(
+                json.dumps(self._dedup_settings(), sort_keys=True).encode('utf-8')
+            ).hexdigest()
+        
+        match, fingerprint = self.dedup_index.lookup(self._dedup_namespace, s3_uri)
+        if match is None:
+            return None, fingerprint
+        
+        source_uri, stored = match
+        logger.info(f"Reusing the classification of {source_uri} for {s3_uri}")
+        # Index the copy too, so later copies of it match on ETag alone
+        self.dedup_index.add(self._dedup_namespace, s3_uri, fingerprint, stored, source_uri=source_uri)
+        return {
+            's3_uri': s3_uri,
+            **stored,
+            'token_usage': {'input_tokens': 0, 'output_tokens': 0},
+            'duplicate_of': source_uri
+        }, fingerprint
+    
+    def _remember(self, s3_uri: str, fingerprint: Optional[Dict[str, Any]], result: Dict[str, Any]) -> None:
+        """
+        Add a classified video to the dedup index.
+        
+        Args:
+            s3_uri: S3 URI of the video
+            fingerprint: Fingerprint returned by _find_duplicate
+            result: Classification result
+        """
+        if self.dedup_index is None or fingerprint is None:
+            return
+        stored = {
+            key: value for key, value in result.items()
+            if key in ('video_understanding', 'original_classification', 'calibrated_classification')
+        }
+        self.dedup_index.add(self._dedup_namespace, s3_uri, fingerprint, stored)
+    
+    def _release(self, fingerprint: Optional[Dict[str, Any]]) -> None:
+        """
+        Let copies of a video waiting on its classification go ahead after it failed.
+        
+        Args:
+            fingerprint: Fingerprint returned by _find_duplicate
+        """
+        if self.dedup_index is not None and fingerprint is not None:
+            self.dedup_index.release(self._dedup_namespace, fingerprint)
+    
+    def _calibrate(self, classification_result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Calibrate the categories of a parsed classification against the taxonomy.
+        
+        Args:
+            classification_result: Parsed classification result
+            
+        Returns:
+            Calibrated classification with catetorys and tags
+        """
+        calibrated_results = []
+        
+        # Embed every unknown label of the video at once instead of one per lookup
+        prefetch_label_embeddings(
+            classification_result.get('catetorys', []), self.categories_json, self.taxonomy_index
+        )
+        
+        for category in classification_result.get('catetorys', []):
+            category1 = category.get('catetory1', '')
+            category2 = category.get('catetory2', '')
+            category3 = category.get('catetory3', [])
+            
+            calibrated = calibrate_classification(
+                category1=category1,
+                category2=category2,
+                category3=category3,
+                categories_json=self.categories_json,
+                region=self.region,
+                taxonomy_index=self.taxonomy_index
+            )
+            
+            calibrated_results.append({
+                'catetory1': calibrated['calibrated_category1'],
+                'catetory2': calibrated['calibrated_category2'],
+                'catetory3': calibrated['calibrated_category3'],
+                'weight': category.get('weight', {})
+            })
+        
+        return {
+            'catetorys': calibrated_results,
+            'tags': classification_result.get('tags', [])
+        }
+    
+    def _parse_response(self, response_text: str) -> Dict[str, Any]:
+        """
+        Parse the classification JSON from a model response.
+        
+        Args:
+            response_text: Response text returned by call_bedrock_llm
+            
+        Returns:
+            Parsed classification result
+        """
+        # Tool input from structured output parses strictly on the first try; a model
+        # that answered in text instead of calling the tool still goes through repair
+        return parse_json_result(
+            text=response_text,
+            model_id=self.model_id,
+            region=self.region
+        )
+    
+    def write_result(self, result: Dict[str, Any]) -> None:
+        """
+        Write a result returned by classify_video to the result store or output CSV.
+        
+        Args:
+            result: Classification result returned by classify_video
+        """
+        if self.result_store is not None:
+            self.result_store.append(self._build_row(
+                s3_uri=result['s3_uri'],
+                classification_result=result['calibrated_classification'],
+                token_usage=result['token_usage'],
+                duplicate_of=result.get('duplicate_of', '')
+            ))
+            return
+        
+        self._write_to_csv(
+            s3_uri=result['s3_uri'],
+            classification_result=result['calibrated_classification'],
+            token_usage=result['token_usage'],
+            duplicate_of=result.get('duplicate_of', '')
+        )
+    
+    def _build_row(
+        self,
+        s3_uri: str,
+        classification_result: Dict[str, Any],
+        token_usage: Dict[str, int],
+        duplicate_of: str = ''
+    ) -> Dict[str, Any]:
+        """
+        Build an output row keyed by the output CSV columns.
+        
+        Args:
+            s3_uri: S3 URI of the video
+            classification_result: Classification result
+            token_usage: Token usage
+            duplicate_of: URI of the video whose result was reused, if any
+            
+        Returns:
+            Mapping of column name to value
+        """
+        row = {
+            'S3 URI': s3_uri,
+            'catetory': '',
+            'tags': '',
+            'result': '',
+            'new catetory': json.dumps(classification_result.get('catetorys', [])),
+            'new tags': json.dumps(classification_result.get('tags', [])),
+            'Input Tokens': token_usage.get('input_tokens', 0),
+            'Output Tokens': token_usage.get('output_tokens', 0)
+        }
+        values = {**token_usage, 'duplicate_of': duplicate_of}
+        for column, key in OPTIONAL_CSV_COLUMNS.items():
+            row[column] = values.get(key, 0)
+        return row
+    
+    def _read_csv_header(self) -> List[str]:
+        """
+        Read the header of the output CSV once.
+        
+        Returns:
+            Column names of the output CSV
+        """
+        if self._csv_header is None:
+            try:
+                with open(self.output_csv, 'r', newline='', encoding='utf-8') as f:
+                    self._csv_header = [column.strip() for column in next(csv.reader(f), [])]
+            except FileNotFoundError:
+                self._csv_header = []
+        return self._csv_header
+    
     def _write_to_csv(
         self, 
         s3_uri: str, 
         classification_result: Dict[str, Any],
-        token_usage: Dict[str, int]
+        token_usage: Dict[str, int],
+        duplicate_of: str = ''
     ) -> None:
         """
         Write classification results to CSV.
@@ -189,6 +508,7 @@ class VideoClassifier:
             s3_uri: S3 URI of the video
             classification_result: Classification result
             token_usage: Token usage
+            duplicate_of: URI of the video whose result was reused, if any
         """
         try:
             # Convert classification result to string
@@ -204,19 +524,28 @@ class VideoClassifier:
             # Just proceed with writing the new classification results
             logger.info("Skipping reading original data from classification_data.csv due to parsing issues")
             
-            # Write to CSV with proper quoting to handle JSON data with commas
-            with open(self.output_csv, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f, quoting=csv.QUOTE_ALL, escapechar='\\')
-                writer.writerow([
-                    s3_uri,
-                    original_category,  # original catetory
-                    original_tags,      # original tags
-                    original_result,    # original result
-                    classification_str, # new catetory
-                    tags_str,           # new tags
-                    token_usage.get('input_tokens', 0),
-                    token_usage.get('output_tokens', 0)
-                ])
+            # Write to CSV with proper quoting to handle JSON data with commas.
+            # The lock keeps rows from interleaving when called from worker threads.
+            values = {**token_usage, 'duplicate_of': duplicate_of}
+            with self._csv_lock:
+                optional_values = [
+                    values.get(OPTIONAL_CSV_COLUMNS[column], 0)
+                    for column in self._read_csv_header()[8:]
+                    if column in OPTIONAL_CSV_COLUMNS
+                ]
+                with open(self.output_csv, 'a', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f, quoting=csv.QUOTE_ALL, escapechar='\\')
+                    writer.writerow([
+                        s3_uri,
+                        original_category,  # original catetory
+                        original_tags,      # original tags
+                        original_result,    # original result
+                        classification_str, # new catetory
+                        tags_str,           # new tags
+                        token_usage.get('input_tokens', 0),
+                        token_usage.get('output_tokens', 0),
+                        *optional_values
+                    ])
                 
             logger.info(f"Results written to {self.output_csv}")
             
@@ -234,7 +563,16 @@ class TwoStepVideoClassifier(VideoClassifier):
         model_id: str = "amazon.nova-lite-v1:0",
         region: str = "us-east-1",
         output_csv: str = "data/classification_results.csv",
-        categories_path: str = "category.json"
+        categories_path: str = "category.json",
+        use_taxonomy_index: bool = True,
+        structured_output: bool = False,
+        prompt_cache: bool = False,
+        second_model_id: Optional[str] = None,
+        text_only_second_step: bool = False,
+        input_mode: str = "video",
+        max_keyframes: int = 8,
+        result_store: Optional[ResultStore] = None,
+        dedup_index: Optional[DedupIndex] = None
     ):
         """
         Initialize the two-step video classifier.
@@ -246,6 +584,20 @@ class TwoStepVideoClassifier(VideoClassifier):
             region: AWS region
             output_csv: Path to output CSV file
             categories_path: Path to the categories JSON file
+            use_taxonomy_index: Calibrate against precomputed taxonomy embeddings
+            structured_output: Force the model to answer through a tool with a JSON
+                schema instead of free text
+            prompt_cache: Send the instructions and taxonomy as a static prefix
+                behind a Bedrock prompt cache checkpoint
+            second_model_id: Model ID of the second step (defaults to model_id)
+            text_only_second_step: Classify from the description alone, without
+                sending the video again in the second step
+            input_mode: 'video' to send the mp4, 'keyframes' to send scene-change
+                keyframes as images instead
+            max_keyframes: Maximum number of keyframes sent in keyframes mode
+            result_store: Store that receives the results instead of the output CSV
+            dedup_index: Index of classified videos; results of videos with the same
+                or near-identical content are reused instead of calling the model
         """
         # Initialize with second prompt for categories
         super().__init__(
@@ -253,128 +605,294 @@ class TwoStepVideoClassifier(VideoClassifier):
             model_id=model_id,
             region=region,
             output_csv=output_csv,
-            categories_path=categories_path
+            categories_path=categories_path,
+            use_taxonomy_index=use_taxonomy_index,
+            structured_output=structured_output,
+            prompt_cache=prompt_cache,
+            input_mode=input_mode,
+            max_keyframes=max_keyframes,
+            result_store=result_store,
+            dedup_index=dedup_index
         )
         
         self.first_prompt_path = first_prompt_path
+        self.second_model_id = second_model_id or model_id
+        self.text_only_second_step = text_only_second_step
         
         # Load first prompt
         try:
-            with open(first_prompt_path, 'r', encoding='utf-8') as f:
-                self.first_prompt = f.read()
+            self.first_prompt = read_prompt_file(first_prompt_path)
             logger.info(f"Loaded first prompt from {first_prompt_path}")
         except Exception as e:
             logger.error(f"Error loading first prompt from {first_prompt_path}: {e}")
             raise
     
-    def classify_video(self, s3_uri: str) -> Dict[str, Any]:
+    def _dedup_settings(self) -> Dict[str, Any]:
         """
-        Classify a video using two-step approach.
+        Get the settings a reused result must have been classified with.
+        
+        Returns:
+            Settings that change the classification of a video
+        """
+        return {
+            **super()._dedup_settings(),
+            'first_prompt': hashlib.sha256(self.first_prompt.encode('utf-8')).hexdigest(),
+            'second_model_id': self.second_model_id,
+            'text_only_second_step': self.text_only_second_step
+        }
+    
+    def describe_video(self, s3_uri: str, images: Optional[List[bytes]] = None) -> Tuple[str, Dict[str, int]]:
+        """
+        Step 1: describe the video content.
         
         Args:
             s3_uri: S3 URI of the video
+            images: Keyframes from _keyframes, extracted here if not given
             
         Returns:
-            Classification results
+            Tuple of (video description, token usage)
         """
-        try:
-            logger.info(f"Classifying video (two-step): {s3_uri}")
-            
-            # Step 1: Get video understanding
-            first_response_text, first_token_usage = call_bedrock_llm(
-                s3_uri=s3_uri,
-                prompt=self.first_prompt,
-                temperature=0.0,
-                top_p=0.5,
-                max_tokens=300,
-                system="You are a video content analyst. Describe the video content in sample text.",
-                model_id=self.model_id,
-                region=self.region,
-                sleep_time=60.0
-            )
-            
-            logger.info(f"First step response: {first_response_text}")
+        if images is None:
+            images = self._keyframes(s3_uri)
+        
+        first_response_text, first_token_usage = call_bedrock_llm(
+            s3_uri=s3_uri,
+            prompt=self.first_prompt,
+            temperature=0.0,
+            top_p=0.5,
+            max_tokens=300,
+            system="You are a video content analyst. Describe the video content in sample text.",
+            model_id=self.model_id,
+            region=self.region,
+            images=images
+        )
+        
+        logger.info(f"First step response: {first_response_text}")
+        return first_response_text, first_token_usage
+    
+    def classify_description(
+        self,
+        s3_uri: str,
+        description: str,
+        images: Optional[List[bytes]] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """
+        Step 2: classify the video from its description.
+        
+        Args:
+            s3_uri: S3 URI of the video
+            description: Video description from step 1
+            images: Keyframes sent to step 1, extracted here if not given
             
-            # Step 2: Classify based on understanding
+        Returns:
+            Tuple of (parsed classification result, token usage)
+        """
+        if images is None and not self.text_only_second_step:
+            images = self._keyframes(s3_uri)
+        
+        cached_prefix = None
+        if self.prompt_cache:
+            # The description is the only part that changes between videos, so it
+            # moves behind the cached instructions and taxonomy
+            cached_prefix = self.prompt.replace("${video_content}", "(provided at the end of this message)")
+            second_prompt = f'the video content\n"""\n{description}\n"""'
+        else:
             # Replace ${video_content} with the first step response
-            second_prompt = self.prompt.replace("${video_content}", first_response_text)
+            second_prompt = self.prompt.replace("${video_content}", description)
+        
+        second_response_text, second_token_usage = call_bedrock_llm(
+            s3_uri=None if self.text_only_second_step else s3_uri,
+            prompt=second_prompt,
+            temperature=0.0,
+            top_p=0.9,
+            max_tokens=512,
+            system=self.system_prompt,
+            model_id=self.second_model_id,
+            region=self.region,
+            tool_config=CLASSIFICATION_TOOL_CONFIG if self.structured_output else None,
+            prompt_cache=self.prompt_cache,
+            cached_prefix=cached_prefix,
+            images=None if self.text_only_second_step else images
+        )
+        
+        logger.info(f"Second step response: {second_response_text}")
+        
+        # Parse JSON result
+        classification_result = self._parse_response(second_response_text)
+        
+        logger.info(f"Parsed classification result: {classification_result}")
+        return classification_result, second_token_usage
+    
+    def _build_result(
+        self,
+        s3_uri: str,
+        description: str,
+        classification_result: Dict[str, Any],
+        first_token_usage: Dict[str, int],
+        second_token_usage: Dict[str, int]
+    ) -> Dict[str, Any]:
+        """
+        Calibrate a classification and assemble the final result.
+        
+        Args:
+            s3_uri: S3 URI of the video
+            description: Video description from step 1
+            classification_result: Parsed classification from step 2
+            first_token_usage: Token usage of step 1
+            second_token_usage: Token usage of step 2
             
-            second_response_text, second_token_usage = call_bedrock_llm(
-                s3_uri=s3_uri,
-                prompt=second_prompt,
-                temperature=0.0,
-                top_p=0.9,
-                max_tokens=512,
-                system=self.system_prompt,
-                model_id=self.model_id,
-                region=self.region,
-                sleep_time=40
+        Returns:
+            Classification results
+        """
+        # Combine token usage: token counts and model latency add up, and the result
+        # only counts as a cache hit when neither step called Bedrock
+        combined_token_usage = {
+            key: first_token_usage.get(key, 0) + second_token_usage.get(key, 0)
+            for key in dict.fromkeys(['input_tokens', 'output_tokens', *first_token_usage, *second_token_usage])
+            if key.endswith('_tokens') or key == 'latency_ms'
+        }
+        if 'cache_hit' in first_token_usage or 'cache_hit' in second_token_usage:
+            combined_token_usage['cache_hit'] = bool(
+                first_token_usage.get('cache_hit') and second_token_usage.get('cache_hit')
             )
+        
+        return {
+            's3_uri': s3_uri,
+            'video_understanding': description,
+            'original_classification': classification_result,
+            'calibrated_classification': self._calibrate(classification_result),
+            'token_usage': combined_token_usage
+        }
+    
+    def classify_video(self, s3_uri: str, write_csv: bool = True) -> Dict[str, Any]:
+        """
+        Classify a video using two-step approach.
+        
+        Args:
+            s3_uri: S3 URI of the video
+            write_csv: Whether to append the result to the output CSV
             
-            logger.info(f"Second step response: {second_response_text}")
-            
-            # Parse JSON result
-            classification_result = parse_json_result(
-                text=second_response_text,
-                model_id=self.model_id,
-                region=self.region
-            )
+        Returns:
+            Classification results
+        """
+        fingerprint = None
+        try:
+            logger.info(f"Classifying video (two-step): {s3_uri}")
             
-            logger.info(f"Parsed classification result: {classification_result}")
+            # Reuse the result of an already classified copy of the video
+            duplicate, fingerprint = self._find_duplicate(s3_uri)
+            if duplicate is not None:
+                if write_csv:
+                    self.write_result(duplicate)
+                return duplicate
             
-            # Calibrate classification results
-            calibrated_results = []
+            # Keyframes are extracted once and sent to both steps
+            images = self._keyframes(s3_uri)
             
-            for category in classification_result.get('catetorys', []):
-                category1 = category.get('catetory1', '')
-                category2 = category.get('catetory2', '')
-                category3 = category.get('catetory3', [])
-                
-                calibrated = calibrate_classification(
-                    category1=category1,
-                    category2=category2,
-                    category3=category3,
-                    categories_json=self.categories_json,
-                    region=self.region
-                )
-                
-                calibrated_results.append({
-                    'original': category,
-                    'calibrated': {
-                        'catetory1': calibrated['calibrated_category1'],
-                        'catetory2': calibrated['calibrated_category2'],
-                        'catetory3': calibrated['calibrated_category3'],
-                        'weight': category.get('weight', {})
-                    }
-                })
+            # Step 1: Get video understanding
+            description, first_token_usage = self.describe_video(s3_uri, images)
             
-            # Combine token usage
-            combined_token_usage = {
-                'input_tokens': first_token_usage.get('input_tokens', 0) + second_token_usage.get('input_tokens', 0),
-                'output_tokens': first_token_usage.get('output_tokens', 0) + second_token_usage.get('output_tokens', 0)
-            }
+            # Step 2: Classify based on understanding
+            classification_result, second_token_usage = self.classify_description(s3_uri, description, images)
             
             # Prepare final result
-            final_result = {
-                's3_uri': s3_uri,
-                'video_understanding': first_response_text,
-                'original_classification': classification_result,
-                'calibrated_classification': {
-                    'catetorys': [item['calibrated'] for item in calibrated_results],
-                    'tags': classification_result.get('tags', [])
-                },
-                'token_usage': combined_token_usage
-            }
+            final_result = self._build_result(
+                s3_uri, description, classification_result, first_token_usage, second_token_usage
+            )
+            self._remember(s3_uri, fingerprint, final_result)
             
             # Write to CSV
-            self._write_to_csv(
-                s3_uri=s3_uri,
-                classification_result=final_result['calibrated_classification'],
-                token_usage=combined_token_usage
-            )
+            if write_csv:
+                self.write_result(final_result)
             
             return final_result
             
         except Exception as e:
             logger.error(f"Error classifying video {s3_uri} with two-step approach: {e}")
+            self._release(fingerprint)
             raise
+    
+    def build_pipeline(
+        self,
+        describe_workers: int = 4,
+        classify_workers: int = 4,
+        calibrate_workers: int = 2,
+        queue_size: int = 8
+    ) -> StagedPipeline:
+        """
+        Build a pipeline running the steps of different videos concurrently.
+        
+        Step 1 of one video overlaps with step 2 and calibration of earlier ones,
+        and each step has its own worker count, so a text-only second step on a
+        faster model is not held back by the video step. The pipeline takes S3
+        URIs and produces the same results as classify_video without writing them.
+        
+        Args:
+            describe_workers: Concurrent step-1 (video description) calls
+            classify_workers: Concurrent step-2 (classification) calls
+            calibrate_workers: Concurrent calibrations
+            queue_size: Capacity of the queue in front of each step
+            
+        Returns:
+            Staged pipeline
+        """
+        def describe(s3_uri: str) -> Dict[str, Any]:
+            logger.info(f"Classifying video (two-step pipeline): {s3_uri}")
+            duplicate, fingerprint = self._find_duplicate(s3_uri)
+            if duplicate is not None:
+                # Duplicates pass through the remaining steps untouched
+                return {'s3_uri': s3_uri, 'duplicate': duplicate, 'first_token_usage': {}}
+            try:
+                # The keyframes travel with the state, so step 2 does not extract them again
+                images = self._keyframes(s3_uri)
+                description, token_usage = self.describe_video(s3_uri, images)
+            except Exception:
+                self._release(fingerprint)
+                raise
+            return {
+                's3_uri': s3_uri,
+                'description': description,
+                'images': images,
+                'first_token_usage': token_usage,
+                'fingerprint': fingerprint
+            }
+        
+        def classify(state: Dict[str, Any]) -> Dict[str, Any]:
+            if 'duplicate' in state:
+                return {**state, 'second_token_usage': {}}
+            try:
+                classification_result, token_usage = self.classify_description(
+                    state['s3_uri'], state['description'], state['images']
+                )
+            except Exception:
+                self._release(state['fingerprint'])
+                raise
+            return {
+                **state,
+                'images': None,
+                'classification_result': classification_result,
+                'second_token_usage': token_usage
+            }
+        
+        def calibrate(state: Dict[str, Any]) -> Dict[str, Any]:
+            if 'duplicate' in state:
+                return state['duplicate']
+            try:
+                result = self._build_result(
+                    state['s3_uri'],
+                    state['description'],
+                    state['classification_result'],
+                    state['first_token_usage'],
+                    state['second_token_usage']
+                )
+                self._remember(state['s3_uri'], state['fingerprint'], result)
+            except Exception:
+                self._release(state['fingerprint'])
+                raise
+            return result
+        
+        return StagedPipeline([
+            Stage('describe', describe, describe_workers, token_usage=lambda state: state['first_token_usage']),
+            Stage('classify', classify, classify_workers, token_usage=lambda state: state['second_token_usage']),
+            Stage('calibrate', calibrate, calibrate_workers)
+        ], queue_size=queue_size)
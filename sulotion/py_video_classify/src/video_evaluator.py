@@ -10,6 +10,17 @@ import boto3
 from typing import Dict, Any, List, Tuple, Optional
 
 from .common import call_bedrock_llm
+from .result_store import load_results
+from .scoring import (
+    score_frame,
+    summarize_scores,
+    resolve_column,
+    parse_json_cell,
+    PRED_CATEGORY_COLUMNS,
+    PRED_TAG_COLUMNS,
+    TRUE_CATEGORY_COLUMNS,
+    TRUE_TAG_COLUMNS
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -24,23 +35,30 @@ class VideoEvaluator:
         ground_truth_csv: str,
         model_id: str = "amazon.nova-lite-v1:0",
         region: str = "us-east-1",
-        output_csv: str = "evaluation_results.csv"
+        output_csv: str = "evaluation_results.csv",
+        llm_judge_threshold: Optional[float] = None,
+        category_weight: float = 0.5
     ):
         """
         Initialize the video evaluator.
         
         Args:
-            classification_csv: Path to classification results CSV
+            classification_csv: Path to classification results CSV or result store
             ground_truth_csv: Path to ground truth CSV
-            model_id: Model ID to use for evaluation
+            model_id: Model ID to use for the optional LLM judge
             region: AWS region
             output_csv: Path to output CSV file
+            llm_judge_threshold: Re-judge rows whose local accuracy score is below
+                this value with the model (no LLM calls if None)
+            category_weight: Weight of the category score in the overall score
         """
         self.classification_csv = classification_csv
         self.ground_truth_csv = ground_truth_csv
         self.model_id = model_id
         self.region = region
         self.output_csv = output_csv
+        self.llm_judge_threshold = llm_judge_threshold
+        self.category_weight = category_weight
         
         # Create output CSV if it doesn't exist
         if not os.path.exists(self.output_csv):
@@ -63,83 +81,198 @@ class VideoEvaluator:
         """
         Evaluate all videos in the classification results.
         
+        Every row is scored locally in one vectorized pass. If an LLM judge
+        threshold is set, rows scoring below it are judged again by the model
+        and its scores replace the local ones.
+        
         Returns:
             Evaluation results
         """
         try:
-            # Load classification results
-            classification_df = pd.read_csv(self.classification_csv)
+            # Load classification results and ground truth
+            classification_df = load_results(self.classification_csv)
+            ground_truth_df = load_results(self.ground_truth_csv)
+            
+            # Keep only the columns being compared so the merge needs no suffix handling
+            pred_df = classification_df[[
+                'S3 URI',
+                resolve_column(classification_df, PRED_CATEGORY_COLUMNS),
+                resolve_column(classification_df, PRED_TAG_COLUMNS)
+            ]]
+            pred_df.columns = ['S3 URI', 'categories_pred', 'tags_pred']
             
-            # Load ground truth
-            ground_truth_df = pd.read_csv(self.ground_truth_csv)
+            true_df = ground_truth_df[[
+                'S3 URI',
+                resolve_column(ground_truth_df, TRUE_CATEGORY_COLUMNS),
+                resolve_column(ground_truth_df, TRUE_TAG_COLUMNS)
+            ]]
+            true_df.columns = ['S3 URI', 'categories_true', 'tags_true']
             
             # Merge dataframes on S3 URI
             merged_df = pd.merge(
-                classification_df, 
-                ground_truth_df, 
-                on='S3 URI', 
-                suffixes=('_pred', '_true')
+                pred_df.drop_duplicates('S3 URI', keep='last'),
+                true_df.drop_duplicates('S3 URI', keep='last'),
+                on='S3 URI'
+            ).reset_index(drop=True)
+            
+            scores = score_frame(
+                merged_df,
+                pred_category_column='categories_pred',
+                pred_tag_column='tags_pred',
+                true_category_column='categories_true',
+                true_tag_column='tags_true',
+                category_weight=self.category_weight
             )
+            scores['input_tokens'] = 0
+            scores['output_tokens'] = 0
+            scores['judged_by_llm'] = False
             
-            # Evaluate each video
-            results = []
-            for _, row in merged_df.iterrows():
-                s3_uri = row['S3 URI']
-                
-                # Parse classification results
-                try:
-                    classification_result = json.loads(row['Classification Result'])
-                except:
-                    classification_result = []
-                    
-                try:
-                    tags_result = json.loads(row['Tags'])
-                except:
-                    tags_result = []
-                
-                # Parse ground truth
-                try:
-                    ground_truth_classification = json.loads(row['Classification Result_true'])
-                except:
-                    ground_truth_classification = []
-                    
-                try:
-                    ground_truth_tags = json.loads(row['Tags_true'])
-                except:
-                    ground_truth_tags = []
-                
-                # Evaluate
-                result = self.evaluate_video(
-                    s3_uri=s3_uri,
-                    classification_result=classification_result,
-                    tags_result=tags_result,
-                    ground_truth_classification=ground_truth_classification,
-                    ground_truth_tags=ground_truth_tags
-                )
-                
-                results.append(result)
-            
-            # Calculate overall accuracy
-            if results:
-                overall_accuracy = sum(r['accuracy_score'] for r in results) / len(results)
-                category_accuracy = sum(r['category_accuracy'] for r in results) / len(results)
-                tag_accuracy = sum(r['tag_accuracy'] for r in results) / len(results)
-            else:
-                overall_accuracy = 0.0
-                category_accuracy = 0.0
-                tag_accuracy = 0.0
+            if self.llm_judge_threshold is not None:
+                self._judge_low_scores(merged_df, scores)
+            
+            # Write all rows at once
+            output_df = pd.DataFrame({
+                'S3 URI': merged_df['S3 URI'],
+                'Accuracy Score': scores['accuracy_score'].round(4),
+                'Category Accuracy': scores['category_accuracy'].round(4),
+                'Tag Accuracy': scores['tag_accuracy'].round(4),
+                'Input Tokens': scores['input_tokens'],
+                'Output Tokens': scores['output_tokens']
+            })
+            output_df.to_csv(self.output_csv, mode='a', header=False, index=False)
+            
+            summary = summarize_scores(scores.drop(columns=['input_tokens', 'output_tokens', 'judged_by_llm']))
+            individual_results = scores.assign(s3_uri=merged_df['S3 URI']).to_dict(orient='records')
+            
+            logger.info(
+                f"Evaluated {len(merged_df)} videos locally"
+                f"{f', {int(scores.judged_by_llm.sum())} re-judged by {self.model_id}' if self.llm_judge_threshold is not None else ''}"
+            )
             
             return {
-                'overall_accuracy': overall_accuracy,
-                'category_accuracy': category_accuracy,
-                'tag_accuracy': tag_accuracy,
-                'individual_results': results
+                'overall_accuracy': summary.get('accuracy_score', 0.0),
+                'category_accuracy': summary.get('category_accuracy', 0.0),
+                'tag_accuracy': summary.get('tag_accuracy', 0.0),
+                'metrics': summary,
+                'individual_results': individual_results
             }
             
         except Exception as e:
             logger.error(f"Error evaluating videos: {e}")
             raise
     
+    def _judge_low_scores(self, merged_df: pd.DataFrame, scores: pd.DataFrame) -> None:
+        """
+        Re-score the rows below the LLM judge threshold with the model.
+        
+        Args:
+            merged_df: Merged predictions and ground truth
+            scores: Local scores, updated in place
+        """
+        low_rows = scores.index[scores['accuracy_score'] < self.llm_judge_threshold]
+        for index in low_rows:
+            row = merged_df.loc[index]
+            try:
+                evaluation_result = self.judge_video(
+                    classification_result=parse_json_cell(row['categories_pred']),
+                    tags_result=parse_json_cell(row['tags_pred']),
+                    ground_truth_classification=parse_json_cell(row['categories_true']),
+                    ground_truth_tags=parse_json_cell(row['tags_true'])
+                )
+            except Exception as e:
+                logger.warning(f"Keeping local score for {row['S3 URI']}: {e}")
+                continue
+            
+            token_usage = evaluation_result['token_usage']
+            scores.loc[index, 'accuracy_score'] = float(evaluation_result.get('accuracy_score', 0.0))
+            scores.loc[index, 'category_accuracy'] = float(evaluation_result.get('category_accuracy', 0.0))
+            scores.loc[index, 'tag_accuracy'] = float(evaluation_result.get('tag_accuracy', 0.0))
+            scores.loc[index, 'input_tokens'] = token_usage.get('input_tokens', 0)
+            scores.loc[index, 'output_tokens'] = token_usage.get('output_tokens', 0)
+            scores.loc[index, 'judged_by_llm'] = True
+    
+    def judge_video(
+        self,
+        classification_result: List[Dict[str, Any]],
+        tags_result: List[Dict[str, Any]],
+        ground_truth_classification: List[Dict[str, Any]],
+        ground_truth_tags: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Ask the model to score a single video's results.
+        
+        Args:
+            classification_result: Classification result
+            tags_result: Tags result
+            ground_truth_classification: Ground truth classification
+            ground_truth_tags: Ground truth tags
+            
+        Returns:
+            Evaluation result with token usage
+        """
+        # Prepare prompt for LLM evaluation
+        prompt = f"""
+        Please evaluate the accuracy of the video classification results compared to the ground truth.
+        
+        Predicted Classification:
+        ```json
+        {json.dumps(classification_result, indent=2)}
+        ```
+        
+        Predicted Tags:
+        ```json
+        {json.dumps(tags_result, indent=2)}
+        ```
+        
+        Ground Truth Classification:
+        ```json
+        {json.dumps(ground_truth_classification, indent=2)}
+        ```
+        
+        Ground Truth Tags:
+        ```json
+        {json.dumps(ground_truth_tags, indent=2)}
+        ```
+        
+        Provide an accuracy score between 0.0 and 1.0, where 1.0 means perfect match.
+        Also provide separate accuracy scores for categories and tags.
+        Return your evaluation in the following JSON format:
+        
+        ```json
+        {{
+            "accuracy_score": 0.85,
+            "category_accuracy": 0.9,
+            "tag_accuracy": 0.8,
+            "explanation": "Explanation of the evaluation..."
+        }}
+        ```
+        """
+        
+        # Call Bedrock LLM for evaluation
+        system = "You are a video classification evaluation expert. Provide accurate and objective evaluations."
+        response_text, token_usage = call_bedrock_llm(
+            s3_uri=None,  # No video needed for evaluation
+            prompt=prompt,
+            system=system,
+            model_id=self.model_id,
+            region=self.region
+        )
+        
+        # Extract JSON from response
+        json_start = response_text.find('{')
+        json_end = response_text.rfind('}') + 1
+        
+        if json_start >= 0 and json_end > json_start:
+            json_text = response_text[json_start:json_end]
+            evaluation_result = json.loads(json_text)
+        else:
+            raise ValueError("No JSON object found in response")
+        
+        # Add token usage
+        evaluation_result['token_usage'] = token_usage
+        
+        return evaluation_result
+    
     def evaluate_video(
         self,
         s3_uri: str,
@@ -149,7 +282,7 @@ class VideoEvaluator:
         ground_truth_tags: List[Dict[str, Any]]
     ) -> Dict[str, Any]:
         """
-        Evaluate a single video.
+        Evaluate a single video with the model and append the scores to the output CSV.
         
         Args:
             s3_uri: S3 URI of the video
@@ -162,66 +295,13 @@ class VideoEvaluator:
             Evaluation result
         """
         try:
-            # Prepare prompt for LLM evaluation
-            prompt = f"""
-            Please evaluate the accuracy of the video classification results compared to the ground truth.
-            
-            Predicted Classification:
-            ```json
-            {json.dumps(classification_result, indent=2)}
-            ```
-            
-            Predicted Tags:
-            ```json
-            {json.dumps(tags_result, indent=2)}
-            ```
-            
-            Ground Truth Classification:
-            ```json
-            {json.dumps(ground_truth_classification, indent=2)}
-            ```
-            
-            Ground Truth Tags:
-            ```json
-            {json.dumps(ground_truth_tags, indent=2)}
-            ```
-            
-            Provide an accuracy score between 0.0 and 1.0, where 1.0 means perfect match.
-            Also provide separate accuracy scores for categories and tags.
-            Return your evaluation in the following JSON format:
-            
-            ```json
-            {{
-                "accuracy_score": 0.85,
-                "category_accuracy": 0.9,
-                "tag_accuracy": 0.8,
-                "explanation": "Explanation of the evaluation..."
-            }}
-            ```
-            """
-            
-            # Call Bedrock LLM for evaluation
-            system = "You are a video classification evaluation expert. Provide accurate and objective evaluations."
-            response_text, token_usage = call_bedrock_llm(
-                s3_uri=None,  # No video needed for evaluation
-                prompt=prompt,
-                system=system,
-                model_id=self.model_id,
-                region=self.region
+            evaluation_result = self.judge_video(
+                classification_result=classification_result,
+                tags_result=tags_result,
+                ground_truth_classification=ground_truth_classification,
+                ground_truth_tags=ground_truth_tags
             )
-            
-            # Extract JSON from response
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_text = response_text[json_start:json_end]
-                evaluation_result = json.loads(json_text)
-            else:
-                raise ValueError("No JSON object found in response")
-            
-            # Add token usage
-            evaluation_result['token_usage'] = token_usage
+            token_usage = evaluation_result['token_usage']
             
             # Write to CSV
             with open(self.output_csv, 'a', newline='', encoding='utf-8') as f:
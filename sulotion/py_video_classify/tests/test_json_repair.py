@@ -0,0 +1,72 @@
+"""
+Tests for the json_repair module.
+"""
+import json
+import unittest
+
+from src.aws_clients import set_client_factory
+from src.common import parse_json_result
+from src.json_repair import convert_single_quotes, repair_json, get_json_repair_stats
+
+class ConvertSingleQuotesTest(unittest.TestCase):
+    def test_single_quoted_strings(self):
+        text = convert_single_quotes("{'catetorys': ['Sports'], 'tags': []}")
+        self.assertEqual(json.loads(text), {'catetorys': ['Sports'], 'tags': []})
+    
+    def test_escaped_single_quote_in_single_quoted_string(self):
+        text = convert_single_quotes("{'tags': ['children\\'s toys']}")
+        self.assertEqual(json.loads(text), {'tags': ["children's toys"]})
+    
+    def test_escaped_single_quote_in_double_quoted_string(self):
+        text = convert_single_quotes('{"tags": ["children\\\'s toys"]}')
+        self.assertEqual(json.loads(text), {'tags': ["children's toys"]})
+    
+    def test_other_escapes_are_kept(self):
+        text = convert_single_quotes("{'tags': ['a \"quoted\" tag', 'line\\nbreak', 'back\\\\slash']}")
+        self.assertEqual(json.loads(text), {'tags': ['a "quoted" tag', 'line\nbreak', 'back\\slash']})
+
+class RepairJsonTest(unittest.TestCase):
+    def test_escaped_single_quote(self):
+        result, applied = repair_json("```json\n{'tags': ['Rock \\'n\\' roll', 'Live'], 'final': True,}\n```")
+        self.assertEqual(result, {'tags': ["Rock 'n' roll", 'Live'], 'final': True})
+        self.assertIn('single_quotes', applied)
+
+class FakeBedrock:
+    def __init__(self, answer):
+        self.answer = answer
+    
+    def converse(self, **request):
+        return {'output': {'message': {'content': [{'text': self.answer}]}}, 'usage': {}}
+
+class ParseJsonResultTest(unittest.TestCase):
+    def tearDown(self):
+        set_client_factory(None)
+    
+    def parse_with_fallback(self, text, answer):
+        set_client_factory(lambda service, region: FakeBedrock(answer))
+        before = get_json_repair_stats()
+        try:
+            return parse_json_result(text)
+        finally:
+            after = get_json_repair_stats()
+            self.counts = {key: after.get(key, 0) - before.get(key, 0) for key in after}
+    
+    def test_failed_fallback_is_counted(self):
+        with self.assertRaises(ValueError):
+            self.parse_with_fallback('{"tags": "a" "b"}', 'sorry, no JSON here')
+        self.assertEqual(self.counts.get('llm_fallback'), 1)
+        self.assertEqual(self.counts.get('failed'), 1)
+    
+    def test_unparsable_fallback_is_counted(self):
+        with self.assertRaises(json.JSONDecodeError):
+            self.parse_with_fallback('{"tags": "a" "b"}', '{"tags": [1,, 2]}')
+        self.assertEqual(self.counts.get('failed'), 1)
+    
+    def test_repair_to_non_object_falls_back(self):
+        result = self.parse_with_fallback("{'a'} ['x', 'y',]", '{"tags": ["x", "y"]}')
+        self.assertEqual(result, {'tags': ['x', 'y']})
+        self.assertEqual(self.counts.get('llm_fallback'), 1)
+        self.assertEqual(self.counts.get('failed', 0), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,18 +10,25 @@ import logging
 import pandas as pd
 import tempfile
 import subprocess
-import boto3
 from urllib.parse import urlparse
 from pathlib import Path
 from typing import Dict, Any, List, Tuple, Optional
 
+from src.checkpoint import CheckpointJournal
+from src.s3_transfer import upload_file, configure_transfers, get_upload_stats, MB
+from src.pipeline import Stage, StagedPipeline
+from src.mp4 import probe_mp4_layout, read_mp4_duration
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def get_video_duration(input_path: str) -> Optional[float]:
     """
-    Get video duration using ffprobe.
+    Get video duration.
+    
+    MP4/MOV files are read in-process from their mvhd box; ffprobe is only
+    spawned for other containers.
     
     Args:
         input_path: Path to input video
@@ -29,6 +36,10 @@ def get_video_duration(input_path: str) -> Optional[float]:
     Returns:
         Duration in seconds or None if failed
     """
+    duration = read_mp4_duration(input_path)
+    if duration is not None:
+        return duration
+    
     try:
         cmd = [
             'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
@@ -81,8 +92,9 @@ def trim_video(input_path: str, output_path: str, max_duration: int = 30) -> boo
         
         # Trim video if needed
         if duration > max_duration:
+            # -nostdin keeps concurrent ffmpeg processes from reading the terminal
             cmd = [
-                'ffmpeg', '-i', input_path, 
+                'ffmpeg', '-v', 'error', '-nostdin', '-i', input_path, 
                 '-t', str(max_duration), 
                 '-c:v', 'copy', '-c:a', 'copy', 
                 output_path
@@ -100,7 +112,77 @@ def trim_video(input_path: str, output_path: str, max_duration: int = 30) -> boo
         logger.error(f"Error trimming video: {e}")
         return False
 
-def upload_to_s3(file_path: str, bucket_name: str, object_key: str, region: str = "us-east-1") -> str:
+def trim_remote_video(url: str, output_path: str, max_duration: int = 30) -> bool:
+    """
+    Trim a remote video without downloading the whole file.
+    
+    ffmpeg reads the moov box and the media data of the first seconds over HTTP
+    range requests and stops reading once max_duration is reached.
+    
+    Args:
+        url: Video URL
+        output_path: Path to save trimmed video
+        max_duration: Maximum duration in seconds
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    try:
+        cmd = [
+            'ffmpeg', '-v', 'error', '-nostdin', '-y', '-i', url, 
+            '-t', str(max_duration), 
+            '-c:v', 'copy', '-c:a', 'copy', 
+            output_path
+        ]
+        subprocess.run(cmd, check=True, capture_output=True)
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Error trimming video from {url}: {e.stderr.decode('utf-8', errors='replace').strip()}")
+        return False
+    except Exception as e:
+        logger.error(f"Error trimming video from {url}: {e}")
+        return False
+
+def partial_fetch_video(url: str, output_path: str, max_duration: int = 30) -> bool:
+    """
+    Fetch only the first seconds of a remote MP4 when its layout allows it.
+    
+    The top-level boxes are located with range requests first; servers without
+    range support and files whose moov box cannot be found are left to the
+    caller to download in full.
+    
+    Args:
+        url: Video URL
+        output_path: Path to save trimmed video
+        max_duration: Maximum duration in seconds
+        
+    Returns:
+        True if the trimmed video was written, False if a full download is needed
+    """
+    if urlparse(url).scheme not in ('http', 'https'):
+        return False
+    
+    layout = probe_mp4_layout(url)
+    if layout is None:
+        logger.info(f"Partial fetch not possible for {url}, downloading the whole file")
+        return False
+    
+    if not trim_remote_video(url, output_path, max_duration):
+        return False
+    
+    logger.info(
+        f"Fetched first {max_duration}s of {url} ({os.path.getsize(output_path)} of "
+        f"{layout['content_length']} bytes, {'faststart' if layout['faststart'] else 'moov at end'})"
+    )
+    return True
+
+def upload_to_s3(
+    file_path: str,
+    bucket_name: str,
+    object_key: str,
+    region: str = "us-east-1",
+    skip_if_identical: bool = True
+) -> str:
     """
     Upload file to S3.
     
@@ -109,15 +191,15 @@ def upload_to_s3(file_path: str, bucket_name: str, object_key: str, region: str
         bucket_name: S3 bucket name
         object_key: S3 object key
         region: AWS region
+        skip_if_identical: Skip the upload if the object already has the same content
         
     Returns:
         S3 URI if successful, empty string otherwise
     """
     try:
-        s3_client = boto3.client('s3', region_name=region)
-        s3_client.upload_file(file_path, bucket_name, object_key)
         s3_uri = f"s3://{bucket_name}/{object_key}"
-        logger.info(f"Uploaded file to {s3_uri}")
+        if upload_file(file_path, bucket_name, object_key, region, skip_if_identical=skip_if_identical):
+            logger.info(f"Uploaded file to {s3_uri}")
         return s3_uri
     except Exception as e:
         logger.error(f"Error uploading file to S3: {e}")
@@ -138,22 +220,131 @@ def extract_filename_from_url(url: str) -> str:
     filename = os.path.basename(path)
     return filename
 
+def _temp_video_path() -> str:
+    """Get the path of a new temporary mp4 file without keeping the file open."""
+    with tempfile.NamedTemporaryFile(suffix='.mp4', delete=True) as temp_video:
+        return temp_video.name
+
+def _remove(*paths: Optional[str]) -> None:
+    """Remove temporary files that exist."""
+    for path in paths:
+        if path and os.path.exists(path):
+            os.unlink(path)
+
+def download_stage(job: Dict[str, Any], max_duration: int = 30, partial_download: bool = False) -> Dict[str, Any]:
+    """
+    Pipeline stage: download the source video.
+    
+    Args:
+        job: Job with content_id and original_url
+        max_duration: Maximum duration in seconds
+        partial_download: Fetch only the first max_duration seconds when possible
+        
+    Returns:
+        Job with the local source_path, or with the trimmed_path if only the
+        first seconds were fetched
+    """
+    if partial_download:
+        trimmed_video_path = _temp_video_path()
+        if partial_fetch_video(job['original_url'], trimmed_video_path, max_duration):
+            return {**job, 'trimmed_path': trimmed_video_path}
+        _remove(trimmed_video_path)
+    
+    temp_video_path = _temp_video_path()
+    if not download_video(job['original_url'], temp_video_path):
+        _remove(temp_video_path)
+        raise RuntimeError(f"Failed to download video: {job['original_url']}")
+    return {**job, 'source_path': temp_video_path}
+
+def trim_stage(job: Dict[str, Any], max_duration: int = 30) -> Dict[str, Any]:
+    """
+    Pipeline stage: trim the downloaded video.
+    
+    Args:
+        job: Job with the local source_path
+        max_duration: Maximum duration in seconds
+        
+    Returns:
+        Job with the local trimmed_path; the source file is removed
+    """
+    if 'trimmed_path' in job:
+        # Already trimmed while fetching
+        return job
+    
+    trimmed_video_path = _temp_video_path()
+    try:
+        if not trim_video(job['source_path'], trimmed_video_path, max_duration):
+            _remove(trimmed_video_path)
+            raise RuntimeError(f"Failed to trim video: {job['source_path']}")
+    finally:
+        _remove(job['source_path'])
+    return {**job, 'trimmed_path': trimmed_video_path}
+
+def upload_stage(
+    job: Dict[str, Any],
+    s3_bucket: str,
+    region: str = "us-east-1",
+    skip_if_identical: bool = True
+) -> Dict[str, Any]:
+    """
+    Pipeline stage: upload the trimmed video to S3.
+    
+    Args:
+        job: Job with the local trimmed_path
+        s3_bucket: S3 bucket name
+        region: AWS region
+        skip_if_identical: Skip the upload if the object already has the same content
+        
+    Returns:
+        Job with the s3_uri; the trimmed file is removed
+    """
+    try:
+        # Extract filename from URL
+        s3_object_key = extract_filename_from_url(job['original_url'])
+        s3_uri = upload_to_s3(job['trimmed_path'], s3_bucket, s3_object_key, region, skip_if_identical)
+    finally:
+        _remove(job['trimmed_path'])
+    
+    if not s3_uri:
+        raise RuntimeError(f"Failed to upload video to S3: {job['trimmed_path']}")
+    return {'content_id': job['content_id'], 'original_url': job['original_url'], 's3_uri': s3_uri}
+
 def process_videos(
     input_csv: str = "data/video-input.csv",
     output_csv: str = "data/video-output.csv",
     max_duration: int = 30,
     s3_bucket: str = "video-classify",
-    region: str = "us-east-1"
+    region: str = "us-east-1",
+    download_workers: int = 4,
+    trim_workers: Optional[int] = None,
+    upload_workers: int = 4,
+    queue_size: int = 4,
+    partial_download: bool = False,
+    skip_identical_uploads: bool = True
 ):
     """
     Process videos: download, trim, and upload to S3.
     
+    Downloads, ffmpeg trimming and uploads run in separate worker pools connected
+    by bounded queues, so transfers of some videos overlap with the trimming of
+    others and a slow stage holds back the stages before it. Results are written
+    by a single writer in completion order.
+    
     Args:
         input_csv: Path to input CSV file
         output_csv: Path to output CSV file
         max_duration: Maximum duration in seconds
         s3_bucket: S3 bucket name
         region: AWS region
+        download_workers: Number of concurrent downloads
+        trim_workers: Number of concurrent ffmpeg processes (defaults to the CPU count)
+        upload_workers: Number of concurrent S3 uploads
+        queue_size: Capacity of the queue in front of each stage
+        partial_download: Fetch only the first max_duration seconds of MP4 sources
+            over HTTP range requests, downloading the whole file only when the
+            container layout does not allow it
+        skip_identical_uploads: Skip uploads whose object already exists with the
+            same content, compared by size and (multipart) ETag
     """
     try:
         # Load input data
@@ -173,78 +364,65 @@ def process_videos(
                     'S3 URI'
                 ])
         
-        # Process each video
-        results = []
+        # Load the processed videos once; the journal is seeded from the output CSV on first use
+        journal = CheckpointJournal(f"{output_csv}.journal", seed_csv=output_csv, key_column='content_id')
+        
+        # Collect the videos that still need processing
+        jobs = []
+        queued = set()
         for _, row in df.iterrows():
             content_id = row['content_id']
             video_url = row['media_info']
             
             # Skip if already processed
-            if os.path.exists(output_csv):
-                output_df = pd.read_csv(output_csv)
-                if str(content_id) in output_df['content_id'].astype(str).values:
-                    logger.info(f"Skipping already processed video: {content_id}")
-                    continue
+            if content_id in journal or content_id in queued:
+                logger.info(f"Skipping already processed video: {content_id}")
+                continue
+            queued.add(content_id)
+            jobs.append({'content_id': content_id, 'original_url': video_url})
+        
+        pipeline = StagedPipeline(
+            [
+                Stage('download', lambda job: download_stage(job, max_duration, partial_download), workers=download_workers),
+                Stage('trim', lambda job: trim_stage(job, max_duration), workers=trim_workers or os.cpu_count() or 1),
+                Stage('upload', lambda job: upload_stage(job, s3_bucket, region, skip_identical_uploads), workers=upload_workers)
+            ],
+            queue_size=queue_size
+        )
+        
+        # Process the videos; this thread is the only writer of the output CSV
+        results = []
+        for job, result, error in pipeline.run(jobs, ordered=False):
+            if error is not None:
+                logger.error(f"Error processing video {job['content_id']}: {error}")
+                continue
             
-            logger.info(f"Processing video: {content_id}, URL: {video_url}")
+            # Write to output CSV
+            with open(output_csv, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow([
+                    result['content_id'],
+                    result['original_url'],
+                    result['s3_uri']
+                ])
+            journal.record(result['content_id'])
             
-            # Create temporary files
-            with tempfile.NamedTemporaryFile(suffix='.mp4', delete=True) as temp_video:
-                temp_video_path = temp_video.name
-                
-            with tempfile.NamedTemporaryFile(suffix='.mp4', delete=True) as trimmed_video:
-                trimmed_video_path = trimmed_video.name
+            logger.info(f"Successfully processed video: {result['content_id']}")
             
-            try:
-                # Download video
-                if not download_video(video_url, temp_video_path):
-                    logger.error(f"Failed to download video: {video_url}")
-                    continue
-                
-                # Trim video
-                if not trim_video(temp_video_path, trimmed_video_path, max_duration):
-                    logger.error(f"Failed to trim video: {temp_video_path}")
-                    continue
-                
-                # Extract filename from URL
-                filename = extract_filename_from_url(video_url)
-                
-                # Upload to S3
-                s3_object_key = filename
-                s3_uri = upload_to_s3(trimmed_video_path, s3_bucket, s3_object_key, region)
-                
-                if not s3_uri:
-                    logger.error(f"Failed to upload video to S3: {trimmed_video_path}")
-                    continue
-                
-                # Write to output CSV
-                with open(output_csv, 'a', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([
-                        content_id,
-                        video_url,
-                        s3_uri
-                    ])
-                
-                logger.info(f"Successfully processed video: {content_id}")
-                
-                # Add to results
-                results.append({
-                    'content_id': content_id,
-                    'original_url': video_url,
-                    's3_uri': s3_uri
-                })
-                
-            except Exception as e:
-                logger.error(f"Error processing video {content_id}: {e}")
-                continue
-            finally:
-                # Clean up temporary files
-                if os.path.exists(temp_video_path):
-                    os.unlink(temp_video_path)
-                if os.path.exists(trimmed_video_path):
-                    os.unlink(trimmed_video_path)
+            # Add to results
+            results.append(result)
         
+        for name, stats in pipeline.stats().items():
+            logger.info(
+                f"Stage {name}: {stats['requests']} done, {stats['failures']} failed, "
+                f"{stats['workers']} workers, max queue depth {stats['max_queue_depth']}, "
+                f"p50 {stats['p50_latency_s']:.2f}s, p95 {stats['p95_latency_s']:.2f}s"
+            )
+        upload_stats = get_upload_stats()
+        logger.info(
+            f"Uploaded {upload_stats['uploaded']} files ({upload_stats['uploaded_bytes']} bytes), "
+            f"skipped {upload_stats['skipped']} identical files ({upload_stats['skipped_bytes']} bytes)"
+        )
         logger.info(f"Processed {len(results)} videos")
         logger.info(f"Results written to {output_csv}")
         
@@ -264,15 +442,31 @@ def main():
     parser.add_argument('--max-duration', type=int, default=30, help='Maximum duration in seconds')
     parser.add_argument('--s3-bucket', default='video-classify', help='S3 bucket name')
     parser.add_argument('--region', default='us-east-1', help='AWS region')
+    parser.add_argument('--download-workers', type=int, default=4, help='Number of concurrent downloads')
+    parser.add_argument('--trim-workers', type=int, help='Number of concurrent ffmpeg trims (defaults to the CPU count)')
+    parser.add_argument('--upload-workers', type=int, default=4, help='Number of concurrent S3 uploads')
+    parser.add_argument('--queue-size', type=int, default=4, help='Capacity of the queue between pipeline stages')
+    parser.add_argument('--partial-download', action='store_true', help='Fetch only the first --max-duration seconds over HTTP range requests instead of the whole file')
+    parser.add_argument('--part-size-mb', type=int, default=8, help='Multipart upload threshold and part size in MB')
+    parser.add_argument('--upload-concurrency', type=int, default=10, help='Parts uploaded at once per file')
+    parser.add_argument('--force-upload', action='store_true', help='Upload even if the S3 object already has the same content')
     
     args = parser.parse_args()
     
+    configure_transfers(part_size=args.part_size_mb * MB, max_concurrency=args.upload_concurrency)
+    
     process_videos(
         input_csv=args.input,
         output_csv=args.output,
         max_duration=args.max_duration,
         s3_bucket=args.s3_bucket,
-        region=args.region
+        region=args.region,
+        download_workers=args.download_workers,
+        trim_workers=args.trim_workers,
+        upload_workers=args.upload_workers,
+        queue_size=args.queue_size,
+        partial_download=args.partial_download,
+        skip_identical_uploads=not args.force_upload
     )
 
 if __name__ == '__main__':